@@ -0,0 +1,212 @@
+"""Batch the configuration changes made to one CapRover app after it is deployed.
+
+Every CapRover write (`update_app`, `enable_ssl`, `add_domain`) makes CapRover
+rewrite its nginx config, and `update_app` often restarts the Docker service.
+AppMutation collects everything an install wants to change on one app, then
+applies it with as few writes as possible:
+
+1. one `update_app` carrying every plain setting, including the
+   serviceUpdateOverride after all transforms have run;
+2. custom domains, then SSL certificates (which need the domains to exist);
+3. one final `update_app` for settings that need SSL or a domain in place
+   (`force_ssl`, `redirectDomain`). If step 2 is empty this is folded into step 1.
+
+Given a collecting CertificateQueue, the SSL certificates and `force_ssl` are
+left to it instead, to be issued once every app is up (see certificates.py).
+
+`render()` works out the app definition those writes would leave behind,
+without making them (see plan.py).
+"""
+
+import copy
+import logging
+
+from .service_override import apply_overrides
+
+logger = logging.getLogger(__name__)
+
+# `update_app` keywords -> app definition keys, where the value is stored as-is.
+_UPDATE_APP_KEYS = {
+    "instance_count": "instanceCount",
+    "pre_deploy_function": "preDeployFunction",
+    "captain_definition_path": "captainDefinitionRelativeFilePath",
+    "force_ssl": "forceSsl",
+    "support_websocket": "websocketSupport",
+    "container_http_port": "containerHttpPort",
+    "description": "description",
+    "app_push_webhook": "appPushWebhook",
+    "service_update_override": "serviceUpdateOverride",
+    "http_auth": "httpAuth",
+}
+
+
+def apply_update(definition: dict, **settings) -> dict:
+    """`definition` as CaproverAPI.update_app(**settings) would leave it (a copy).
+
+    Environment variables are merged into the current ones; persistent
+    directories and port mappings replace the current ones; None leaves a
+    setting as-is; unknown keywords are definition keys, set verbatim.
+    """
+    app = copy.deepcopy(definition)
+    if not app.get("appPushWebhook"):
+        app["appPushWebhook"] = {}
+    if isinstance(settings.get("repo_info"), dict):
+        app["appPushWebhook"]["repoInfo"] = settings.pop("repo_info")
+    settings.pop("repo_info", None)
+
+    env = {item["key"]: item["value"] for item in app.get("envVars") or []}
+    env.update(settings.pop("environment_variables", None) or {})
+    app["envVars"] = [{"key": k, "value": v} for k, v in env.items()]
+
+    directories = settings.pop("persistent_directories", None)
+    if directories is not None:
+        app["volumes"] = []
+        for pair in directories:
+            source, container_path = pair.split(":")
+            kind = "hostPath" if source.startswith("/") else "volumeName"
+            app["volumes"].append({kind: source, "containerPath": container_path})
+    ports = settings.pop("port_mapping", None)
+    if ports:
+        app["ports"] = [
+            dict(zip(("hostPort", "containerPort"), pair.split(":"))) for pair in ports
+        ]
+    expose = settings.pop("expose_as_web_app", None)
+    if expose is not None:
+        app["notExposeAsWebApp"] = not expose
+
+    for keyword, value in settings.items():
+        if value is not None:
+            app[_UPDATE_APP_KEYS.get(keyword, keyword)] = value
+    return app
+
+
+class AppMutation:
+    """Desired changes to a single CapRover app, applied by `apply()`.
+
+    Builder methods return self, so calls can be chained::
+
+        AppMutation("files").update(support_websocket=True).override(
+            apply_memory_limit
+        ).enable_ssl().apply(cap)
+    """
+
+    def __init__(self, app_name: str):
+        self.app_name = app_name
+        self._settings: dict = {}
+        self._environment: dict = {}
+        self._transforms: list = []
+        self._domains: list[str] = []
+        self._ssl_domains: list[str | None] = []  # None means the app's base domain
+        self._final_settings: dict = {}
+
+    def update(self, **settings) -> "AppMutation":
+        """Settings passed through to `update_app`, e.g. `support_websocket=True`.
+
+        `environment_variables` from several calls are merged. `force_ssl` is
+        held back until SSL has been enabled.
+        """
+        if "environment_variables" in settings:
+            self._environment.update(settings.pop("environment_variables"))
+        if "force_ssl" in settings:
+            self._final_settings["force_ssl"] = settings.pop("force_ssl")
+        self._settings.update(settings)
+        return self
+
+    def override(self, *transforms) -> "AppMutation":
+        """serviceUpdateOverride transforms, applied in order to a document parsed once.
+
+        See service_override.py; plain YAML str -> YAML str callables also work.
+        """
+        self._transforms.extend(transforms)
+        return self
+
+    def add_domain(self, domain: str, ssl: bool = False) -> "AppMutation":
+        self._domains.append(domain)
+        if ssl:
+            self._ssl_domains.append(domain)
+        return self
+
+    def enable_ssl(self, domain: str | None = None) -> "AppMutation":
+        """Enable SSL on the app's base domain (`<app>.<root domain>`), or on a custom `domain`."""
+        if domain is None:
+            self._ssl_domains.insert(0, None)
+        else:
+            self._ssl_domains.append(domain)
+        return self
+
+    def redirect_domain(self, domain: str) -> "AppMutation":
+        """Redirect all the app's domains to `domain` (which must be added too, or be the base)."""
+        self._final_settings["redirectDomain"] = domain
+        return self
+
+    def _first_update(self, cap) -> dict:
+        settings = dict(self._settings)
+        if self._environment:
+            settings["environment_variables"] = dict(self._environment)
+        if self._transforms:
+            settings["serviceUpdateOverride"] = apply_overrides(
+                cap.get_app(self.app_name)["serviceUpdateOverride"], *self._transforms
+            )
+        return settings
+
+    def render(self, definition: dict) -> dict:
+        """The app definition after `apply()`, given the current one (a copy)."""
+        settings = dict(self._settings)
+        if self._environment:
+            settings["environment_variables"] = dict(self._environment)
+        if self._transforms:
+            settings["serviceUpdateOverride"] = apply_overrides(
+                definition.get("serviceUpdateOverride"), *self._transforms
+            )
+        settings.update(
+            {k: v for k, v in self._final_settings.items() if k != "redirectDomain"}
+        )
+        app = apply_update(definition, **settings)
+
+        domains = app.setdefault("customDomain", [])
+        for domain in self._domains:
+            if not any(d["publicDomain"] == domain for d in domains):
+                domains.append({"publicDomain": domain, "hasSsl": False})
+        for domain in self._ssl_domains:
+            if domain is None:
+                app["hasDefaultSubDomainSsl"] = True
+            for d in domains:
+                if d["publicDomain"] == domain:
+                    d["hasSsl"] = True
+        if "redirectDomain" in self._final_settings:
+            app["redirectDomain"] = self._final_settings["redirectDomain"]
+        return app
+
+    def apply(self, cap, certificates=None) -> None:
+        """Apply every collected change to `cap`, SSL and domain operations last.
+
+        If `certificates` (a CertificateQueue) is collecting, SSL and
+        `force_ssl` are queued there instead of applied.
+        """
+        settings = self._first_update(cap)
+        final = dict(self._final_settings)
+        ssl_domains = self._ssl_domains
+        held = {k: v for k, v in final.items() if k == "force_ssl"}
+        if (
+            ssl_domains
+            and certificates is not None
+            and certificates.defer(self.app_name, ssl_domains, held)
+        ):
+            ssl_domains = []
+            final = {k: v for k, v in final.items() if k not in held}
+        needs_domain_or_ssl = bool(self._domains or ssl_domains)
+        if not needs_domain_or_ssl:
+            settings.update(final)
+            final = {}
+
+        if settings:
+            cap.update_app(self.app_name, **settings)
+        for domain in self._domains:
+            cap.add_domain(self.app_name, domain)
+        for domain in ssl_domains:
+            if domain is None:
+                cap.enable_ssl(self.app_name)
+            else:
+                cap.enable_ssl(self.app_name, domain)
+        if final:
+            cap.update_app(self.app_name, **final)
@@ -1,17 +1,19 @@
-import io
+import copy
+import functools
 import logging
+import re
 import secrets
-import subprocess
-import time
-import urllib.request
-from dataclasses import replace
-from functools import reduce
+from dataclasses import dataclass, replace
 
-import bcrypt
 import psycopg
-from ruamel.yaml import YAML
 
+from .app_mutation import AppMutation
 from .base import AppSpec
+from .connections import ConnectionBudget, connection_budget
+from .postgres_tuning import PostgresTuner, tuned_settings
+from .readiness import docker_service_running, http_responds, wait_until
+from .resources import parse_bytes
+from .service_override import OverrideDocument, override_transform
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +22,8 @@ def set_yaml_value(yaml_str: str | None, key: str | list[str], value: object) ->
     """
     Set a value at a (nested) key in a YAML string and return the updated YAML.
 
+    For more than one edit, use OverrideDocument: it parses the YAML only once.
+
     Parameters
     ----------
     yaml_str
@@ -33,25 +37,13 @@ def set_yaml_value(yaml_str: str | None, key: str | list[str], value: object) ->
     -------
     Re-serialized YAML string.
     """
-    raw = yaml_str or ""
-    ryaml = YAML()
-    ryaml.preserve_quotes = True
-
-    data = ryaml.load(raw) or {}
-
-    keys = key.split(".") if isinstance(key, str) else list(key)
-    # Walk to the parent, creating intermediate dicts as needed
-    parent = reduce(lambda d, k: d.setdefault(k, {}), keys[:-1], data)
-    parent[keys[-1]] = value
+    return OverrideDocument.parse(yaml_str).set(key, value).dump()
 
-    buf = io.StringIO()
-    ryaml.dump(data, buf)
-    return buf.getvalue()
 
-
-def disable_healthcheck(suo: str | None) -> str:
+@override_transform
+def disable_healthcheck(suo: OverrideDocument) -> None:
     """
-    Return a serviceUpdateOverride YAML with the Docker healthcheck disabled.
+    Disable the Docker healthcheck in a serviceUpdateOverride.
 
     HealthCheck gets nested under TaskTemplate.ContainerSpec; I can't find
     documentation for that, you will have to trust me (from trial-and-error).
@@ -61,13 +53,19 @@ def disable_healthcheck(suo: str | None) -> str:
         HealthCheck:
           Test: ["NONE"]
     """
-    return set_yaml_value(suo, "TaskTemplate.ContainerSpec.HealthCheck.Test", ["NONE"])
+    suo.set("TaskTemplate.ContainerSpec.HealthCheck.Test", ["NONE"])
 
 
-def apply_memory_limit(suo: str | None, memory_bytes=1610612736) -> str:
-    return set_yaml_value(
-        suo, "TaskTemplate.Resources.Limits.MemoryBytes", memory_bytes
-    )
+@override_transform
+def force_restart(suo: OverrideDocument) -> None:
+    """Make Docker restart the service, even though nothing else changed."""
+    suo.set("TaskTemplate.ForceUpdate", int(suo.get("TaskTemplate.ForceUpdate", 0)) + 1)
+
+
+@override_transform
+def apply_memory_limit(suo: OverrideDocument, memory_bytes=1610612736) -> None:
+    """The memory limit of a service without planned resources (see resources.py)."""
+    suo.set("TaskTemplate.Resources.Limits.MemoryBytes", memory_bytes)
 
 
 def patch_service_update_override(cap, appname: str, *transforms) -> None:
@@ -81,13 +79,10 @@ def patch_service_update_override(cap, appname: str, *transforms) -> None:
     appname
         Name of the CapRover app to patch.
     *transforms
-        Callables that accept and return a YAML string, applied left to
-        right. Examples: `disable_healthcheck`, `apply_memory_limit`.
+        Transforms applied left to right (see service_override.py).
+        Examples: `disable_healthcheck`, `apply_memory_limit`.
     """
-    suo = cap.get_app(appname)["serviceUpdateOverride"]
-    for t in transforms:
-        suo = t(suo)
-    cap.update_app(appname, serviceUpdateOverride=suo)
+    AppMutation(appname).override(*transforms).apply(cap)
 
 
 def construct_app_variables(app_cfg, init=None):
@@ -99,128 +94,374 @@ def construct_app_variables(app_cfg, init=None):
     return variables
 
 
-def _windmill_default_docker_image(gc_repository: str) -> str:
-    """Fetch the default Windmill docker image tag from the one-click app definition."""
-    # Mimic download one-click-app from remote repository from CaproverAPI's _download_one_click_app_defn
-    url = gc_repository + "windmill-only"
-    with urllib.request.urlopen(url) as resp:
-        raw = resp.read().decode()
-    doc = YAML().load(raw)
-    # Mimic CaproverAPI's _resolve_app_variables to find variable defaults
-    for var in doc.get("caproverOneClickApp", {}).get("variables", []):
-        if var.get("id") == "$$cap_app_docker_image":
-            default = var.get("defaultValue")
-            if default is not None:
-                return str(default)
-    raise ValueError(
-        "$$cap_app_docker_image defaultValue not found in windmill-only one-click app"
-    )
-
-
-def _pre_pull_windmill_image(variables: dict, gc_repository: str) -> None:
-    # The Windmill image is large enough to cause CapRover's deploy call to time out
-    # before Docker finishes pulling it. Pre-pulling here ensures it is cached.
-    image = variables.get("$$cap_app_docker_image") or _windmill_default_docker_image(
-        gc_repository
-    )
-    logger.info(f"Pre-pulling Windmill image {image!r} to avoid CapRover timeout ...")
-    subprocess.run(["docker", "pull", image], check=True)
-    logger.info("Windmill image pre-pull complete.")
-
-
 class PostgresApp(AppSpec):
     one_click_app_name = "postgres"
+    uses_gc_repository = False
+    resource_profile = {"": 3.0}
 
-    def _install(self) -> None:
-        cap = self.ctx.caprover
-        pg_app_name = self.app_name
-
-        postgres_variables = {
+    def app_variables(self) -> dict:
+        return {
             "$$cap_pg_user": self.app_cfg["user"],
             "$$cap_pg_pass": self.app_cfg["pass"],
             "$$cap_pg_database": self.app_cfg.get("database", "postgres"),
             "$$cap_postgres_version": self.app_cfg.get("version", "16"),
         }
+
+    def mutations(self) -> list[AppMutation]:
+        mutation = AppMutation(self.app_name).update(
+            port_mapping=[
+                f"{self.ctx.postgres_from_vm.port}:{self.ctx.postgres_from_container.port}"
+            ],
+        )
+        # Postgres never had a fixed memory limit; it only gets a planned one.
+        limits = self.resource_limits(self.app_name)
+        if limits:
+            mutation.override(limits)
+        return [mutation]
+
+    def _install(self) -> None:
+        postgres_variables = self.app_variables()
         self.logger.info("Deploying PostgreSQL")
         if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                one_click_app_name=self.one_click_app_name,
-                app_name=pg_app_name,
-                app_variables=postgres_variables,
-                automated=True,
-            )
-            cap.update_app(
-                pg_app_name,
-                port_mapping=[
-                    f"{self.ctx.postgres_from_vm.port}:{self.ctx.postgres_from_container.port}"
-                ],
+            self.deploy_one_click(postgres_variables)
+            self.apply_mutations()
+        self.tune()
+
+    def update(self) -> None:
+        super().update()
+        self.tune()
+
+    def tuning(self) -> dict[str, str] | None:
+        """Server settings for this app's planned resources; None if none are planned."""
+        resources = self.ctx.resources
+        allocation = resources and resources.allocation(self.app_name)
+        if not allocation:
+            return None
+        return tuned_settings(
+            allocation.memory_limit, allocation.cpu_limit, resources.postgres_connections
+        )
+
+    def tune(self) -> None:
+        settings = self.tuning()
+        if settings is None:
+            self.logger.info("No resources planned: Postgres keeps its settings")
+            return
+        if self.ctx.dry_run:
+            for name, value in settings.items():
+                self.logger.info(f"Would set Postgres {name} = {value}")
+            return
+        PostgresTuner(
+            self.ctx.postgres_pool,
+            self.ctx.postgres_from_vm,
+            lambda: AppMutation(self.app_name).override(force_restart).apply(
+                self.ctx.caprover
+            ),
+            timeout=self.ctx.readiness_timeout,
+            cancel=self.ctx.cancel,
+        ).apply(settings)
+
+
+class PgBouncerApp(AppSpec):
+    """Pools the Postgres connections of the apps that may share them.
+
+    When the stack has one, the services of every app with
+    `pools_through_pgbouncer` connect to it instead of the server, and wait
+    for it to install. It logs in to Postgres as the admin user, and so do
+    they.
+    """
+
+    one_click_app_name = "pgbouncer"
+    depends_on = (PostgresApp.one_click_app_name,)
+    image_variable = "$$cap_pgbouncer_docker_image"
+    resource_profile = {"": 0.25}
+
+    @property
+    def max_client_connections(self) -> int:
+        return int(self.app_cfg.get("max_client_connections", 500))
+
+    def postgres_connections(self) -> int:
+        return int(self.app_cfg.get("server_connections", 20))
+
+    def app_variables(self) -> dict:
+        server = self.ctx.postgres_from_container
+        variables = {
+            "$$cap_postgres_host": server.host,
+            "$$cap_postgres_port": server.port,
+            "$$cap_postgres_user": server.user,
+            "$$cap_postgres_pass": server.password,
+            "$$cap_postgres_sslmode": "require" if server.ssl else "disable",
+        }
+        return construct_app_variables(self.app_cfg, variables)
+
+    def mutations(self) -> list[AppMutation]:
+        return [
+            AppMutation(self.app_name).override(
+                self.resource_limits(self.app_name, apply_memory_limit)
             )
+        ]
+
+    def _install(self) -> None:
+        variables = self.app_variables()
+        self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
+        if not self.ctx.dry_run:
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+            self.apply_mutations()
+
+
+@dataclass(frozen=True)
+class WindmillWorkerGroup:
+    """A Windmill worker group, run by a CapRover app of its own."""
+
+    name: str  # WORKER_GROUP
+    suffix: str  # of its CapRover app, after the Windmill app name
+    replicas: int = 1  # CapRover instance count
+    database_connections: int = 5  # DATABASE_CONNECTIONS, of each replica
+    memory: int | None = None  # limit of each replica, in bytes; None: as planned
+    weight: float = 2.0  # of the resources Windmill's workers share
+
+
+def _count(value, what: str) -> int:
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = -1
+    if count < 0 or str(count) != str(value).strip():
+        raise ValueError(f"{what} must be a whole number, not {value!r}")
+    return count
 
 
 class WindmillApp(AppSpec):
+    """Windmill's server, and a CapRover app per worker group.
+
+    The one-click app runs the `default` and `native` groups, one replica
+    each. The config's `workers:` may scale them, and add groups, each a
+    copy of the `default` worker with its own WORKER_GROUP::
+
+        workers:
+          default: {replicas: 2}
+          native: {database_connections: 3}
+          reports: {replicas: 1, memory: 2GiB}
+
+    An update adds and removes the groups' apps, and scales them, without
+    touching the server.
+    """
+
     one_click_app_name = "windmill-only"
     depends_on = (PostgresApp.one_click_app_name,)
     databases = ("warehouse", "windmill")
+    service_suffixes = ("", "-worker", "-worker-native")
+    image_variable = "$$cap_app_docker_image"
+    # Not behind PgBouncer: Windmill's migrations hold session-level advisory
+    # locks, which transaction pooling would hand to other clients.
+    pools_through_pgbouncer = False
+
+    AZURE_CONFIG_KEYS = ("azure_db_user", "azure_db_pass")
+    # The one-click app's worker groups: name -> (suffix, weight).
+    BUILTIN_WORKER_GROUPS = {"default": ("-worker", 2.0), "native": ("-worker-native", 1.0)}
+    WORKERS_WEIGHT = 3.0  # the server weighs 1
+
+    @property
+    def worker_groups(self) -> list[WindmillWorkerGroup]:
+        """The built-in worker groups, then those the config adds.
+
+        Raises
+        ------
+        ValueError
+            If a group's name or settings are not valid.
+        """
+        configured = self.app_cfg.get("workers") or {}
+        connections = _count(
+            self.app_cfg.get("worker_database_connections", 5), "worker_database_connections"
+        )
+        groups = []
+        for name in dict.fromkeys([*self.BUILTIN_WORKER_GROUPS, *configured]):
+            if name in self.BUILTIN_WORKER_GROUPS:
+                suffix, weight = self.BUILTIN_WORKER_GROUPS[name]
+            elif re.fullmatch(r"[a-z0-9]+(-[a-z0-9]+)*", str(name)):
+                suffix, weight = f"-worker-{name}", 2.0
+            else:
+                raise ValueError(
+                    f"workers: {name!r} is not a valid worker group name "
+                    f"(lowercase letters, digits and hyphens)"
+                )
+            cfg = configured.get(name) or {}
+            memory = cfg.get("memory")
+            group = WindmillWorkerGroup(
+                name=name,
+                suffix=suffix,
+                replicas=_count(cfg.get("replicas", 1), f"workers.{name}.replicas"),
+                database_connections=_count(
+                    cfg.get("database_connections", connections),
+                    f"workers.{name}.database_connections",
+                ),
+                memory=None if memory is None else parse_bytes(memory),
+                weight=weight,
+            )
+            if group.database_connections == 0:
+                raise ValueError(f"workers.{name}.database_connections must be at least 1")
+            groups.append(group)
+        return groups
+
+    @property
+    def resource_profile(self) -> dict[str, float]:
+        # However many groups there are, they split the same share, so adding
+        # one leaves the server (and the other apps) as they are.
+        groups = self.worker_groups
+        total = sum(group.weight for group in groups)
+        return {
+            "": 1.0,
+            **{group.suffix: self.WORKERS_WEIGHT * group.weight / total for group in groups},
+        }
+
+    @property
+    def instance_counts(self) -> dict[str, int]:
+        return {
+            group.suffix: group.replicas for group in self.worker_groups if group.replicas != 1
+        }
+
+    @property
+    def is_using_azure_db(self) -> bool:
+        return "azure_db_user" in self.app_cfg
 
     @property
     def windmill_db_user_and_password(self):
-        windmill_db_user = self.app_cfg.pop(  # FIXME: config should be immutable
+        windmill_db_user = self.app_cfg.get(
             "azure_db_user", self.ctx.postgres_from_container.user
         )
-        windmill_db_pass = self.app_cfg.pop(
+        windmill_db_pass = self.app_cfg.get(
             "azure_db_pass", self.ctx.postgres_from_container.password
         )
         return windmill_db_user, windmill_db_pass
 
+    def postgres_connections(self) -> int:
+        # One pool per replica; 5 connections each is the one-click default.
+        server = int(self.app_cfg.get("server_database_connections", 5))
+        return server + sum(
+            group.replicas * group.database_connections for group in self.worker_groups
+        )
+
+    def provisioning_sql(self) -> list:
+        """On Azure, Windmill logs in as its own user, created by the admin."""
+        if not self.is_using_azure_db:
+            return []
+        windmill_db_user, windmill_db_pass = self.windmill_db_user_and_password
+        user = psycopg.sql.Identifier(windmill_db_user)
+        return [
+            psycopg.sql.SQL("CREATE USER {} PASSWORD {};").format(
+                user, psycopg.sql.Literal(windmill_db_pass)
+            ),
+            psycopg.sql.SQL("GRANT ALL PRIVILEGES ON DATABASE windmill TO {};").format(
+                user
+            ),
+            # Azure only:
+            psycopg.sql.SQL("GRANT azure_pg_admin TO {};").format(user),
+            psycopg.sql.SQL("ALTER USER {} CREATEROLE;").format(user),
+        ]
+
+    def app_variables(self) -> dict:
+        windmill_db_user, windmill_db_pass = self.windmill_db_user_and_password
+        variables = {
+            "$$cap_database_url": f"postgres://{windmill_db_user}:{windmill_db_pass}@{self.ctx.postgres_from_container.host}:{self.ctx.postgres_from_container.port}/windmill"
+        }
+        # The Azure login and the worker groups are ours to set up; they
+        # aren't one-click app variables.
+        app_cfg = {
+            k: v
+            for k, v in self.app_cfg.items()
+            if k not in (*self.AZURE_CONFIG_KEYS, "workers")
+        }
+        return construct_app_variables(app_cfg, variables)
+
+    def deployed_services(self, rendered: dict) -> dict:
+        """The one-click services, plus a copy of the `default` worker per added group."""
+        services = dict(rendered)
+        template = rendered[f"{self.app_name}-worker"]
+        for group in self.worker_groups:
+            name = self.app_name + group.suffix
+            service = copy.deepcopy(services.get(name, template))
+            service["environment"] = {
+                **(service.get("environment") or {}),
+                "WORKER_GROUP": group.name,
+                "DATABASE_CONNECTIONS": group.database_connections,
+            }
+            services[name] = service
+        return services
+
+    @property
+    def deployed_service_names(self) -> list[str]:
+        return list(
+            dict.fromkeys(
+                [*self.service_names, *(self.app_name + g.suffix for g in self.worker_groups)]
+            )
+        )
+
+    def obsolete_services(self, definitions: dict) -> list[str]:
+        """Apps of worker groups since dropped from the config.
+
+        Only apps the deploy state records as ours are candidates: a CapRover
+        app that merely shares the naming scheme is never deleted, and without
+        a deploy state nothing is.
+        """
+        recorded = self.ctx.state and self.ctx.state.get(self.one_click_app_name)
+        if not recorded or recorded.app_name != self.app_name:
+            return []
+        wanted = set(self.deployed_service_names)
+        return [name for name in recorded.services if name not in wanted]
+
+    def _worker_limits(self, group: WindmillWorkerGroup):
+        name = self.app_name + group.suffix
+        if group.memory is None:
+            return self.resource_limits(name, apply_memory_limit)
+        allocation = self.ctx.resources and self.ctx.resources.allocation(name)
+        if allocation:
+            return replace(
+                allocation,
+                memory_limit=group.memory,
+                memory_reservation=min(group.memory, allocation.memory_reservation),
+            ).transform()
+        transform = functools.partial(apply_memory_limit, memory_bytes=group.memory)
+        transform.accepts_document = True
+        return transform
+
+    def mutations(self) -> list[AppMutation]:
+        server = (
+            AppMutation(self.app_name)
+            .update(support_websocket=True)
+            .override(self.resource_limits(self.app_name, apply_memory_limit))
+        )
+        if self.ctx.webapps_use_ssl:
+            server.enable_ssl().update(force_ssl=True)
+        configured = self.app_cfg.get("workers") or {}
+        workers = []
+        for group in self.worker_groups:
+            worker = AppMutation(self.app_name + group.suffix).override(self._worker_limits(group))
+            # Unless the config scales it, a group keeps the instances it has.
+            if "replicas" in (configured.get(group.name) or {}):
+                worker.update(instance_count=group.replicas)
+            workers.append(worker)
+        return [server, *workers]
+
     def _install(self) -> None:
-        is_using_azure_db = "azure_db_user" in self.app_cfg
+        is_using_azure_db = self.is_using_azure_db
         if is_using_azure_db:
             input(
                 "Before continuing, enable UUID-OSSP extension on the Azure database..."
             )
 
         windmill_db_user, windmill_db_pass = self.windmill_db_user_and_password
-        variables = {
-            "$$cap_database_url": f"postgres://{windmill_db_user}:{windmill_db_pass}@{self.ctx.postgres_from_container.host}:{self.ctx.postgres_from_container.port}/windmill"
-        }
-        variables = construct_app_variables(self.app_cfg, variables)
+        variables = self.app_variables()
 
         dry_run = self.ctx.dry_run
-        self.logger.info("Settuing up database for Windmill")
-        if not dry_run:
-            # As superadmin, create a windmill database
-            with (
-                psycopg.connect(
-                    self.ctx.postgres_from_vm.connstr("postgres"), autocommit=True
-                ) as conn,
-                conn.cursor() as cur,
-            ):
-                logger.info("Connected to database as superadmin")
-                if is_using_azure_db:
-                    cur.execute(
-                        f"CREATE USER {windmill_db_user} PASSWORD '{windmill_db_pass}';"
-                    )
-                    cur.execute(
-                        f"GRANT ALL PRIVILEGES ON DATABASE windmill TO {windmill_db_user};"
-                    )
-                    # Azure only:
-                    cur.execute(
-                        psycopg.sql.SQL("GRANT azure_pg_admin TO {};").format(
-                            psycopg.sql.Identifier(windmill_db_user)
-                        )
-                    )
-                    cur.execute(
-                        psycopg.sql.SQL("ALTER USER {} CREATEROLE;").format(
-                            psycopg.sql.Identifier(windmill_db_user)
-                        )
-                    )
 
-        # As windmill_login
+        # As windmill_login (created during provisioning, before _install)
         postgres_azure_user = replace(
             self.ctx.postgres_from_vm, user=windmill_db_user, password=windmill_db_pass
         )
         if is_using_azure_db and not dry_run:
-            with psycopg.connect(postgres_azure_user.connstr("windmill")) as conn:
+            self.logger.info("Setting up database roles for Windmill")
+            with self.ctx.postgres_pool.connection(
+                postgres_azure_user, "windmill", autocommit=False
+            ) as conn:
                 self.logger.info(f"Connected to database as {postgres_azure_user.user}")
                 with conn.cursor() as cur:
                     # The following comes from https://raw.githubusercontent.com/windmill-labs/windmill/main/init-db-as-superuser.sql
@@ -252,48 +493,34 @@ class WindmillApp(AppSpec):
                         )
                     )
 
-        # Hacky workaround: pre-pull large Windmill image to avoid CapRover timeout
-        _pre_pull_windmill_image(variables, self.ctx.gc_repository)
         self.logger.info("Deploying Windmill one-click-app")
         if not dry_run:
-            cap = self.ctx.caprover
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-                one_click_repository=self.ctx.gc_repository,
-            )
-            cap.update_app(self.app_name, support_websocket=True)
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-                cap.update_app(self.app_name, force_ssl=True)
-
-            for svcname in (
-                self.app_name,
-                f"{self.app_name}-worker",
-                f"{self.app_name}-worker-native",
-            ):
-                patch_service_update_override(cap, svcname, apply_memory_limit)
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+            self.apply_mutations()
 
 
 class RedisApp(AppSpec):
     one_click_app_name = "redis"
+    uses_gc_repository = False
+    resource_profile = {"": 0.5}
+
+    def app_variables(self) -> dict:
+        return construct_app_variables(self.app_cfg)
+
+    def mutations(self) -> list[AppMutation]:
+        return [
+            AppMutation(self.app_name).override(
+                self.resource_limits(self.app_name, apply_memory_limit)
+            )
+        ]
 
     def _install(self) -> None:
-        variables = construct_app_variables(self.app_cfg)
+        variables = self.app_variables()
 
         self.logger.info("Deploying Redis")
         if not self.ctx.dry_run:
-            self.ctx.caprover.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-            )
-            patch_service_update_override(
-                self.ctx.caprover, self.app_name, apply_memory_limit
-            )
+            self.deploy_one_click(variables)
+            self.apply_mutations()
 
 
 class SupersetApp(AppSpec):
@@ -302,169 +529,214 @@ class SupersetApp(AppSpec):
         PostgresApp.one_click_app_name,
         RedisApp.one_click_app_name,
     )
-    databases = ("warehouse",)
-
-    def _install(self) -> None:
-        postgres_from_container = self.ctx.postgres_from_container
-        cap = self.ctx.caprover
-
-        if not self.ctx.dry_run:
-            with (
-                psycopg.connect(
-                    self.ctx.postgres_from_vm.connstr(), autocommit=True
-                ) as conn,
-                conn.cursor() as cur,
-            ):
-                cur.execute("CREATE DATABASE superset_metastore;")
-
+    databases = ("warehouse", "superset_metastore")
+    service_suffixes = ("", "-worker", "-init-and-beat")
+    image_variable = "$$cap_superset_docker_image"
+    resource_profile = {"": 1.5, "-worker": 1.5, "-init-and-beat": 0.5}
+    pools_through_pgbouncer = True
+
+    def postgres_connections(self) -> int:
+        # SQLAlchemy's default pool (5, plus 10 overflow) in the web server and
+        # in the Celery worker; beat needs few.
+        return 2 * 15 + 5
+
+    def app_variables(self) -> dict:
+        postgres = self.postgres_for_services
         variables = {
-            "$$cap_postgres_host": postgres_from_container.host,
-            "$$cap_postgres_port": postgres_from_container.port,
-            "$$cap_postgres_userpassword": f"{postgres_from_container.user}:{postgres_from_container.password}",
+            "$$cap_postgres_host": postgres.host,
+            "$$cap_postgres_port": postgres.port,
+            "$$cap_postgres_userpassword": f"{postgres.user}:{postgres.password}",
         }
-        variables = construct_app_variables(self.app_cfg, variables)
-        self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
-        if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-                one_click_repository=self.ctx.gc_repository,
+        return construct_app_variables(self.app_cfg, variables)
+
+    def mutations(self) -> list[AppMutation]:
+        web = AppMutation(self.app_name).override(
+            self.resource_limits(self.app_name, apply_memory_limit)
+        )
+        if self.ctx.webapps_use_ssl:
+            web.enable_ssl().update(force_ssl=True)
+        # disable the healthcheck in Service Update Override, which will be maintained
+        # in future deploys. This is OPTIONAL here because the one-click app already
+        # does this in a custom dockerfileLines, but recommended to ease upgrades.
+        workers = [
+            AppMutation(svcname).override(
+                disable_healthcheck, self.resource_limits(svcname, apply_memory_limit)
             )
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-                cap.update_app(self.app_name, force_ssl=True)
-            patch_service_update_override(cap, self.app_name, apply_memory_limit)
-
-            # disable the healthcheck in Service Update Override, which will be maintained
-            # in future deploys. This is OPTIONAL here because the one-click app already
-            # does this in a custom dockerfileLines, but recommended to ease upgrades.
             for svcname in (
                 f"{self.app_name}-init-and-beat",
                 f"{self.app_name}-worker",
-            ):
-                patch_service_update_override(
-                    cap, svcname, disable_healthcheck, apply_memory_limit
-                )
+            )
+        ]
+        return [web, *workers]
+
+    def _install(self) -> None:
+        variables = self.app_variables()
+        self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
+        if not self.ctx.dry_run:
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+            self.apply_mutations()
 
 
 class GCLandingPageApp(AppSpec):
     one_click_app_name = "gc-landing-page"
     depends_on = (PostgresApp.one_click_app_name,)
     databases = ("warehouse", "guardianconnector")
+    image_variable = "$$cap_gc_landing_page_docker_image"
+    resource_profile = {"": 0.5}
+    pools_through_pgbouncer = True
 
-    def _install(self) -> None:
-        postgres_from_container = self.ctx.postgres_from_container
-        cap = self.ctx.caprover
+    def postgres_connections(self) -> int:
+        return 10  # node-postgres' default pool size
 
-        redirect_to_root = self.app_cfg.get("redirect_to_root", True)
+    def app_variables(self) -> dict:
+        postgres = self.postgres_for_services
         variables = {
-            "$$cap_postgres_host": postgres_from_container.host,
-            "$$cap_postgres_port": postgres_from_container.port,
-            "$$cap_postgres_ssl": postgres_from_container.ssl,
-            "$$cap_postgres_user": postgres_from_container.user,
-            "$$cap_postgres_pass": postgres_from_container.password,
+            "$$cap_postgres_host": postgres.host,
+            "$$cap_postgres_port": postgres.port,
+            "$$cap_postgres_ssl": postgres.ssl,
+            "$$cap_postgres_user": postgres.user,
+            "$$cap_postgres_pass": postgres.password,
         }
-        variables = construct_app_variables(self.app_cfg, variables)
+        return construct_app_variables(self.app_cfg, variables)
+
+    def mutations(self) -> list[AppMutation]:
+        root_domain = self.ctx.caprover.root_domain
+        mutation = AppMutation(self.app_name).override(
+            self.resource_limits(self.app_name, apply_memory_limit)
+        )
+        if self.ctx.webapps_use_ssl:
+            mutation.enable_ssl().update(force_ssl=True)
+        if self.app_cfg.get("redirect_to_root", True):
+            mutation.add_domain(
+                root_domain, ssl=self.ctx.webapps_use_ssl
+            ).redirect_domain(root_domain)
+        return [mutation]
+
+    def _install(self) -> None:
+        cap = self.ctx.caprover
+
+        variables = self.app_variables()
         self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
         if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-                one_click_repository=self.ctx.gc_repository,
-            )
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-                cap.update_app(self.app_name, force_ssl=True)
-            patch_service_update_override(cap, self.app_name, apply_memory_limit)
-
-        if redirect_to_root:
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+        if self.app_cfg.get("redirect_to_root", True):
             self.logger.info(
                 f"Will serve {self.app_name} at the root domain: [{cap.root_domain}]"
             )
-            if not self.ctx.dry_run:
-                cap.add_domain(self.app_name, cap.root_domain)
-                if self.ctx.webapps_use_ssl:
-                    cap.enable_ssl(self.app_name, cap.root_domain)
-                cap.update_app(self.app_name, redirectDomain=cap.root_domain)
+        if not self.ctx.dry_run:
+            self.apply_mutations()
 
 
 class GCExplorerApp(AppSpec):
     one_click_app_name = "gc-explorer"
     depends_on = (PostgresApp.one_click_app_name,)
     databases = ("warehouse", "guardianconnector")
+    image_variable = "$$cap_gc_explorer_docker_image"
+    pools_through_pgbouncer = True
 
-    def _install(self) -> None:
-        postgres_from_container = self.ctx.postgres_from_container
-        cap = self.ctx.caprover
+    def postgres_connections(self) -> int:
+        return 10  # node-postgres' default pool size
 
+    def app_variables(self) -> dict:
+        postgres = self.postgres_for_services
         variables = {
-            "$$cap_postgres_host": postgres_from_container.host,
-            "$$cap_postgres_port": postgres_from_container.port,
-            "$$cap_postgres_ssl": postgres_from_container.ssl,
-            "$$cap_postgres_user": postgres_from_container.user,
-            "$$cap_postgres_pass": postgres_from_container.password,
+            "$$cap_postgres_host": postgres.host,
+            "$$cap_postgres_port": postgres.port,
+            "$$cap_postgres_ssl": postgres.ssl,
+            "$$cap_postgres_user": postgres.user,
+            "$$cap_postgres_pass": postgres.password,
             "$$cap_postgres_database": self.app_cfg["postgres_database"],
         }
-        variables = construct_app_variables(self.app_cfg, variables)
+        return construct_app_variables(self.app_cfg, variables)
+
+    def mutations(self) -> list[AppMutation]:
+        mutation = AppMutation(self.app_name).override(
+            self.resource_limits(self.app_name, apply_memory_limit)
+        )
+        if self.ctx.webapps_use_ssl:
+            mutation.enable_ssl().update(force_ssl=True)
+        return [mutation]
+
+    def _install(self) -> None:
+        variables = self.app_variables()
         self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
         if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-                one_click_repository=self.ctx.gc_repository,
-            )
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-                cap.update_app(self.app_name, force_ssl=True)
-            patch_service_update_override(cap, self.app_name, apply_memory_limit)
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+            self.apply_mutations()
 
 
 class ComapeoCloudApp(AppSpec):
     one_click_app_name = "comapeo-cloud"
+    image_variable = "$$cap_comapeocloud_docker_image"
+
+    def app_variables(self) -> dict:
+        return construct_app_variables(self.app_cfg)
+
+    def mutations(self) -> list[AppMutation]:
+        mutation = (
+            AppMutation(self.app_name)
+            .update(force_ssl=self.ctx.webapps_use_ssl, support_websocket=True)
+            .override(self.resource_limits(self.app_name, apply_memory_limit))
+        )
+        if self.ctx.webapps_use_ssl:
+            mutation.enable_ssl()
+        return [mutation]
 
     def _install(self) -> None:
-        variables = {}
-        variables = construct_app_variables(self.app_cfg, variables)
+        variables = self.app_variables()
         self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
-        cap = self.ctx.caprover
         if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                one_click_repository=self.ctx.gc_repository,
-                automated=True,
-            )
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-            cap.update_app(
-                self.app_name,
-                force_ssl=self.ctx.webapps_use_ssl,
-                support_websocket=True,
-            )
-            patch_service_update_override(cap, self.app_name, apply_memory_limit)
+            self.deploy_one_click(variables, self.ctx.gc_repository)
+            self.apply_mutations()
 
 
 class FilebrowserApp(AppSpec):
     one_click_app_name = "filebrowser"
+    uses_gc_repository = False
+    resource_profile = {"": 0.25}
+
+    def app_variables(self) -> dict:
+        return construct_app_variables(self.app_cfg)
+
+    # NOTE: You will get warning pages in the filebrowser app before the `datalake` subdir is created in storage:
+    # https://github.com/ConservationMetrics/gc-deploy/pull/12#discussion_r2243697895
+    ENVIRONMENT = {"FB_ROOT": "/srv/datalake"}
+
+    def persistent_directories(self) -> list[str]:
+        return [
+            f"{self.app_name}-database:/database",
+            f"{self.app_name}-config:/config",
+            "/mnt/persistent-storage:/srv",  # The files to be served up live here
+        ]
+
+    def deployed_services(self, rendered: dict) -> dict:
+        """The one-click service, deployed with its database on our volume."""
+        service = dict(rendered[self.app_name])
+        service["volumes"] = self.persistent_directories()
+        service["environment"] = {**(service.get("environment") or {}), **self.ENVIRONMENT}
+        return {**rendered, self.app_name: service}
+
+    def mutations(self) -> list[AppMutation]:
+        mutation = AppMutation(self.app_name).update(
+            persistent_directories=self.persistent_directories(),
+            environment_variables=self.ENVIRONMENT,
+        )
+        mutation.override(self.resource_limits(self.app_name, apply_memory_limit))
+        if self.ctx.webapps_use_ssl:
+            mutation.enable_ssl().update(force_ssl=True)
+        return [mutation]
 
     def _install(self) -> None:
-
         cap = self.ctx.caprover
-        variables = {}
-        variables = construct_app_variables(self.app_cfg, variables)
+        variables = self.app_variables()
         self.logger.info(f"Deploying {self.one_click_app_name} one-click app")
 
         admin_password = self.app_cfg.get("admin_password")
         generated = admin_password is None
         if generated:
             admin_password = secrets.token_urlsafe(16)
+        import bcrypt  # only Filebrowser needs it
+
         hashed_password = bcrypt.hashpw(
             admin_password.encode("utf-8"), bcrypt.gensalt()
         ).decode("utf-8")
@@ -480,39 +752,36 @@ class FilebrowserApp(AppSpec):
             )
 
         if not self.ctx.dry_run:
-            cap.deploy_one_click_app(
-                self.one_click_app_name,
-                self.app_name,
-                app_variables=variables,
-                automated=True,
-            )
-            if self.ctx.webapps_use_ssl:
-                cap.enable_ssl(self.app_name)
-                cap.update_app(self.app_name, force_ssl=True)
-
-            cap.update_app(
-                self.app_name,
-                persistent_directories=[
-                    f"{self.app_name}-database:/database",
-                    f"{self.app_name}-config:/config",
-                    "/mnt/persistent-storage:/srv",  # The files to be served up live here
-                ],
-                # NOTE: You will get warning pages in the filebrowser app before the `datalake` subdir is created in storage:
-                # https://github.com/ConservationMetrics/gc-deploy/pull/12#discussion_r2243697895
-                environment_variables={
-                    "FB_ROOT": "/srv/datalake",
-                    "FB_PASSWORD": hashed_password,
-                },
-            )
-            patch_service_update_override(cap, self.app_name, apply_memory_limit)
+            # Filebrowser reads FB_PASSWORD only while creating its database, which
+            # it does before serving HTTP. The one-time admin password rides along
+            # with the deploy itself (with the database volume), which returns only
+            # once CapRover has moved the app's deployedVersion to it. An update's
+            # old container answering HTTP is then no longer waited on alone.
+            self.deploy_one_click(variables, environment={"FB_PASSWORD": hashed_password})
+            (mutation,) = self.mutations()
+            mutation.apply(cap, self.ctx.certificates)
+
+            # Until its certificate is in place (certificates.py may defer it
+            # past this install), it only answers over plain HTTP.
+            certified = cap.get_app(self.app_name).get("hasDefaultSubDomainSsl")
+            scheme = "https" if certified else "http"
+            health_url = f"{scheme}://{self.app_name}.{cap.root_domain}/health"
             self.logger.info("Waiting for Filebrowser to initialize its database...")
-            time.sleep(20)  # TODO: confirm has started. Now we're just guessing.
+            wait_until(
+                # Off the CapRover host Docker can't tell (None): go by HTTP alone.
+                lambda: docker_service_running(self.app_name) is not False
+                and http_responds(health_url),
+                description=f"{self.app_name} at {health_url}",
+                timeout=self.ctx.readiness_timeout,
+                cancel=self.ctx.cancel,
+            )
             # CaproverAPI doesn't support deletion of an env var, so we just set it to empty
             cap.update_app(self.app_name, environment_variables={"FB_PASSWORD": ""})
 
 
 APPS_REGISTRY: list[type[AppSpec]] = [
     PostgresApp,
+    PgBouncerApp,
     WindmillApp,
     RedisApp,
     SupersetApp,
@@ -521,3 +790,59 @@ APPS_REGISTRY: list[type[AppSpec]] = [
     ComapeoCloudApp,
     FilebrowserApp,
 ]
+
+
+def configured_apps(config: dict, ctx) -> list[AppSpec]:
+    """Apps in the registry that have a config block, in registry order.
+
+    They are the apps that share the VM: given a `ctx.resource_budget`, it is
+    divided between them into `ctx.resources`. They are also the apps that
+    share Postgres: their pools are totalled into `ctx.connections`.
+    """
+    specs = [
+        cls(config[cls.one_click_app_name], ctx)
+        for cls in APPS_REGISTRY
+        if cls.one_click_app_name in config
+    ]
+    for spec in specs:
+        if spec.pooled:
+            spec.depends_on = (*spec.depends_on, PgBouncerApp.one_click_app_name)
+    if ctx.resource_budget is not None:
+        ctx.resources = ctx.resource_budget.allocate(specs)
+
+    ctx.connections = _connection_budget(specs, ctx, tuned=True)
+    return specs
+
+
+def run_connections(specs: list[AppSpec], ctx, deploying: list[AppSpec]) -> ConnectionBudget:
+    """`ctx.connections`, for a run that installs or updates `deploying`.
+
+    Postgres only takes its tuned max_connections when the run installs or
+    updates it (and so tunes it). Otherwise the pools must fit the server as
+    it runs.
+    """
+    tuned = any(isinstance(spec, PostgresApp) for spec in deploying)
+    ctx.connections = _connection_budget(specs, ctx, tuned)
+    return ctx.connections
+
+
+def _connection_budget(specs: list[AppSpec], ctx, tuned: bool) -> ConnectionBudget:
+    by_type = {type(spec): spec for spec in specs}
+    tuning = tuned and PostgresApp in by_type and by_type[PostgresApp].tuning()
+    return connection_budget(
+        specs,
+        int(tuning["max_connections"]) if tuning else _server_max_connections(ctx),
+        by_type[PgBouncerApp].max_client_connections if PgBouncerApp in by_type else None,
+    )
+
+
+def _server_max_connections(ctx) -> int:
+    """`postgres.max_connections` from the config, or else the server's own."""
+    if ctx.postgres_max_connections is not None:
+        return int(ctx.postgres_max_connections)
+    try:
+        with ctx.postgres_pool.dedicated(ctx.postgres_from_vm) as conn:
+            return int(conn.execute("SHOW max_connections").fetchone()[0])
+    except psycopg.Error as e:
+        logger.info(f"Could not ask Postgres for its max_connections ({e}); assuming 100")
+        return 100
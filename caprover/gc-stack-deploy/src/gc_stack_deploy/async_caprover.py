@@ -0,0 +1,562 @@
+"""An asyncio CapRover client, and a blocking adapter for AppSpec code.
+
+`caprover_api.CaproverAPI` blocks its thread for every request, and opens a
+new connection for some of them. AsyncCaprover speaks the same HTTP API from
+one event loop instead:
+
+- one ConnectionPool of keep-alive HTTP/1.1 connections, shared by every
+  client in the process (so across VMs in a fleet run too), with at most
+  `per_host` requests in flight to any one CapRover;
+- one auth token per client, fetched once and shared by all its requests
+  (and fetched again, once, if CapRover reports it invalid);
+- transient failures (connection errors, 5xx from nginx, CapRover's
+  "Another operation still in progress") retried with backoff.
+
+It covers what apps_registry.py calls, with the gc-deploy fork's one-click
+semantics (services are named after `app_name`); the services of a one-click
+app that don't depend on each other are created and deployed concurrently.
+
+SyncCaprover wraps an AsyncCaprover so that existing `AppSpec._install()`
+code, which calls `ctx.caprover.update_app(...)` from worker threads, keeps
+working unchanged: each call runs on a shared background event loop, so the
+calls of many threads overlap on the same few connections.
+
+    cap = SyncCaprover.connect(dashboard_url, password)
+    cap.update_app("windmill", instance_count=1)
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import re
+import ssl
+import threading
+import time
+import urllib.parse
+import urllib.request
+import weakref
+from collections import defaultdict
+
+from .app_mutation import apply_update
+from .one_click import PUBLIC_ONE_CLICK_APP_PATH, OneClickDefinition, service_settings
+from .readiness import Backoff
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = 100
+STATUS_OK_DEPLOY_STARTED = 101
+STATUS_OK_PARTIALLY = 102
+STATUS_AUTH_TOKEN_INVALID = 1106
+_OK_STATUSES = (STATUS_OK, STATUS_OK_DEPLOY_STARTED, STATUS_OK_PARTIALLY)
+
+class CaproverError(Exception):
+    """CapRover answered with a non-OK status."""
+
+    def __init__(self, status: int, description: str):
+        super().__init__(description)
+        self.status = status
+        self.description = description
+
+
+class TransientError(Exception):
+    """A failure worth retrying: dropped connection, 5xx, operation in progress."""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections, pooled per (scheme, host, port).
+
+    At most `per_host` requests are in flight to one host at a time; the
+    rest wait their turn. Idle connections are reused, newest first.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, per_host: int = 6, timeout: float = 120.0):
+        self.per_host = per_host
+        self.timeout = timeout
+        self._idle: dict[tuple, list] = defaultdict(list)
+        self._limits: dict[tuple, asyncio.Semaphore] = {}
+        self.opened = 0  # connections established
+        self.requests = 0
+
+    async def request(
+        self, method: str, url: str, headers: dict | None = None, body: bytes = b""
+    ) -> tuple[int, dict, bytes]:
+        """Send one request and return (status, lower-cased headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        secure = parts.scheme == "https"
+        key = (parts.scheme, parts.hostname, parts.port or (443 if secure else 80))
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        head = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        head += [f"Content-Length: {len(body)}", "Accept-Encoding: identity"]
+        payload = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.per_host))
+        async with limit:
+            self.requests += 1
+            # A pooled connection the server has since closed fails on first
+            # use; that costs one retry on a fresh connection, nothing more.
+            while True:
+                reused = bool(self._idle[key])
+                reader, writer = self._idle[key].pop() if reused else await self._open(key)
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    status, resp_headers, resp_body, keep = await asyncio.wait_for(
+                        _read_response(reader, head_only=method == "HEAD"), self.timeout
+                    )
+                except (OSError, EOFError, asyncio.TimeoutError) as e:
+                    writer.close()
+                    if reused:
+                        continue
+                    raise TransientError(f"{method} {url}: {e}") from e
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep:
+                    self._idle[key].append((reader, writer))
+                else:
+                    writer.close()
+                return status, resp_headers, resp_body
+
+    async def _open(self, key: tuple):
+        scheme, host, port = key
+        try:
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(
+                    host, port, ssl=ssl.create_default_context() if scheme == "https" else None
+                ),
+                self.timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise TransientError(f"connecting to {host}:{port}: {e}") from e
+        self.opened += 1
+        return connection
+
+    async def close(self) -> None:
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_response(reader: asyncio.StreamReader, head_only: bool = False):
+    status_line = await reader.readline()
+    if not status_line:
+        raise EOFError("connection closed before a response")
+    version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if head_only or status in ("204", "304"):
+        body = b""
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # trailers
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body, keep = await reader.read(), False
+    return int(status), headers, body, keep
+
+
+_shared_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ConnectionPool]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def shared_pool() -> ConnectionPool:
+    """The pool shared by every client on the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _shared_pools:
+        _shared_pools[loop] = ConnectionPool()
+    return _shared_pools[loop]
+
+
+class AsyncCaprover:
+    """CapRover's HTTP API from asyncio; method names follow CaproverAPI."""
+
+    LOGIN_PATH = "/api/v2/login"
+    SYSTEM_INFO_PATH = "/api/v2/user/system/info"
+    APP_LIST_PATH = "/api/v2/user/apps/appDefinitions"
+    APP_REGISTER_PATH = "/api/v2/user/apps/appDefinitions/register"
+    APP_DELETE_PATH = "/api/v2/user/apps/appDefinitions/delete"
+    ADD_CUSTOM_DOMAIN_PATH = "/api/v2/user/apps/appDefinitions/customdomain"
+    UPDATE_APP_PATH = "/api/v2/user/apps/appDefinitions/update"
+    ENABLE_BASE_DOMAIN_SSL_PATH = "/api/v2/user/apps/appDefinitions/enablebasedomainssl"
+    ENABLE_CUSTOM_DOMAIN_SSL_PATH = "/api/v2/user/apps/appDefinitions/enablecustomdomainssl"
+    APP_DATA_PATH = "/api/v2/user/apps/appData"
+
+    attempts = 4  # per request, for transient failures
+    build_poll_interval = 1.0
+    build_timeout = 600.0
+
+    def __init__(
+        self,
+        dashboard_url: str,
+        password: str,
+        pool: ConnectionPool | None = None,
+        captain_namespace: str = "captain",
+        schema_version: int = 2,
+    ):
+        url = dashboard_url.split("/#")[0].strip("/")
+        self.base_url = url if re.match(r"^https?://", url) else "https://" + url
+        self.password = password
+        self._pool = pool
+        self.schema_version = schema_version
+        self.headers = {
+            "accept": "application/json, text/plain, */*",
+            "x-namespace": captain_namespace,
+            "content-type": "application/json;charset=UTF-8",
+        }
+        self.root_domain: str | None = None
+        self._token: str | None = None
+        self._login_lock = asyncio.Lock()
+        self.logins = 0
+
+    @classmethod
+    async def connect(cls, dashboard_url: str, password: str, **kwargs) -> "AsyncCaprover":
+        """Log in and learn the root domain, as CaproverAPI() does."""
+        client = cls(dashboard_url, password, **kwargs)
+        await client._login()
+        client.root_domain = (await client.get_system_info())["data"]["rootDomain"]
+        return client
+
+    # --- plumbing ------------------------------------------------------------
+
+    @property
+    def pool(self) -> ConnectionPool:
+        if self._pool is None:
+            self._pool = shared_pool()
+        return self._pool
+
+    async def _login(self, stale_token: str | None = None) -> None:
+        async with self._login_lock:
+            if self._token is not None and self._token != stale_token:
+                return  # another request logged in while we waited
+            response = await self._send(
+                "POST", self.LOGIN_PATH, {"password": self.password}, auth=False
+            )
+            self._token = response["data"]["token"]
+            self.logins += 1
+
+    async def _call(self, method: str, path: str, data: dict | None = None) -> dict:
+        if self._token is None:
+            await self._login()
+        token = self._token
+        try:
+            return await self._send(method, path, data)
+        except CaproverError as e:
+            if e.status != STATUS_AUTH_TOKEN_INVALID:
+                raise
+        await self._login(stale_token=token)
+        return await self._send(method, path, data)
+
+    async def _send(self, method: str, path: str, data=None, auth: bool = True) -> dict:
+        headers = dict(self.headers)
+        if auth:
+            headers["x-captain-auth"] = self._token
+        body = b"" if data is None else json.dumps(data).encode()
+        delays = Backoff(initial=0.5).delays()
+        for attempt in range(1, self.attempts + 1):
+            try:
+                status, _, raw = await self.pool.request(
+                    method, self.base_url + path, headers, body
+                )
+                if status >= 500:
+                    raise TransientError(f"{method} {path}: HTTP {status}")
+                response = json.loads(raw)
+                if "in progress" in str(response.get("description", "")).lower():
+                    raise TransientError(f"{method} {path}: {response['description']}")
+            except TransientError as e:
+                if attempt == self.attempts:
+                    raise
+                logger.warning(f"{e}; retrying ({attempt}/{self.attempts - 1})")
+                await asyncio.sleep(next(delays))
+                continue
+            if response.get("status") not in _OK_STATUSES:
+                raise CaproverError(response.get("status"), response.get("description", ""))
+            return response
+
+    # --- reads ---------------------------------------------------------------
+
+    async def get_system_info(self) -> dict:
+        return await self._call("GET", self.SYSTEM_INFO_PATH)
+
+    async def list_apps(self) -> dict:
+        return await self._call("GET", self.APP_LIST_PATH)
+
+    async def get_app(self, app_name: str) -> dict:
+        apps = (await self.list_apps())["data"]["appDefinitions"]
+        return next((app for app in apps if app["appName"] == app_name), {})
+
+    async def get_app_info(self, app_name: str) -> dict:
+        return await self._call("GET", f"{self.APP_DATA_PATH}/{app_name}")
+
+    async def _wait_until_built(self, app_name: str) -> dict:
+        deadline = time.monotonic() + self.build_timeout
+        while True:
+            info = await self.get_app_info(app_name)
+            if not info.get("data", {}).get("isAppBuilding"):
+                if info.get("data", {}).get("isBuildFailed"):
+                    raise CaproverError(info.get("status"), f"{app_name}: app build failed")
+                return info
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{app_name}: still building after {self.build_timeout}s")
+            await asyncio.sleep(self.build_poll_interval)
+
+    # --- writes --------------------------------------------------------------
+
+    async def create_app(
+        self, app_name: str, has_persistent_data: bool = False, wait_for_app_build: bool = True
+    ) -> dict:
+        logger.info(f"Creating new app: {app_name}")
+        response = await self._call(
+            "POST",
+            self.APP_REGISTER_PATH + "?detached=1",
+            {"appName": app_name, "hasPersistentData": has_persistent_data},
+        )
+        if wait_for_app_build:
+            await self._wait_until_built(app_name)
+        return response
+
+    async def update_app(
+        self,
+        app_name: str,
+        instance_count: int = None,
+        captain_definition_path: str = None,
+        environment_variables: dict = None,
+        expose_as_web_app: bool = None,
+        force_ssl: bool = None,
+        support_websocket: bool = None,
+        port_mapping: list = None,
+        persistent_directories: list = None,
+        container_http_port: int = None,
+        description: str = None,
+        service_update_override: str = None,
+        pre_deploy_function: str = None,
+        app_push_webhook: dict = None,
+        repo_info: dict = None,
+        http_auth: dict = None,
+        **kwargs,
+    ) -> dict:
+        """Same semantics as CaproverAPI.update_app: a read-modify-write of the definition.
+
+        Environment variables are merged into the current ones; any other
+        given value replaces the current one; extra kwargs are set verbatim.
+        """
+        app = apply_update(
+            await self.get_app(app_name),
+            instance_count=instance_count,
+            captain_definition_path=captain_definition_path,
+            environment_variables=environment_variables,
+            expose_as_web_app=expose_as_web_app,
+            force_ssl=force_ssl,
+            support_websocket=support_websocket,
+            port_mapping=port_mapping,
+            persistent_directories=persistent_directories,
+            container_http_port=container_http_port,
+            description=description,
+            service_update_override=service_update_override,
+            pre_deploy_function=pre_deploy_function,
+            app_push_webhook=app_push_webhook,
+            repo_info=repo_info,
+            http_auth=http_auth,
+        )
+        app.update(kwargs)
+        logger.info(f"{app_name} | Updating app info...")
+        return await self._call("POST", self.UPDATE_APP_PATH, app)
+
+    async def deploy_app(
+        self,
+        app_name: str,
+        image_name: str = None,
+        docker_file_lines: list = None,
+        wait_for_app_build: bool = True,
+    ) -> dict:
+        """Deploy a new version; unless `wait_for_app_build`, return once it is submitted."""
+        if image_name:
+            definition = {"schemaVersion": self.schema_version, "imageName": image_name}
+        elif docker_file_lines:
+            definition = {
+                "schemaVersion": self.schema_version,
+                "dockerfileLines": docker_file_lines,
+            }
+        else:
+            definition = {}
+        response = await self._call(
+            "POST",
+            f"{self.APP_DATA_PATH}/{app_name}" + ("" if wait_for_app_build else "?detached=1"),
+            {"captainDefinitionContent": json.dumps(definition), "gitHash": ""},
+        )
+        if wait_for_app_build:
+            await self._wait_until_built(app_name)
+        return response
+
+    async def add_domain(self, app_name: str, custom_domain: str) -> dict:
+        logger.info(f"{custom_domain} | Adding domain: {app_name}")
+        return await self._call(
+            "POST",
+            self.ADD_CUSTOM_DOMAIN_PATH,
+            {"appName": app_name, "customDomain": custom_domain},
+        )
+
+    async def enable_ssl(self, app_name: str, custom_domain: str = None) -> dict:
+        if custom_domain:
+            logger.info(f"{app_name} | Enabling SSL for domain {custom_domain}")
+            return await self._call(
+                "POST",
+                self.ENABLE_CUSTOM_DOMAIN_SSL_PATH,
+                {"appName": app_name, "customDomain": custom_domain},
+            )
+        logger.info(f"{app_name} | Enabling SSL for root domain")
+        return await self._call(
+            "POST", self.ENABLE_BASE_DOMAIN_SSL_PATH, {"appName": app_name}
+        )
+
+    async def delete_app(self, app_name: str, delete_volumes: bool = False) -> dict:
+        data = {"appName": app_name}
+        if delete_volumes:
+            logger.info(f"Deleting app {app_name} and its volumes...")
+            app = await self.get_app(app_name)
+            data["volumes"] = [v["volumeName"] for v in app.get("volumes", []) if "volumeName" in v]
+        else:
+            logger.info(f"Deleting app {app_name}")
+        return await self._call("POST", self.APP_DELETE_PATH, data)
+
+    async def delete_app_matching_pattern(
+        self, app_name_pattern: str, delete_volumes: bool = False, automated: bool = False
+    ) -> dict:
+        """Delete every app whose name matches, concurrently.
+
+        Always unattended: there is no interactive confirmation, so
+        `automated` is accepted only for CaproverAPI compatibility.
+        """
+        apps = (await self.list_apps())["data"]["appDefinitions"]
+        await asyncio.gather(
+            *(
+                self.delete_app(app["appName"], delete_volumes=delete_volumes)
+                for app in apps
+                if re.search(app_name_pattern, app["appName"])
+            )
+        )
+        return {"status": STATUS_OK, "description": "All apps matching pattern deleted"}
+
+    # --- one-click apps ------------------------------------------------------
+
+    @staticmethod
+    def _download_one_click_app_defn(repository_path: str, one_click_app_name: str) -> str:
+        """Blocking; see OneClickRepository.serve_downloads_for to serve from a store."""
+        with urllib.request.urlopen(repository_path + one_click_app_name) as resp:
+            return resp.read().decode()
+
+    async def deploy_one_click_app(
+        self,
+        one_click_app_name: str,
+        app_name: str,
+        app_variables: dict | None = None,
+        automated: bool = False,
+        one_click_repository: str = PUBLIC_ONE_CLICK_APP_PATH,
+    ) -> dict:
+        """Deploy every service of a one-click app; independent services in parallel."""
+        raw = await asyncio.to_thread(
+            self._download_one_click_app_defn, one_click_repository, one_click_app_name
+        )
+        # Never prompts, automated or not: there is no terminal to prompt on.
+        services = OneClickDefinition.parse(one_click_app_name, raw).render(
+            app_name, app_variables or {}, self.root_domain
+        )
+
+        done = {name: asyncio.Event() for name in services}
+
+        async def deploy_service(name: str, service: dict) -> None:
+            for prerequisite in service.get("depends_on") or []:
+                if prerequisite in done:
+                    await done[prerequisite].wait()
+            await self._deploy_service(name, service)
+            done[name].set()
+
+        await asyncio.gather(*(deploy_service(n, s) for n, s in services.items()))
+        return {
+            "status": STATUS_OK,
+            "description": f"Deployed all services in >>{one_click_app_name}<<",
+        }
+
+    async def _deploy_service(self, name: str, service: dict) -> None:
+        await self.create_app(name, has_persistent_data=bool(service.get("volumes")))
+        await self.update_app(name, **service_settings(service))
+        await self.deploy_app(
+            name,
+            image_name=service.get("image"),
+            docker_file_lines=(service.get("caproverExtra") or {}).get("dockerfileLines"),
+        )
+
+
+class _LoopThread:
+    """One event loop on a daemon thread, shared by every SyncCaprover."""
+
+    _instance: "_LoopThread | None" = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=self.loop.run_forever, name="gc-caprover-io", daemon=True
+        )
+        thread.start()
+
+    @classmethod
+    def get(cls) -> "_LoopThread":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+class SyncCaprover:
+    """Blocking facade over an AsyncCaprover, for code written against CaproverAPI.
+
+    Any coroutine method becomes a blocking call run on the shared loop, so
+    calls from many threads overlap; other attributes (e.g. `root_domain`)
+    are passed through. Must not be called from the loop thread itself.
+    """
+
+    def __init__(self, client: AsyncCaprover, loop: _LoopThread | None = None):
+        self.async_client = client
+        self._loop = loop or _LoopThread.get()
+
+    @classmethod
+    def connect(cls, dashboard_url: str, password: str, **kwargs) -> "SyncCaprover":
+        loop = _LoopThread.get()
+        client = loop.run(AsyncCaprover.connect(dashboard_url, password, **kwargs))
+        return cls(client, loop)
+
+    def __getattr__(self, name):
+        attr = getattr(self.async_client, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._loop.run(attr(*args, **kwargs))
+
+        return call
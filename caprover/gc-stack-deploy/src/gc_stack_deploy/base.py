@@ -2,52 +2,90 @@
 
 AppSpec: Superclass for a deployable app (Postgres, Windmill, Redis, ...).
     Subclasses MUST override _install() and declare depends_on.
-    In rare cases, subclasses MAY want to override _uninstall() and/or check_installed()
+    Subclasses SHOULD describe what they change after the one-click deploy
+    as mutations(), so that plan() can diff it and update() apply just the deltas.
+    In rare cases, subclasses MAY want to override _uninstall() and/or status_from_definitions()
 
 DeploymentContext: shared, immutable-ish state (CapRover client, resolved
     postgres connection configs, dry_run flag) passed into every call instead
-    of being closed over.
+    of being closed over. Apps may run on concurrent threads, so anything
+    hung off it must be safe to share.
 
 TODO: Unit test these in isolation.  Assert install / uninstall calls on CapRover API.
 """
 
 import abc
 import logging
-import time
-from contextlib import contextmanager
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field, replace
 from enum import Enum
 
-import psycopg
+from .app_mutation import AppMutation
+from .caprover_cache import CachingCaprover
+from .certificates import CertificateQueue
+from .connections import ConnectionBudget
+from .deploy_tracker import deploy_one_click_app
+from .images import ImagePuller
+from .one_click import PUBLIC_ONE_CLICK_APP_PATH, OneClickDefinition, OneClickRepository
+from .plan import AppPlan, plan_app
+from .resources import ResourceBudget, ResourcePlan
+from .state import DeployState
+from . import tracing
+from .postgres import (  # noqa: F401 (re-exported)
+    DatabaseProvisioner,
+    PostgresConnectionConfig,
+    PostgresPool,
+    connect_with_retries,
+    postgres_patient_connect,
+)
 
 
 class AppStatus(str, Enum):
     NOT_INSTALLED = "not installed"
     INSTALLING = "installing"
     INSTALLED = "installed"
+    CONFIG_CHANGED = "config changed"  # installed, but not as the config now says
     FAILED = "failed"
     UNINSTALLING = "uninstalling"
 
 
 @dataclass
-class PostgresConnectionConfig:
-    """Connection info for a PostgreSQL server in a Docker container."""
-
-    host: str
-    user: str
-    password: str
-    ssl: bool
-    port: int = 5432
-
-    def connstr(self, dbname=None):
-        sslmode = "require" if self.ssl else "disable"
-        s = (
-            f"host={self.host} port={self.port} user={self.user} "
-            f"password={self.password} sslmode={sslmode}"
+class AppStatusInfo:
+    """An app's status as probed from CapRover, plus details of its main service."""
+
+    status: AppStatus
+    image: str | None = None
+    instance_count: int | None = None
+    ssl: bool | None = None
+    changed: tuple[str, ...] = ()  # for CONFIG_CHANGED: what differs (see state.py)
+    plan: AppPlan | None = None  # for a probe with plan=True: what an update would change
+
+    @classmethod
+    def from_definitions(cls, service_names, definitions: dict) -> "AppStatusInfo":
+        """Derive status from CapRover app definitions, keyed by app name.
+
+        The first of `service_names` is the app's main service. All of them
+        present means INSTALLED; only some present means a half-finished
+        install or uninstall, reported as FAILED.
+        """
+        present = [name for name in service_names if name in definitions]
+        if not present:
+            return cls(AppStatus.NOT_INSTALLED)
+        if len(present) < len(service_names):
+            return cls(AppStatus.FAILED)
+
+        main = definitions[service_names[0]]
+        deployed = [
+            v
+            for v in main.get("versions") or []
+            if v.get("version") == main.get("deployedVersion")
+        ]
+        return cls(
+            AppStatus.INSTALLED,
+            image=deployed[0].get("deployedImageName") if deployed else None,
+            instance_count=main.get("instanceCount"),
+            ssl=bool(main.get("hasDefaultSubDomainSsl")),
         )
-        if dbname:
-            s += f" dbname={dbname}"
-        return s
 
 
 @dataclass
@@ -57,63 +95,83 @@ class DeploymentContext:
     It gets passed to every app that needs to be installed / uninstalled
     """
 
-    caprover: "caprover_api.CaproverAPI"
+    caprover: CachingCaprover
     postgres_from_container: PostgresConnectionConfig
     postgres_from_vm: PostgresConnectionConfig
     gc_repository: str
     webapps_use_ssl: bool
     dry_run: bool
+    max_workers: int = 3  # how many apps may install / uninstall at the same time
+    readiness_timeout: float = 300  # seconds to wait for a service to come up
+    deploy_timeout: float = 1800  # seconds a one-click service may take to build and start
+    cancel: threading.Event = field(default_factory=threading.Event)  # set on quit
+    postgres_pool: PostgresPool | None = None  # None: waits readiness_timeout, stops on cancel
+    images: ImagePuller | None = None  # background pulls; None: CapRover pulls each image
+    certificates: CertificateQueue = field(default_factory=CertificateQueue)  # deferred SSL
+    one_click_apps: OneClickRepository | None = None  # definitions from gc_repository
+    public_one_click_apps: OneClickRepository | None = None  # ... from CapRover's own
+    trace_dir: str | None = None  # where each run's trace is written; None: not written
+    tracer: tracing.Tracer = field(default_factory=tracing.Tracer)  # latest run's spans
+    state: DeployState | None = None  # what each app was installed with; None: not tracked
+    resource_budget: ResourceBudget | None = None  # memory and CPUs the apps share
+    resources: ResourcePlan | None = None  # each service's share (see configured_apps)
+    postgres_pooler: PostgresConnectionConfig | None = None  # PgBouncer, for pooled apps
+    postgres_max_connections: int | None = None  # the server's; None: ask it (unless tuned)
+    connections: ConnectionBudget | None = None  # the apps' pools (see configured_apps)
+    provisioner: DatabaseProvisioner = field(init=False)
+
+    def __post_init__(self):
+        if self.one_click_apps is None:
+            self.one_click_apps = OneClickRepository(self.gc_repository)
+        if self.public_one_click_apps is None:
+            self.public_one_click_apps = OneClickRepository(PUBLIC_ONE_CLICK_APP_PATH)
+        if self.postgres_pool is None:
+            self.postgres_pool = PostgresPool(self.readiness_timeout, self.cancel)
+        # Script-side admin connections go through postgres_from_vm.
+        self.provisioner = DatabaseProvisioner(
+            self.postgres_pool, self.postgres_from_vm
+        )
 
 
-@contextmanager
-def postgres_patient_connect(*args, retries=10, delay_seconds=2, **kwargs):
-    """
-    Context manager that retries initial PostgreSQL connection (e.g. waits for server to be ready)
-
-    After successful connect, it does not retry or reconnect for subsequent errors
-    during the context block.
-
-    Parameters
-    ----------
-    *args :
-        Positional arguments passed directly to psycopg.connect.
-    retries : int, optional
-        Maximum number of connection attempts (default 10).
-    delay_seconds : int, optional
-        Base delay in seconds between retries.
-    **kwargs :
-        Keyword arguments passed directly to psycopg.connect.
-
-    Yields
-    ------
-    psycopg.Connection
-        A live PostgreSQL connection object.
-
-    Raises
-    ------
-    psycopg.OperationalError
-        If connection cannot be established after the given retries.
+def app_definitions_by_name(cap) -> dict[str, dict]:
+    """Fetch every CapRover app definition in a single API call."""
+    return {
+        app["appName"]: app for app in cap.list_apps()["data"]["appDefinitions"]
+    }
+
+
+def probe_statuses(
+    cap, specs, state: DeployState | None = None, plan: bool = False
+) -> dict[str, AppStatusInfo]:
+    """Status of every spec, keyed by one-click app name, from one API call.
+
+    With the deploy `state`, an installed app whose config changed since it
+    was installed is reported CONFIG_CHANGED. With `plan`, each installed app
+    is also diffed against its desired state (see plan.py): any difference is
+    reported CONFIG_CHANGED too, and the plan is attached to its status.
     """
-    last_exc = None
-    for attempt in range(1, retries + 1):
-        try:
-            with psycopg.connect(*args, **kwargs) as conn:
-                yield conn
-                return
-        except psycopg.OperationalError as e:
-            last_exc = e
-            if attempt < retries:
-                time.sleep(delay_seconds)
-            else:
-                raise last_exc
-
-
-def _psql_create_database_if_not_exists(cursor, dbname):
-    try:
-        q = psycopg.sql.SQL("CREATE DATABASE {}").format(psycopg.sql.Identifier(dbname))
-        cursor.execute(q)
-    except psycopg.errors.DuplicateDatabase:
-        pass
+    definitions = app_definitions_by_name(cap)
+    statuses = {}
+    for spec in specs:
+        info = spec.status_from_definitions(definitions)
+        if state is not None and info.status is AppStatus.INSTALLED:
+            changed = state.compare(spec, definitions)
+            if changed:
+                info = replace(info, status=AppStatus.CONFIG_CHANGED, changed=changed)
+        if plan and info.status in (AppStatus.INSTALLED, AppStatus.CONFIG_CHANGED):
+            try:
+                app_plan = spec.plan(definitions)
+            except Exception as e:  # e.g. the one-click repository is unreachable
+                logging.getLogger(__name__).warning(
+                    f"{spec.app_name}: could not plan an update: {e}"
+                )
+                app_plan = None
+            info = replace(info, plan=app_plan)
+            if app_plan is not None and not app_plan.empty:
+                changed = tuple(dict.fromkeys(info.changed + app_plan.fields()))
+                info = replace(info, status=AppStatus.CONFIG_CHANGED, changed=changed)
+        statuses[spec.one_click_app_name] = info
+    return statuses
 
 
 class AppSpec(abc.ABC):
@@ -123,18 +181,36 @@ class AppSpec(abc.ABC):
     it wraps), zero or more `databases` it needs to exist before install, and implements
     `_install()` with its app-specific calls.
 
-    Database provisioning (via `databases`) is idempotent and independent
-    of whether this app's own Postgres server was deployed by this run
-    or already existed: `install()` always ensures the databases are
-    present before delegating to `_install()`.
+    Database provisioning (via `databases` and `provisioning_sql()`) is
+    idempotent and independent of whether this app's own Postgres server was
+    deployed by this run or already existed: `install()` always ensures the
+    databases are present before delegating to `_install()`. When the whole
+    batch was planned up front (see DatabaseProvisioner), one session covers
+    every app.
 
-    `depends_on` is only declarative at this point: nothing currently
-    reads it to enforce install ordering.
+    `depends_on` names the one-click apps that must finish installing first
+    (see orchestrator.py). Apps with no dependency between them may install
+    concurrently, so `_install()` must not assume it runs alone.
     """
 
     one_click_app_name: str
     depends_on: tuple[str] = ()
     databases: tuple[str] = ()
+    # CapRover apps the one-click app creates, as suffixes to `app_name`.
+    # The first is the main (web-facing) service.
+    service_suffixes: tuple[str] = ("",)
+    # One-click app variable holding the docker image, for apps whose image
+    # is worth pulling ahead of the deploy (see images.py).
+    image_variable: str | None = None
+    # False for one-click apps from CapRover's public repository: plan()
+    # then diffs their mutations() only.
+    uses_gc_repository: bool = True
+    # Weight of each service (by suffix) in dividing the VM's memory and
+    # CPUs between the apps (see resources.py).
+    resource_profile: dict[str, float] = {"": 1.0}
+    # True for apps whose services may reach Postgres through PgBouncer, when
+    # the stack has one (see PgBouncerApp).
+    pools_through_pgbouncer: bool = False
 
     def __init__(self, app_config, ctx: DeploymentContext):
         """Bind this app to a deployment context."""
@@ -148,40 +224,205 @@ class AppSpec(abc.ABC):
     def app_name(self) -> str:
         return self.app_cfg.get("app_name", self.one_click_app_name)
 
+    @property
+    def service_names(self) -> list[str]:
+        return [self.app_name + suffix for suffix in self.service_suffixes]
+
+    @property
+    def deployed_service_names(self) -> list[str]:
+        """`service_names`, plus the services of the app's own (see deployed_services)."""
+        return self.service_names
+
+    def status_from_definitions(self, definitions: dict) -> AppStatusInfo:
+        """Work out this app's status from already-fetched CapRover app definitions."""
+        return AppStatusInfo.from_definitions(self.service_names, definitions)
+
     def check_installed(self) -> AppStatus:
-        """Query CapRover for this app's current status."""
-        return (
-            AppStatus.INSTALLED
-            if self.ctx.caprover.get_app(self.app_name)
-            else AppStatus.NOT_INSTALLED
+        """Query CapRover for this app's current status.
+
+        To probe many apps, use `probe_statuses()` instead: it costs one API call in total.
+        """
+        return probe_statuses(self.ctx.caprover, [self])[self.one_click_app_name].status
+
+    def app_variables(self) -> dict:
+        """The one-click app variables this app is deployed with."""
+        return {}
+
+    def postgres_connections(self) -> int:
+        """How many Postgres connections this app's pools may open at once, all told.
+
+        What the server's max_connections must allow for (see connections.py).
+        """
+        return 0
+
+    @property
+    def pooled(self) -> bool:
+        """Do this app's services reach Postgres through PgBouncer?"""
+        return self.pools_through_pgbouncer and self.ctx.postgres_pooler is not None
+
+    @property
+    def postgres_for_services(self) -> PostgresConnectionConfig:
+        """Where this app's services connect to Postgres: PgBouncer, or the server."""
+        return self.ctx.postgres_pooler if self.pooled else self.ctx.postgres_from_container
+
+    @property
+    def instance_counts(self) -> dict[str, int]:
+        """How many instances each service runs, by suffix, where not one."""
+        return {}
+
+    def deployed_services(self, rendered: dict) -> dict:
+        """The services this app deploys, given its rendered one-click definition.
+
+        Override to adjust them, or to add services of the app's own (a
+        service missing from CapRover that is not one of `service_names` is
+        then added by an update, see plan.py).
+        """
+        return rendered
+
+    def obsolete_services(self, definitions: dict) -> list[str]:
+        """CapRover apps this app deployed, but that its config no longer wants.
+
+        An update deletes them.
+        """
+        return []
+
+    def one_click_definition(self) -> OneClickDefinition:
+        """This app's one-click definition from the GC repository (fetched once per run)."""
+        return self.ctx.one_click_apps.get(self.one_click_app_name)
+
+    def docker_image(self) -> str | None:
+        """The image this app will deploy: the config override, else the one-click default."""
+        if self.image_variable is None:
+            return None
+        return self.app_variables().get(
+            self.image_variable
+        ) or self.one_click_definition().default(self.image_variable)
+
+    def mutations(self) -> list[AppMutation]:
+        """What _install() changes on the deployed services after the one-click deploy.
+
+        Built fresh on every call, from the current config. `apply_mutations()`
+        applies them; `plan()` renders them into the desired state.
+        """
+        return []
+
+    def resource_limits(self, service_name: str, default=None):
+        """serviceUpdateOverride transform for `service_name`'s planned resources.
+
+        Returns `default` if no resources were planned for it.
+        """
+        allocation = self.ctx.resources and self.ctx.resources.allocation(service_name)
+        return allocation.transform() if allocation else default
+
+    def apply_mutations(self) -> None:
+        for mutation in self.mutations():
+            mutation.apply(self.ctx.caprover, self.ctx.certificates)
+
+    def plan(self, definitions: dict | None = None) -> AppPlan:
+        """What an update would change, against `definitions` (fetched if not given)."""
+        if definitions is None:
+            definitions = app_definitions_by_name(self.ctx.caprover)
+        return plan_app(self, definitions)
+
+    def deploy_one_click(
+        self,
+        app_variables: dict,
+        one_click_repository: str | None = None,
+        environment: dict | None = None,
+    ) -> None:
+        """Deploy this app's one-click definition; return once every service it creates is up.
+
+        From CapRover's public repository unless `one_click_repository` is given.
+        Progress is polled rather than waited on (see deploy_tracker.py), so
+        large images and slow init scripts get `ctx.deploy_timeout` per service.
+        `environment` is added to the app's own service, so the deployed
+        version that is waited on already runs with it.
+        """
+
+        def adapt(rendered: dict) -> dict:
+            services = self.deployed_services(rendered)
+            if environment:
+                service = dict(services[self.app_name])
+                service["environment"] = {**(service.get("environment") or {}), **environment}
+                services = {**services, self.app_name: service}
+            return services
+
+        if one_click_repository is None:
+            repository = self.ctx.public_one_click_apps
+        elif one_click_repository == self.ctx.one_click_apps.repository:
+            repository = self.ctx.one_click_apps
+        else:
+            repository = OneClickRepository(one_click_repository)
+        deploy_one_click_app(
+            self.ctx.caprover,
+            repository.get(self.one_click_app_name),
+            self.app_name,
+            app_variables,
+            timeout=self.ctx.deploy_timeout,
+            cancel=self.ctx.cancel,
+            adapt=adapt,
         )
 
-    def install(self) -> None:
-        self.logger.info(f"Beginning install of {self.app_name}")
-        if self.databases and not self.ctx.dry_run:
-            with (
-                postgres_patient_connect(
-                    self.ctx.postgres_from_vm.connstr(), autocommit=True
-                ) as conn,
-                conn.cursor() as cur,
-            ):
-                for dbname in self.databases:
-                    _psql_create_database_if_not_exists(cur, dbname)
+    def provisioning_sql(self) -> list:
+        """Role and grant statements to run as the Postgres admin before install.
 
-        self._install()  # subclass-specific logic
+        They run once per batch, in the same session that creates `databases`
+        (which already exist by then). Re-creating an existing role is tolerated.
+        """
+        return []
 
-        self.logger.info(f"Finished install of {self.app_name}")
+    def install(self) -> None:
+        with tracing.span("install", "app", app=self.app_name):
+            self.logger.info(f"Beginning install of {self.app_name}")
+            if (self.databases or self.provisioning_sql()) and not self.ctx.dry_run:
+                # Usually a no-op: the batch was provisioned when the first app got here.
+                self.ctx.provisioner.ensure(self.databases, self.provisioning_sql())
+            if self.image_variable and self.ctx.images and not self.ctx.dry_run:
+                # Pulling since the run started; usually done by now.
+                with tracing.span("image wait", "docker"):
+                    self.ctx.images.wait(self, cancel=self.ctx.cancel)
+
+            self._install()  # subclass-specific logic
+
+            self.logger.info(f"Finished install of {self.app_name}")
+
+    def update(self) -> None:
+        """Bring an installed app to its desired state, changing only what differs.
+
+        Unlike a reinstall, nothing the config still wants is deleted, so no
+        data is lost; services of the app's own are added or removed as the
+        config says (see `deployed_services()`). Any other service missing
+        from CapRover can't be updated; reinstall the app instead.
+        """
+        with tracing.span("update", "app", app=self.app_name):
+            self.logger.info(f"Beginning update of {self.app_name}")
+            if (self.databases or self.provisioning_sql()) and not self.ctx.dry_run:
+                self.ctx.provisioner.ensure(self.databases, self.provisioning_sql())
+            plan = self.plan()
+            for line in plan.lines() or ["already up to date"]:
+                self.logger.info(line)
+            if not self.ctx.dry_run:
+                plan.apply(
+                    self.ctx.caprover,
+                    self.ctx.certificates,
+                    timeout=self.ctx.deploy_timeout,
+                    cancel=self.ctx.cancel,
+                )
+            self.logger.info(f"Finished update of {self.app_name}")
 
     @abc.abstractmethod
     def _install(self) -> None:
         """App-specific install steps. Called by install() after
-        this app's `databases` have been created. Do not call directly."""
+        this app's `databases` have been created. Do not call directly.
+
+        For other Postgres work, borrow a connection from `self.ctx.postgres_pool`."""
         raise NotImplementedError()
 
     def uninstall(self) -> None:
-        self.logger.info(f"Beginning uninstall of {self.app_name}")
-        self._uninstall()
-        self.logger.info(f"Finished uninstall of {self.app_name}")
+        with tracing.span("uninstall", "app", app=self.app_name):
+            self.logger.info(f"Beginning uninstall of {self.app_name}")
+            self._uninstall()
+            self.logger.info(f"Finished uninstall of {self.app_name}")
 
     def _uninstall(self) -> None:
         """Uninstall the app from caprover.
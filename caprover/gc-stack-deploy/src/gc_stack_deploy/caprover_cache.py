@@ -0,0 +1,171 @@
+"""Per-run cache of CapRover app definitions.
+
+CaproverAPI has no way to fetch a single app: `get_app()` downloads every app
+definition and picks one out. Over a run we ask for definitions many times
+(verifying Postgres, probing status, before every serviceUpdateOverride patch),
+so CachingCaprover keeps one snapshot of the list and serves reads from it.
+
+Writes go straight through to CapRover. After a write, only the apps it
+touched are marked stale (or patched, for deletions); reading a stale app refreshes the snapshot, while
+reads of every other app keep hitting the cache.
+"""
+
+import copy
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CachingCaprover:
+    """Wraps a `caprover_api.CaproverAPI`, caching app definitions between writes.
+
+    Anything not overridden here (e.g. `root_domain`) is delegated to the
+    wrapped client unchanged. Safe to share between threads.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.RLock()
+        self._response = None  # last list_apps() response, definitions as-is
+        self._definitions: dict[str, dict] | None = None
+        self._stale_names: set[str] = set()
+        self._stale_prefixes: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    # --- reads -------------------------------------------------------------
+
+    def _is_stale(self, app_name: str) -> bool:
+        return app_name in self._stale_names or any(
+            app_name.startswith(p) for p in self._stale_prefixes
+        )
+
+    def _snapshot(self, app_name: str | None = None) -> dict[str, dict]:
+        """Definitions by name, fetched only if missing or stale.
+
+        With `app_name`, only that app's staleness matters; without it the
+        caller wants every app, so any stale entry forces a refresh.
+        """
+        with self._lock:
+            if app_name is None:
+                stale = bool(self._stale_names or self._stale_prefixes)
+            else:
+                stale = self._is_stale(app_name)
+            if self._definitions is None or stale:
+                self.misses += 1
+                self._response = self._client.list_apps()
+                self._definitions = {
+                    app["appName"]: app
+                    for app in self._response["data"]["appDefinitions"]
+                }
+                self._stale_names.clear()
+                self._stale_prefixes.clear()
+            else:
+                self.hits += 1
+            return self._definitions
+
+    def list_apps(self):
+        with self._lock:
+            definitions = self._snapshot()
+            return {
+                **self._response,
+                "data": {
+                    **self._response["data"],
+                    "appDefinitions": copy.deepcopy(list(definitions.values())),
+                },
+            }
+
+    def get_app(self, app_name: str):
+        with self._lock:
+            return copy.deepcopy(self._snapshot(app_name).get(app_name, {}))
+
+    # --- write-through -----------------------------------------------------
+
+    def _invalidate(self, app_name: str | None = None, prefix: bool = False) -> None:
+        """Mark one app (or every app starting with `app_name`) stale; no name means all."""
+        with self._lock:
+            if app_name is None:
+                self._definitions = None
+            elif prefix:
+                self._stale_prefixes.add(app_name)
+            else:
+                self._stale_names.add(app_name)
+
+    def _write_through(self, method: str, app_name: str, *args, **kwargs):
+        """Call a write on the wrapped client, then mark `app_name` stale.
+
+        Invalidates even if the call raised: CapRover may have applied part of it.
+        """
+        try:
+            return getattr(self._client, method)(app_name, *args, **kwargs)
+        finally:
+            self._invalidate(app_name)
+
+    def update_app(self, app_name: str, *args, **kwargs):
+        return self._write_through("update_app", app_name, *args, **kwargs)
+
+    def enable_ssl(self, app_name: str, *args, **kwargs):
+        return self._write_through("enable_ssl", app_name, *args, **kwargs)
+
+    def add_domain(self, app_name: str, *args, **kwargs):
+        return self._write_through("add_domain", app_name, *args, **kwargs)
+
+    def create_app(self, app_name: str, *args, **kwargs):
+        return self._write_through("create_app", app_name, *args, **kwargs)
+
+    def deploy_app(self, app_name: str, *args, **kwargs):
+        return self._write_through("deploy_app", app_name, *args, **kwargs)
+
+    def delete_app(self, app_name: str, *args, **kwargs):
+        try:
+            result = self._client.delete_app(app_name, *args, **kwargs)
+        except Exception:
+            self._invalidate(app_name)
+            raise
+        with self._lock:
+            if self._definitions is not None:
+                self._definitions.pop(app_name, None)
+        return result
+
+    def deploy_one_click_app(self, *args, **kwargs):
+        """Deploy, then mark every service the one-click app may have created stale.
+
+        Services are named `<app_name>`, `<app_name>-worker`, etc., so a prefix covers them.
+        """
+        app_name = kwargs.get("app_name", args[1] if len(args) > 1 else None)
+        try:
+            return self._client.deploy_one_click_app(*args, **kwargs)
+        finally:
+            self._invalidate(app_name, prefix=True)
+
+    def delete_app_matching_pattern(self, app_name_pattern: str, *args, **kwargs):
+        try:
+            result = self._client.delete_app_matching_pattern(
+                app_name_pattern, *args, **kwargs
+            )
+        except Exception:
+            self._invalidate()
+            raise
+        automated = kwargs.get("automated", args[1] if len(args) > 1 else False)
+        with self._lock:
+            if not automated or self._definitions is None:
+                # The user may have declined some deletions: we can't know which.
+                self._invalidate()
+            else:
+                self._definitions = {
+                    name: app
+                    for name, app in self._definitions.items()
+                    if not re.search(app_name_pattern, name)
+                }
+        return result
+
+    def log_stats(self) -> None:
+        logger.info(
+            f"CapRover app definitions: {self.hits} reads served from cache, "
+            f"{self.misses} fetched"
+        )
@@ -0,0 +1,157 @@
+"""Issue SSL certificates in a stage of their own, once the apps are up.
+
+Enabling SSL on a CapRover app makes CapRover obtain a Let's Encrypt
+certificate there and then: the call blocks on the HTTP-01 challenge, which
+only passes once the app answers on its domain. Made inline, every install
+waited on its certificates before anything depending on it could start.
+
+Instead, while a CertificateQueue is collecting (run_deploy() starts it),
+AppMutation.apply() adds its domains and hands the SSL work to the queue.
+Once every install has finished, `issue()` works through the queue a few
+apps at a time:
+
+- domains that already have a certificate are skipped;
+- a failed issuance is retried with backoff, a few times only: Let's Encrypt
+  allows 5 failed validations per hostname per hour;
+- once all of an app's certificates are in place, the settings that need
+  them (`force_ssl`) are applied.
+
+When the queue is not collecting, SSL is enabled inline as before.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from . import tracing
+from .readiness import Backoff, ReadinessCancelled
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CertificateRequest:
+    app_name: str
+    domains: list[str | None] = field(default_factory=list)  # None: the base domain
+    settings: dict = field(default_factory=dict)  # update_app settings needing SSL
+
+
+def _certified(definition: dict) -> set[str | None]:
+    """Domains of an app definition that already have a certificate."""
+    have = {None} if definition.get("hasDefaultSubDomainSsl") else set()
+    for domain in definition.get("customDomain") or []:
+        if domain.get("hasSsl"):
+            have.add(domain["publicDomain"])
+    return have
+
+
+class CertificateQueue:
+    """SSL certificates to issue after the installs, at most `max_workers` apps at a time.
+
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self, max_workers: int = 2, attempts: int = 3, backoff: Backoff | None = None
+    ):
+        self.max_workers = max_workers
+        self.attempts = attempts
+        # Let's Encrypt rate-limits failures: never retry sooner than 15s.
+        self.backoff = backoff or Backoff(initial=30, maximum=300, equal_jitter=True)
+        self._lock = threading.Lock()
+        self._requests: dict[str, CertificateRequest] | None = None  # None: not collecting
+
+    def collect(self) -> None:
+        """Start queueing SSL work instead of letting it run inline."""
+        with self._lock:
+            if self._requests is None:
+                self._requests = {}
+
+    def close(self) -> None:
+        """Stop queueing; anything still queued is dropped."""
+        with self._lock:
+            self._requests = None
+
+    def defer(self, app_name: str, domains, settings: dict) -> bool:
+        """Queue certificates for `domains` of `app_name`, then `settings`.
+
+        Returns False if the queue is not collecting: the caller should
+        enable SSL itself.
+        """
+        with self._lock:
+            if self._requests is None:
+                return False
+            request = self._requests.setdefault(app_name, CertificateRequest(app_name))
+            request.domains += [d for d in domains if d not in request.domains]
+            request.settings.update(settings)
+        logger.info(f"{app_name}: SSL queued until the installs are done")
+        return True
+
+    def issue(self, cap, cancel: threading.Event | None = None) -> dict[str, Exception]:
+        """Issue every queued certificate; the queue is left empty.
+
+        Returns
+        -------
+        The error per CapRover app whose certificates could not all be issued.
+        """
+        with self._lock:
+            requests = list((self._requests or {}).values())
+            if self._requests is not None:
+                self._requests = {}
+        if not requests:
+            return {}
+
+        logger.info(f"Issuing SSL certificates for {len(requests)} apps")
+        failures = {}
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="gc-ssl"
+        ) as pool:
+            futures = {
+                request.app_name: pool.submit(
+                    contextvars.copy_context().run, self._issue, cap, request, cancel
+                )
+                for request in requests
+            }
+            for app_name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"{app_name}: SSL could not be enabled: {e}")
+                    failures[app_name] = e
+        return failures
+
+    def _issue(self, cap, request: CertificateRequest, cancel) -> None:
+        with tracing.span("ssl", "ssl", app=request.app_name):
+            have = _certified(cap.get_app(request.app_name))
+            for domain in request.domains:
+                label = domain or f"{request.app_name} (base domain)"
+                if domain in have:
+                    logger.info(f"{label}: already has a certificate")
+                    continue
+                self._enable(cap, request.app_name, domain, label, cancel)
+                logger.info(f"{label}: certificate issued")
+            if request.settings:
+                cap.update_app(request.app_name, **request.settings)
+
+    def _enable(self, cap, app_name: str, domain: str | None, label: str, cancel) -> None:
+        delays = self.backoff.delays()
+        for attempt in range(1, self.attempts + 1):
+            try:
+                if domain is None:
+                    cap.enable_ssl(app_name)
+                else:
+                    cap.enable_ssl(app_name, domain)
+                return
+            except Exception as e:
+                if attempt == self.attempts:
+                    raise
+                delay = next(delays)
+                logger.warning(
+                    f"{label}: SSL attempt {attempt} of {self.attempts} failed ({e}); "
+                    f"retrying in {delay:.0f}s"
+                )
+            # Event.wait doubles as an interruptible sleep.
+            if (cancel or threading.Event()).wait(delay):
+                raise ReadinessCancelled(f"Cancelled while enabling SSL for {label}")
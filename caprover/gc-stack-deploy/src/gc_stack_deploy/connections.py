@@ -0,0 +1,96 @@
+"""Check that the apps' Postgres connection pools fit what the server allows.
+
+Every app holds its own pools: Windmill one per service (DATABASE_CONNECTIONS),
+Superset a SQLAlchemy pool per process, the landing page and Explorer a
+node-postgres pool each. Together they may open more connections than the
+server's `max_connections`, and the app that asks last gets "too many
+clients" errors at some random later time.
+
+Before a deploy, a ConnectionBudget totals each configured app's pool sizes
+(`AppSpec.postgres_connections()`) against the server:
+
+- apps behind PgBouncer count against its `max_client_connections`; the
+  server only sees PgBouncer's own pool (see PgBouncerApp);
+- the other apps, and that pool, count against `max_connections`, less the
+  connections Postgres keeps for superusers (this script among them).
+
+Over 80% of either is worth a warning; over 100% fails the deploy.
+"""
+
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+SUPERUSER_RESERVED = 3  # Postgres' superuser_reserved_connections default
+WARN_AT = 0.8
+
+
+@dataclass
+class ConnectionBudget:
+    max_connections: int  # the server's
+    server: dict[str, int] = field(default_factory=dict)  # per app, on the server
+    pooled: dict[str, int] = field(default_factory=dict)  # per app, on PgBouncer
+    max_client_connections: int | None = None  # PgBouncer's; None: no PgBouncer
+
+    @property
+    def available(self) -> int:
+        return self.max_connections - SUPERUSER_RESERVED
+
+    def _totals(self) -> list[tuple[str, int, int]]:
+        totals = [("Postgres", sum(self.server.values()), self.available)]
+        if self.max_client_connections is not None:
+            totals.append(
+                ("PgBouncer", sum(self.pooled.values()), self.max_client_connections)
+            )
+        return totals
+
+    def lines(self) -> list[str]:
+        """Each app's pools, then the total against each server's limit."""
+        lines = []
+        for name, pools in (("Postgres", self.server), ("PgBouncer", self.pooled)):
+            if pools:
+                detail = ", ".join(f"{app} {n}" for app, n in pools.items())
+                lines.append(f"{name} connections: {detail}")
+        for name, used, limit in self._totals():
+            lines.append(f"{name} connections: {used} of {limit}")
+        return lines
+
+    def check(self) -> bool:
+        """Log the budget; False if the pools may open more connections than allowed."""
+        for line in self.lines():
+            logger.info(line)
+        ok = True
+        for name, used, limit in self._totals():
+            if used > limit:
+                logger.error(
+                    f"The apps' pools may open {used} connections to {name}, "
+                    f"which allows {limit}: lower their pool sizes, put them behind "
+                    f"PgBouncer, or raise postgres.max_connections"
+                )
+                ok = False
+            elif used > WARN_AT * limit:
+                logger.warning(
+                    f"The apps' pools may open {used} connections to {name}, "
+                    f"close to the {limit} it allows"
+                )
+        return ok
+
+
+def connection_budget(
+    specs, max_connections: int, max_client_connections: int | None = None
+) -> ConnectionBudget:
+    """The budget of `specs` (every configured app) on a server allowing `max_connections`.
+
+    `max_client_connections` is PgBouncer's, if there is one.
+    """
+    budget = ConnectionBudget(max_connections, max_client_connections=max_client_connections)
+    for spec in specs:
+        connections = spec.postgres_connections()
+        if not connections:
+            continue
+        if spec.pooled:
+            budget.pooled[spec.app_name] = connections
+        else:
+            budget.server[spec.app_name] = connections
+    return budget
@@ -0,0 +1,188 @@
+"""Deploy one-click apps without trusting the length of an HTTP call.
+
+CaproverAPI.deploy_one_click_app() deploys each service with a blocking call
+that gives up after 60 seconds of building. A large image (Windmill,
+Superset) or a long `docker-init.sh` makes it fail while CapRover carries on
+and, more often than not, succeeds; the services after it are then never
+deployed at all.
+
+`deploy_one_click_app()` here renders the one-click definition itself (see
+one_click.py), creates and configures every service, and submits each deploy
+without waiting for it. A DeployTracker then polls every service the app
+creates, logging progress as it changes:
+
+    submitted -> building -> built -> starting -> running
+
+"built" is CapRover's word: the build is over and the new version is the
+deployed one. "running" is Docker's: the Swarm service has converged on a
+running task (checked only where this script runs on the CapRover host;
+elsewhere "built" is where a service is done). A service's dependents
+(`depends_on`) are submitted as soon as it is built.
+
+Success or failure comes from what CapRover and Docker report: a failed
+build fails at once, and a service that is not done within `timeout`
+seconds of its submission times out. Long deploys no longer fail early, and
+short ones are done as soon as they are.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+from . import tracing
+from .one_click import OneClickDefinition, service_settings
+from .readiness import Backoff, ReadinessCancelled, ReadinessTimeout, docker_service_running
+
+logger = logging.getLogger(__name__)
+
+_BUILT = ("built", "starting", "running")
+
+
+class DeployFailed(RuntimeError):
+    """CapRover reports that a service's build failed."""
+
+
+class DeployTracker:
+    """Submits the services of one rendered one-click app and follows them to the end."""
+
+    def __init__(
+        self,
+        cap,
+        services: dict[str, dict],
+        *,
+        timeout: float,
+        cancel: threading.Event | None = None,
+        backoff: Backoff | None = None,
+        check_containers: bool = True,
+        progress_interval: float = 30,
+    ):
+        self.cap = cap
+        self.services = services
+        self.timeout = timeout
+        self.cancel = cancel or threading.Event()
+        self.backoff = backoff or Backoff(initial=1, maximum=5)
+        self.check_containers = check_containers
+        self.progress_interval = progress_interval
+        self.phase = {name: "waiting" for name in services}
+        self._submitted_at: dict[str, float] = {}
+        self._version: dict[str, int] = {}  # the version each deploy will create
+        self._reported_at: dict[str, float] = {}
+
+    def run(self) -> None:
+        """Submit every service in dependency order; return once all are done.
+
+        Raises
+        ------
+        DeployFailed
+            If CapRover reports a failed build.
+        ReadinessTimeout
+            If a service is not done `timeout` seconds after its submission.
+        ReadinessCancelled
+            If `cancel` is set meanwhile.
+        """
+        delays = self.backoff.delays()
+        while True:
+            if self.cancel.is_set():
+                raise ReadinessCancelled("Cancelled while deploying " + ", ".join(self.services))
+            for name, service in self.services.items():
+                if self.phase[name] == "waiting" and self._prerequisites_built(service):
+                    self._submit(name, service)
+            self._poll()
+            pending = [name for name in self.services if not self._done(name)]
+            if not pending:
+                return
+            now = time.monotonic()
+            for name in pending:
+                started = self._submitted_at.get(name)
+                if started is not None and now - started > self.timeout:
+                    raise ReadinessTimeout(
+                        f"{name} still {self.phase[name]} after {self.timeout:.0f}s"
+                    )
+            self.cancel.wait(next(delays))
+
+    def _done(self, name: str) -> bool:
+        phase = self.phase[name]
+        return phase == "running" or (phase in _BUILT and not self.check_containers)
+
+    def _prerequisites_built(self, service: dict) -> bool:
+        return all(
+            self.phase.get(dep, "built") in _BUILT
+            for dep in service.get("depends_on") or []
+        )
+
+    def _submit(self, name: str, service: dict) -> None:
+        cap = self.cap
+        cap.create_app(name, has_persistent_data=bool(service.get("volumes")))
+        cap.update_app(name, **service_settings(service))
+        self._version[name] = len(cap.get_app(name).get("versions") or [])
+        docker_file_lines = (service.get("caproverExtra") or {}).get("dockerfileLines")
+        cap.deploy_app(
+            name,
+            image_name=service.get("image"),
+            docker_file_lines=docker_file_lines,
+            wait_for_app_build=False,
+        )
+        self._submitted_at[name] = time.monotonic()
+        self._set_phase(name, "submitted")
+
+    def _poll(self) -> None:
+        for name in self._submitted_at:
+            phase = self.phase[name]
+            if phase == "running":
+                continue
+            if phase not in _BUILT:
+                data = self.cap.get_app_info(name).get("data") or {}
+                if data.get("isBuildFailed"):
+                    raise DeployFailed(f"CapRover build of {name} failed")
+                if data.get("isAppBuilding") or not self._deployed(name):
+                    self._set_phase(name, "building")
+                    continue
+                self._set_phase(name, "built")
+            if self.check_containers:
+                running = docker_service_running(name)
+                if running is None:
+                    # Not the CapRover host: CapRover's word is all there is.
+                    self.check_containers = False
+                else:
+                    self._set_phase(name, "running" if running else "starting")
+
+    def _deployed(self, name: str) -> bool:
+        """Has the version our deploy created become the deployed one?"""
+        definition = self.cap.get_app(name)
+        return definition.get("deployedVersion") == self._version[name] and any(
+            v.get("version") == self._version[name] for v in definition.get("versions") or []
+        )
+
+    def _set_phase(self, name: str, phase: str) -> None:
+        now = time.monotonic()
+        elapsed = now - self._submitted_at.get(name, now)
+        if phase != self.phase[name]:
+            self.phase[name] = phase
+            self._reported_at[name] = now
+            logger.info(f"{name}: {phase} ({elapsed:.0f}s)")
+        elif now - self._reported_at.get(name, now) >= self.progress_interval:
+            self._reported_at[name] = now
+            logger.info(f"{name}: still {phase} ({elapsed:.0f}s)")
+
+
+def deploy_one_click_app(
+    cap,
+    definition: OneClickDefinition,
+    app_name: str,
+    app_variables: dict,
+    *,
+    timeout: float,
+    cancel: threading.Event | None = None,
+    adapt: Callable[[dict], dict] | None = None,
+) -> None:
+    """Deploy every service of a one-click app, and wait until each is done.
+
+    See DeployTracker.run() for what is raised. `adapt`, if given, maps the
+    rendered services to those actually deployed (see AppSpec.deployed_services).
+    """
+    services = definition.render(app_name, app_variables, cap.root_domain)
+    if adapt is not None:
+        services = adapt(services)
+    with tracing.span("one-click deploy", "caprover", services=len(services)):
+        DeployTracker(cap, services, timeout=timeout, cancel=cancel).run()
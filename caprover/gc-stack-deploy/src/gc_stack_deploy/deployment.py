@@ -0,0 +1,191 @@
+"""Build the DeploymentContext of a run from a stack config."""
+
+import json
+import logging
+from dataclasses import replace
+
+from caprover_api import caprover_api
+
+from .apps_registry import PostgresApp
+from .base import DeploymentContext, PostgresConnectionConfig
+from .caprover_cache import CachingCaprover
+from .images import ImagePuller, caprover_runs_here
+from .one_click import OneClickRepository
+from .orchestrator import parallel_limit
+from .resources import ResourceBudget
+from .state import DeployState
+from .tracing import TracedCaprover
+
+logger = logging.getLogger(__name__)
+
+
+class CaproverClient(caprover_api.CaproverAPI):
+    """CaproverAPI, plus deploys that return once submitted (see deploy_tracker.py)."""
+
+    def deploy_app(
+        self,
+        app_name: str,
+        image_name: str = None,
+        docker_file_lines: list = None,
+        wait_for_app_build: bool = True,
+    ):
+        if wait_for_app_build:
+            return super().deploy_app(app_name, image_name, docker_file_lines)
+        return self._submit_deploy(app_name, image_name, docker_file_lines)
+
+    @caprover_api.retry(times=3, exceptions=caprover_api.CaproverAPI.COMMON_ERRORS)
+    def _submit_deploy(self, app_name: str, image_name, docker_file_lines):
+        # CaproverAPI.deploy_app's request, with CapRover's `detached` flag
+        # (as CaproverAPI.create_app sends it): the build then runs on its own.
+        if image_name:
+            definition = {"schemaVersion": self.schema_version, "imageName": image_name}
+        elif docker_file_lines:
+            definition = {
+                "schemaVersion": self.schema_version,
+                "dockerfileLines": docker_file_lines,
+            }
+        else:
+            definition = {}
+        response = self.session.post(
+            f"{self.base_url}{self.APP_DATA_PATH}/{app_name}",
+            headers=self.headers,
+            params={"detached": "1"},
+            data=json.dumps(
+                {"captainDefinitionContent": json.dumps(definition), "gitHash": ""}
+            ),
+        )
+        return self._check_errors(response.json())
+
+
+def _verify_existing_postgres_app(
+    cap, pg_app_name, postgres_from_container, postgres_from_vm
+):
+    """
+    If the pg_app_name app exists in CapRover, sanity-check that its configuration
+    (host and port) match what was parsed from YAML `from_container`/`from_vm`
+
+    Warn on mismatch. We don't fail (but maybe we should).
+    """
+    # FIXME: this check short-circuits when we are deploying a local Postgres
+    # and downstream apps in the same go, even though we could have benefited from
+    # these important checks.
+    app = cap.get_app(pg_app_name)
+    if not app:
+        # No `postgres` app in CapRover — external Postgres or has not been deployed yet.
+        return
+
+    if postgres_from_container.host != "srv-captain--postgres":
+        logger.warn(
+            f"===== A `{pg_app_name}` app exists in CapRover, but from_container.host is "
+            f"{postgres_from_container.host!r} (expected 'srv-captain--postgres'). "
+            f"Downstream apps may fail to connect. ====="
+        )
+
+    mappings = app.get("ports") or []
+    host_ports = [
+        int(m["hostPort"])
+        for m in mappings
+        if int(m.get("containerPort", 0)) == postgres_from_container.port
+    ]
+    if host_ports and postgres_from_vm.port not in host_ports:
+        logger.warn(
+            f"===== Deployed `postgres` app maps host port(s) {host_ports} -> "
+            f"{postgres_from_container.port}, but from_vm.port="
+            f"{postgres_from_vm.port} in YAML. The script's bare-metal "
+            f"connection will likely fail. Update from_vm.port to match. ====="
+        )
+
+
+def build_deployment_context(
+    config,
+    gc_repository,
+    dry_run,
+    trace_dir=None,
+    one_click_apps=None,
+    async_client=False,
+    state_path=None,
+    detect_host=True,
+):
+    # One-click definitions from our repository are fetched once and stored on disk.
+    if one_click_apps is None:
+        one_click_apps = OneClickRepository(gc_repository)
+    # Initialize CapRover API with URL and password from config.
+    if async_client:
+        # Same interface, but every call shares one event loop and connection pool.
+        from .async_caprover import SyncCaprover
+
+        client = SyncCaprover.connect(config["caproverUrl"], config["caproverPassword"])
+        one_click_apps.serve_downloads_for(client.async_client)
+    else:
+        client = CaproverClient(
+            dashboard_url=config["caproverUrl"], password=config["caproverPassword"]
+        )
+        one_click_apps.serve_downloads_for(client)
+    # Every app definition read during the run is then served from one cached snapshot.
+    cap = CachingCaprover(TracedCaprover(client))
+
+    # this is the connection to be used by inter-container networking:
+    # i.e. how other CapRover apps reach Postgres. Used in connection strings.
+    postgres_from_container = PostgresConnectionConfig(
+        host=config["postgres"]["from_container"]["host"],
+        port=int(config["postgres"]["from_container"]["port"]),
+        user=config["postgres"]["user"],
+        password=config["postgres"]["pass"],
+        ssl=bool(config["postgres"]["from_container"]["ssl"]),
+    )
+    # this is the connection to be used from this script (which runs on the host).
+    # Used for one-time setup of databases, users, etc.
+    postgres_from_vm = PostgresConnectionConfig(
+        host=config["postgres"]["from_vm"]["host"],
+        port=int(config["postgres"]["from_vm"]["port"]),
+        user=config["postgres"]["user"],
+        password=config["postgres"]["pass"],
+        ssl=bool(config["postgres"]["from_vm"]["ssl"]),
+    )
+
+    # Upfront validation: does not change or persist anything
+    if not dry_run:
+        _verify_existing_postgres_app(
+            cap,
+            config["postgres"].get("app_name", PostgresApp.one_click_app_name),
+            postgres_from_container,
+            postgres_from_vm,
+        )
+
+    # With PgBouncer in the stack, the apps that may share connections go through it.
+    postgres_pooler = None
+    if "pgbouncer" in config:
+        postgres_pooler = replace(
+            postgres_from_container,
+            host="srv-captain--" + (config["pgbouncer"] or {}).get("app_name", "pgbouncer"),
+            port=5432,
+            ssl=False,
+        )
+
+    # Pulling ahead only helps the Docker that CapRover deploys to.
+    pull_images = config.get("pullImages")
+    if pull_images is None:
+        pull_images = detect_host and caprover_runs_here()
+
+        webapps_use_ssl = config.get("webappsUseSsl", True)
+    return DeploymentContext(
+        cap,
+        postgres_from_container,
+        postgres_from_vm,
+        gc_repository,
+        webapps_use_ssl,
+        dry_run,
+        max_workers=parallel_limit(config.get("maxParallelDeploys", 3), "maxParallelDeploys"),
+        readiness_timeout=float(config.get("readinessTimeoutSeconds", 300)),
+        deploy_timeout=float(config.get("deployTimeoutSeconds", 1800)),
+        one_click_apps=one_click_apps,
+        images=ImagePuller() if pull_images else None,
+        trace_dir=trace_dir,
+        # Divided between the configured apps by configured_apps().
+        resource_budget=ResourceBudget.from_config(config, detect_host),
+        postgres_pooler=postgres_pooler,
+        # Unset: asked of the server (see configured_apps).
+        postgres_max_connections=config["postgres"].get("max_connections"),
+        # A dry run compares against the recorded state but never saves it.
+        state=DeployState(state_path, persist=not dry_run) if state_path else None,
+    )
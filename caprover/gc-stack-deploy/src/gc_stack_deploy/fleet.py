@@ -0,0 +1,290 @@
+"""Deploy to many CapRover instances at once, from one fleet file.
+
+    gc-stack-deploy fleet -c fleet.yaml --apps windmill,superset
+
+A fleet file names each instance and where its stack config comes from:
+either its own stack.yaml, or overrides deep-merged onto a shared template
+(or both; overrides win):
+
+    template: stack.base.yaml        # optional; paths are relative to this file
+    maxParallelInstances: 4          # optional
+    apps: [windmill, superset]       # optional default for --apps
+    uninstall: []                    # optional default for --uninstall
+    instances:
+      springfield: springfield.yaml  # shorthand for {config: springfield.yaml}
+      shelbyville:
+        overrides:
+          caproverUrl: https://captain.shelbyville.example.org
+          caproverPassword: ...
+        apps: [windmill]             # this instance only
+
+Each instance gets its own DeploymentContext and runs headless (see
+headless.py) on its own thread, at most `maxParallelInstances` at a time, so
+a slow or unreachable VM only holds up itself.
+
+Log records are tagged with the instance they were logged for, through the
+`current_instance` context variable that the deploy's thread pools carry
+over: the console prefixes each line with it, and each instance also gets
+its own log file in the log directory. At the end, a table of every
+instance's apps, outcomes and durations is logged.
+"""
+
+import contextvars
+import copy
+import logging
+import re
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+from .apps_registry import APPS_REGISTRY, configured_apps
+from .base import DeploymentContext
+from .headless import deploy_selection
+from .orchestrator import TaskOutcome, parallel_limit
+
+logger = logging.getLogger(__name__)
+
+# Instance names become file names (deploy state, logs): no path separators.
+INSTANCE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+
+current_instance: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "gc_stack_deploy_instance", default=None
+)
+
+
+class FleetConfigError(ValueError):
+    """Raised when a fleet file is malformed."""
+
+
+@dataclass
+class FleetInstance:
+    name: str
+    config: dict
+    install: set[str]
+    uninstall: set[str]
+
+
+@dataclass
+class InstanceResult:
+    name: str
+    duration: float
+    outcomes: dict[str, TaskOutcome] = field(default_factory=dict)
+    app_durations: dict[str, float] = field(default_factory=dict)
+    error: str | None = None  # set when the instance could not be deployed at all
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(
+            o is TaskOutcome.SUCCEEDED for o in self.outcomes.values()
+        )
+
+
+def deep_merge(base: dict, overrides: dict) -> dict:
+    """A copy of `base` with `overrides` merged in, recursing into mappings."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _load_yaml(path: Path) -> dict:
+    with open(path) as f:
+        return YAML().load(f) or {}
+
+
+def load_fleet(
+    path: str | Path, install: set[str] | None = None, uninstall: set[str] | None = None
+) -> tuple[list[FleetInstance], int]:
+    """Instances of a fleet file, and how many may deploy at once.
+
+    `install`/`uninstall` (from the command line) take precedence over the
+    fleet file's own defaults, but not over an instance's own selection.
+    """
+    path = Path(path)
+    fleet = _load_yaml(path)
+    instances_cfg = fleet.get("instances")
+    if not isinstance(instances_cfg, dict) or not instances_cfg:
+        raise FleetConfigError(f"{path}: `instances` must map instance names to configs")
+    template = _load_yaml(path.parent / fleet["template"]) if fleet.get("template") else {}
+    default_install = install or set(fleet.get("apps") or ())
+    default_uninstall = uninstall or set(fleet.get("uninstall") or ())
+    known_apps = {cls.one_click_app_name for cls in APPS_REGISTRY}
+
+    instances = []
+    for name, entry in instances_cfg.items():
+        if not INSTANCE_NAME.fullmatch(str(name)):
+            raise FleetConfigError(
+                f"{path}: instance name {name!r} may only use letters, digits, '.', '_' and '-'"
+            )
+        if isinstance(entry, str):
+            entry = {"config": entry}
+        config = template
+        if entry.get("config"):
+            config = deep_merge(config, _load_yaml(path.parent / entry["config"]))
+        config = deep_merge(config, entry.get("overrides") or {})
+        if "caproverUrl" not in config:
+            raise FleetConfigError(f"{path}: instance {name!r} has no caproverUrl")
+        try:
+            parallel_limit(config.get("maxParallelDeploys", 3), "maxParallelDeploys")
+        except ValueError as e:
+            raise FleetConfigError(f"{path}: instance {name!r}: {e}") from None
+        instance = FleetInstance(
+            str(name),
+            config,
+            set(entry.get("apps") or default_install),
+            set(entry.get("uninstall") or default_uninstall),
+        )
+        unknown = (instance.install | instance.uninstall) - known_apps
+        if unknown:
+            raise FleetConfigError(
+                f"{path}: instance {name!r} names unknown app(s) {', '.join(sorted(unknown))}"
+            )
+        instances.append(instance)
+    try:
+        max_parallel = parallel_limit(
+            fleet.get("maxParallelInstances", 4), "maxParallelInstances"
+        )
+    except ValueError as e:
+        raise FleetConfigError(f"{path}: {e}") from None
+    return instances, max_parallel
+
+
+class InstanceTag(logging.Filter):
+    """Stamps each record with the fleet instance it was logged for."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.instance = current_instance.get() or "fleet"
+        return True
+
+
+class OnlyInstance(logging.Filter):
+    """Passes only the records logged for one instance."""
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.instance = name
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return current_instance.get() == self.instance
+
+
+def configure_fleet_logging(log_format: str = "plain") -> None:
+    """Like headless.configure_logging, with every line tagged by instance."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.addFilter(InstanceTag())
+        if log_format != "json":
+            handler.setFormatter(
+                logging.Formatter(
+                    "%(asctime)s - [%(instance)s] %(name)s - %(levelname)s - %(message)s"
+                )
+            )
+
+
+def run_instance(
+    instance: FleetInstance, build_context: Callable[[dict], DeploymentContext]
+) -> InstanceResult:
+    """Deploy one instance's selection; never raises."""
+    started = time.monotonic()
+    try:
+        unconfigured = (instance.install | instance.uninstall) - instance.config.keys()
+        if unconfigured:
+            raise FleetConfigError(f"no config block for: {', '.join(sorted(unconfigured))}")
+        ctx = build_context(instance.config)
+        specs = configured_apps(instance.config, ctx)
+        outcomes = deploy_selection(ctx, specs, instance.install, instance.uninstall)
+    except Exception as e:
+        logger.exception(f"Deploying to {instance.name} failed")
+        return InstanceResult(
+            instance.name, time.monotonic() - started, error=f"{type(e).__name__}: {e}"
+        )
+
+    # Per-app time from the run's trace: uninstall + install, for a reinstall.
+    app_ids = {spec.app_name: spec.one_click_app_name for spec in specs}
+    app_durations: dict[str, float] = {}
+    for span in ctx.tracer.spans:
+        if span.category == "app" and span.app in app_ids:
+            app_id = app_ids[span.app]
+            app_durations[app_id] = app_durations.get(app_id, 0.0) + span.duration
+    return InstanceResult(
+        instance.name, time.monotonic() - started, outcomes, app_durations
+    )
+
+
+def run_fleet(
+    instances: list[FleetInstance],
+    build_context: Callable[[dict], DeploymentContext],
+    max_parallel: int = 4,
+    log_dir: str | Path | None = None,
+) -> list[InstanceResult]:
+    """Deploy every instance, `max_parallel` at a time; results in fleet-file order."""
+    root = logging.getLogger()
+    file_handlers = []
+    if log_dir is not None:
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+        for instance in instances:
+            handler = logging.FileHandler(Path(log_dir) / f"{instance.name}.log")
+            handler.addFilter(OnlyInstance(instance.name))
+            handler.setFormatter(
+                logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+            )
+            root.addHandler(handler)
+            file_handlers.append(handler)
+
+    def run(instance: FleetInstance) -> InstanceResult:
+        current_instance.set(instance.name)
+        return run_instance(instance, build_context)
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=max_parallel, thread_name_prefix="gc-fleet"
+        ) as pool:
+            # A fresh context per instance, so the instance tag never leaks between them.
+            futures = [
+                pool.submit(contextvars.copy_context().run, run, instance)
+                for instance in instances
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        for handler in file_handlers:
+            root.removeHandler(handler)
+            handler.close()
+
+    for line in format_summary(results):
+        logger.info(line)
+    if log_dir is not None:
+        logger.info(f"Per-instance logs are in {log_dir}")
+    return results
+
+
+def format_summary(results: list[InstanceResult]) -> list[str]:
+    """A plain-text table: one row per instance and app."""
+    rows = [("INSTANCE", "APP", "OUTCOME", "SECONDS")]
+    for result in results:
+        if result.error is not None:
+            rows.append((result.name, "-", f"error: {result.error}", f"{result.duration:.1f}"))
+            continue
+        if not result.outcomes:
+            rows.append((result.name, "-", "nothing to do", f"{result.duration:.1f}"))
+        for app_id, outcome in result.outcomes.items():
+            seconds = result.app_durations.get(app_id)
+            rows.append(
+                (
+                    result.name,
+                    app_id,
+                    outcome.value,
+                    "-" if seconds is None else f"{seconds:.1f}",
+                )
+            )
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    return [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) + "  " + row[3]
+        for row in rows
+    ]
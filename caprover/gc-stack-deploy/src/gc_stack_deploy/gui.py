@@ -1,5 +1,4 @@
 import logging
-from enum import Enum
 
 from textual import work
 from textual.app import App, ComposeResult
@@ -17,36 +16,19 @@ from textual.widgets import (
     Static,
 )
 
-from .apps_registry import APPS_REGISTRY
-from .base import AppSpec, AppStatus, DeploymentContext
+from .apps_registry import configured_apps, run_connections
+from .base import AppSpec, AppStatus, AppStatusInfo, DeploymentContext, probe_statuses
+from .caprover_cache import CachingCaprover
+from .orchestrator import Action, resolve_action, run_deploy, split_by_action
+from .state import DeployState
 
 
-class Action(Enum):
-    INSTALL = "install"
-    UNINSTALL = "uninstall"
-    REINSTALL = "reinstall"
-    NOOP = "noop"
-
-
-def resolve_action(current: AppStatus, checked: bool) -> Action:
-    """The single source of truth for what a checkbox state means, given
-    where the app currently stands. Both the UI note and the actual
-    install/uninstall dispatch read from this, so they can't disagree."""
-    if current is AppStatus.FAILED:
-        return Action.REINSTALL if checked else Action.UNINSTALL
-    is_installed = current == AppStatus.INSTALLED
-    if checked and not is_installed:
-        return Action.INSTALL
-    if not checked and is_installed:
-        return Action.UNINSTALL
-    return Action.NOOP
-
-
-def _derive_status_note(current: AppStatus, checked: bool) -> str:
+def _derive_status_note(current: AppStatus, checked: bool, update: bool = True) -> str:
     """Text shown next to a checkbox
 
     Describes what submitting the form will do (install/uninstall if that differs
-    from current state), or otherwise describes current state as-is.
+    from current state), or otherwise describes current state as-is. `update`
+    is the value of a CONFIG_CHANGED app's "update" box.
 
     Returns
     -------
@@ -60,16 +42,20 @@ def _derive_status_note(current: AppStatus, checked: bool) -> str:
     elif current is AppStatus.UNINSTALLING:
         return "uninstalling…", "in-progress"
 
-    action = resolve_action(current, checked)
+    action = resolve_action(current, checked, update)
     if action is Action.INSTALL:
         return "will install", "will-install"
     elif action is Action.UNINSTALL:
         return "will uninstall", "will-uninstall"
     elif action is Action.REINSTALL:
         return "will reinstall", "will-reinstall"
+    elif action is Action.UPDATE:
+        return "config changed: will update", "will-update"
     else:  # Action.NOOP: box matches current state, describe that state instead
         if current is AppStatus.FAILED:
             return AppStatus.FAILED.value.upper(), "failed"
+        if current is AppStatus.CONFIG_CHANGED:
+            return "config changed: check update to apply", "currently-installed"
         if current is AppStatus.INSTALLED:
             return (
                 f"currently: {current.value.replace('_', ' ')}",
@@ -81,31 +67,71 @@ def _derive_status_note(current: AppStatus, checked: bool) -> str:
         )
 
 
-def _apply_status_note(note: Label, current_status: AppStatus, checked: bool) -> None:
-    text, css_class = _derive_status_note(current_status, checked)
+def _format_status_details(info: AppStatusInfo | None) -> str:
+    """One-line summary of an installed app's main service, e.g. image and SSL."""
+    if info is None or info.status not in (AppStatus.INSTALLED, AppStatus.CONFIG_CHANGED):
+        return ""
+    parts = []
+    if info.image:
+        parts.append(info.image)
+    if info.instance_count is not None:
+        plural = "" if info.instance_count == 1 else "s"
+        parts.append(f"{info.instance_count} instance{plural}")
+    if info.ssl is not None:
+        parts.append("SSL" if info.ssl else "no SSL")
+    if info.changed:
+        parts.append(f"changed: {', '.join(info.changed)}")
+    return " · ".join(parts)
+
+
+def _apply_status_note(
+    note: Label, current_status: AppStatus, checked: bool, update: bool
+) -> None:
+    text, css_class = _derive_status_note(current_status, checked, update)
     note.update(text)
     note.set_classes(css_class)
 
 
 class StateStore:
-    """In-memory per-app status tracking."""
+    """In-memory per-app status tracking for this session.
+
+    What each app was installed with outlives the session: see state.py.
+    """
 
     def __init__(self):
         self._data: dict[str, AppStatus] = {}
+        self._details: dict[str, AppStatusInfo] = {}
 
     def get(self, name: str) -> AppStatus:
         """Status for an app, defaulting to NOT_INSTALLED if never touched."""
         return self._data.get(name, AppStatus.NOT_INSTALLED)
 
     def set(self, name: str, status: AppStatus) -> None:
-        """Record a new status for an app."""
+        """Record a new status for an app.
+
+        Probed details no longer describe the app once its status changes, so they are dropped.
+        """
+        if self._data.get(name) is not status:
+            self._details.pop(name, None)
         self._data[name] = status
 
+    def get_details(self, name: str) -> AppStatusInfo | None:
+        """Details from the last probe, if the app hasn't changed since."""
+        return self._details.get(name)
+
+    def set_probed(self, name: str, info: AppStatusInfo) -> None:
+        """Record a probe result: status plus details."""
+        self.set(name, info.status)
+        self._details[name] = info
+
 
 class ChecklistScreen(Vertical):
     """Shows one row per app-with-config; each row is a checkbox plus a
     state-change annotation ('will install', 'will uninstall', or blank
-    if the checkbox matches current state)."""
+    if the checkbox matches current state).
+
+    An app whose config changed since it was installed also gets an "update"
+    box, unchecked: Go only updates the apps it is checked for."""
 
     DEFAULT_CSS = """
     ChecklistScreen {
@@ -118,7 +144,7 @@ class ChecklistScreen(Vertical):
     }
     .app-row {
         # Grid keeps every row the same width and height
-        height: 3;
+        height: 4;
         width: 100%;
         layout: horizontal;
         content-align: left middle;
@@ -126,6 +152,9 @@ class ChecklistScreen(Vertical):
     #go {
         width: 1fr;
     }
+    .update {
+        display: none;
+    }
 
     ChecklistScreen .will-install {
         color: $success;
@@ -142,6 +171,11 @@ class ChecklistScreen(Vertical):
         text-style: italic;
     }
 
+    ChecklistScreen .will-update {
+        color: $success;
+        text-style: italic;
+    }
+
     ChecklistScreen .currently-installed {
         color: $text-muted;
         text-style: dim italic;
@@ -156,14 +190,29 @@ class ChecklistScreen(Vertical):
         color: $error;
         text-style: bold italic;
     }
+
+    ChecklistScreen .details {
+        color: $text-muted;
+        text-style: dim;
+    }
     """
 
-    def __init__(self, apps_with_config: list[AppSpec], state: StateStore, **kwargs):
+    def __init__(
+        self,
+        apps_with_config: list[AppSpec],
+        state: StateStore,
+        caprover,
+        deploy_state: DeployState | None = None,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         # Only apps with a config block reach the UI; others are skipped entirely,
         # so there's no way to check a box for an app that can't actually run.
         self.apps_with_config = apps_with_config
         self.state = state
+        self.caprover = caprover
+        self.deploy_state = deploy_state  # persisted fingerprints, for "config changed"
+        self._planning = False  # whether update plans may still change statuses
 
     def compose(self) -> ComposeResult:
         """Build one row per installable app, then a Go button."""
@@ -192,6 +241,8 @@ class ChecklistScreen(Vertical):
                         yield Label(
                             "checking...", id=f"note_{app_id}", classes="checking"
                         )
+                        yield Label("", id=f"details_{app_id}", classes="details")
+                    yield Checkbox("update", id=f"upd_{app_id}", value=False, classes="update")
 
         yield Button("Go", id="go", variant="primary")
 
@@ -200,24 +251,74 @@ class ChecklistScreen(Vertical):
 
     @work(exclusive=True, thread=True)
     def _probe_installed_apps(self) -> None:
-        """Query each app's install state from CapRover, and update self.state"""
-        for appspec in self.apps_with_config:
-            try:
-                status = appspec.check_installed()
-            except Exception:
-                appspec.logger.exception("check_installed failed")
-                status = AppStatus.FAILED
-            self.app.call_from_thread(
-                self.state.set, appspec.one_click_app_name, status
-            )
+        """Query every app's install state from CapRover, and update self.state
+
+        One API call covers all apps, however many are configured. Whether an
+        installed app's config changed is left to _plan_updates().
+        """
+        try:
+            probed = probe_statuses(self.caprover, self.apps_with_config)
+        except Exception:
+            logging.getLogger(__name__).exception("Probing CapRover apps failed")
+            probed = {
+                appspec.one_click_app_name: AppStatusInfo(AppStatus.FAILED)
+                for appspec in self.apps_with_config
+            }
+        for app_id, info in probed.items():
+            self.app.call_from_thread(self.state.set_probed, app_id, info)
         self.app.call_from_thread(self._on_probe_finished)
 
     def _on_probe_finished(self) -> None:
-        """Reveal the checklist and hide the spinner."""
+        """Reveal the checklist and hide the spinner, then look for config changes."""
         self.query_one("#probe-spinner").display = False
         self.query_one("#app-rows-container").display = True
         self.refresh_all_notes_to_state()
         self.set_is_enabled(True)
+        installed = [
+            appspec
+            for appspec in self.apps_with_config
+            if self.state.get(appspec.one_click_app_name) is AppStatus.INSTALLED
+        ]
+        if installed:
+            self._planning = True
+            self._plan_updates(installed)
+
+    @work(group="plan", thread=True)
+    def _plan_updates(self, installed: list[AppSpec]) -> None:
+        """Diff the installed apps against their config, in the background.
+
+        That takes rendering their one-click definitions (and fetching any not
+        stored yet), so the checklist is usable meanwhile. Apps found to
+        differ turn CONFIG_CHANGED, unless a deploy has started since.
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("Checking the installed apps for config changes...")
+        try:
+            probed = probe_statuses(self.caprover, installed, self.deploy_state, plan=True)
+        except Exception:
+            logger.exception("Checking for config changes failed")
+            return
+        # The change set behind each "config changed", in the log pane.
+        for app_id, info in probed.items():
+            if info.plan and not info.plan.empty:
+                logger.info(
+                    f"{app_id}: an update would change\n  " + "\n  ".join(info.plan.lines())
+                )
+        self.app.call_from_thread(self._on_planned, probed)
+
+    def _on_planned(self, probed: dict[str, AppStatusInfo]) -> None:
+        if not self._planning:
+            return  # a deploy started meanwhile: its statuses are the current ones
+        self._planning = False
+        for app_id, info in probed.items():
+            if self.state.get(app_id) is AppStatus.INSTALLED:
+                self.state.set_probed(app_id, info)
+                self.refresh_one_note_to_state(app_id)
+
+    def stop_planning(self) -> None:
+        """Keep update plans still being worked out from changing any status."""
+        self._planning = False
+        self.workers.cancel_group(self, "plan")
 
     def refresh_one_note_to_state(self, app_id: str) -> None:
         """Recompute and apply the status note for one app, using its
@@ -227,8 +328,14 @@ class ChecklistScreen(Vertical):
         """
         app_status = self.state.get(app_id)
         chk = self.query_one(f"#chk_{app_id}", Checkbox)
+        upd = self.query_one(f"#upd_{app_id}", Checkbox)
+        upd.display = app_status is AppStatus.CONFIG_CHANGED
+        if not upd.display:
+            upd.value = False  # an app that turns CONFIG_CHANGED again starts unchecked
         note = self.query_one(f"#note_{app_id}", Label)
-        _apply_status_note(note, app_status, chk.value)
+        _apply_status_note(note, app_status, chk.value, upd.value)
+        details = _format_status_details(self.state.get_details(app_id))
+        self.query_one(f"#details_{app_id}", Label).update(details)
 
     def refresh_all_notes_to_state(self) -> None:
         """Refresh every app's status note to match self.state."""
@@ -237,14 +344,14 @@ class ChecklistScreen(Vertical):
 
     def on_checkbox_changed(self, event: Checkbox.Changed) -> None:
         """Recompute the status note annotation whenever a box is toggled."""
-        app_id = event.checkbox.id.removeprefix("chk_")
+        app_id = event.checkbox.id.split("_", 1)[1]
         self.refresh_one_note_to_state(app_id)
 
     def set_is_enabled(self, new_state) -> None:
         for appspec in self.apps_with_config:
             app_id = appspec.one_click_app_name
-            chk = self.query_one(f"#chk_{app_id}", Checkbox)
-            chk.disabled = not new_state
+            self.query_one(f"#chk_{app_id}", Checkbox).disabled = not new_state
+            self.query_one(f"#upd_{app_id}", Checkbox).disabled = not new_state
         self.query_one("#go", Button).disabled = not new_state
 
 
@@ -292,18 +399,20 @@ class Deployer(App):
         self.state: StateStore = StateStore()
 
         # Apps in the registry that have a config block, in registry order
-        self.apps_with_config = [
-            cls(config[cls.one_click_app_name], ctx)  # instantiate!
-            for cls in APPS_REGISTRY
-            if cls.one_click_app_name in config
-        ]
+        self.apps_with_config = configured_apps(config, ctx)
 
     def compose(self) -> ComposeResult:
         yield Header()
         with Horizontal(id="main"):
             with Vertical(classes="left-col"):
                 # pass the filtered app list and state store down
-                yield ChecklistScreen(self.apps_with_config, self.state, id="checklist")
+                yield ChecklistScreen(
+                    self.apps_with_config,
+                    self.state,
+                    self.ctx.caprover,
+                    self.ctx.state,
+                    id="checklist",
+                )
                 if self.ctx.dry_run:
                     yield Label("WARNING: DRY RUN", id="dry-run-banner")
             yield RichLog(id="log", highlight=True, markup=True)
@@ -319,6 +428,11 @@ class Deployer(App):
         logger.handlers.clear()  # An existing StreamHandler to stdout would garble the TUI output.
         logger.addHandler(handler)
 
+    async def action_quit(self) -> None:
+        """Stop any readiness waits in the deploy worker, then quit."""
+        self.ctx.cancel.set()
+        await super().action_quit()
+
     def _on_deploy_finished(self) -> None:
         """Runs on the main thread once _run_deploy returns."""
         checklist = self.query_one(ChecklistScreen)
@@ -333,27 +447,29 @@ class Deployer(App):
             return
         checklist = self.query_one(ChecklistScreen)
 
-        to_install: list[AppSpec] = []
-        to_uninstall: list[AppSpec] = []
+        actions = []
         for appspec in self.apps_with_config:
             app_id = appspec.one_click_app_name
             checked = checklist.query_one(f"#chk_{app_id}", Checkbox).value
-            action = resolve_action(self.state.get(app_id), checked)
-            if action is Action.NOOP:
-                continue
-            if action is Action.REINSTALL:
-                to_uninstall.append(appspec)
-                to_install.append(appspec)
-            else:
-                (to_install if action is Action.INSTALL else to_uninstall).append(
-                    appspec
-                )
+            update = checklist.query_one(f"#upd_{app_id}", Checkbox).value
+            action = resolve_action(self.state.get(app_id), checked, update)
+            if action is not Action.NOOP:
+                actions.append((appspec, action))
+        to_uninstall, to_install, to_update = split_by_action(actions)
+
+        self.query_one("#log", RichLog).clear()
+        deploying = to_install + to_update
+        if (
+            deploying
+            and self.ctx.connections
+            and not run_connections(self.apps_with_config, self.ctx, deploying).check()
+        ):
+            return  # the pools would overrun Postgres; the log says how
 
         # Lock the checklist so nothing changes mid-run.
+        checklist.stop_planning()
         checklist.set_is_enabled(False)
-
-        self.query_one("#log", RichLog).clear()
-        self._run_deploy(to_uninstall, to_install)
+        self._run_deploy(to_uninstall, to_install, to_update)
 
     def _set_and_refresh(self, app_id, status: AppStatus) -> None:
         self.state.set(app_id, status)
@@ -364,47 +480,42 @@ class Deployer(App):
         self,
         to_uninstall: list[AppSpec],
         to_install: list[AppSpec],
+        to_update: list[AppSpec],
     ) -> None:
-        """This Worker uninstalls and installs apps.
+        """This Worker uninstalls, installs and updates apps.
 
         @work(thread=True) moves the entire _run_deploy call onto a worker thread
         managed by Textual. This keeps the event loop free to render frames
         while app.install()/uninstall() block.
         https://textual.textualize.io/guide/workers/#thread-workers
 
-        We are running on a worker thread, so:
-        - Every call in this method is a plain synchronous call
+        run_deploy() fans the apps out over a pool of threads in dependency
+        order; its status callbacks come back on this worker thread, so:
         - Never touch app state or widgets directly from here.
           Textual widget/state mutation is only safe on the main thread, so
           we route state updates through call_from_thread.
 
+        One app's failure doesn't abort the rest of the batch: it is recorded
+        FAILED, and only the apps that depend on it are skipped. A failure of
+        the batch itself is logged, and the checklist is unlocked either way.
         """
-        # Uninstalls first: This supports the future (TODO) "retry" workflow of
-        # uninstall then reinstall the same app in one go.
-        for spec in to_uninstall:
-            app_id = spec.one_click_app_name
-            self.call_from_thread(self._set_and_refresh, app_id, AppStatus.UNINSTALLING)
-            try:
-                spec.uninstall()  # Blocking call, runs directly on this worker thread
-                self.call_from_thread(
-                    self._set_and_refresh, app_id, AppStatus.NOT_INSTALLED
-                )
-            except Exception:
-                # Log and record FAILED rather than raising: one app's
-                # failure shouldn't abort the rest of the batch.
-                spec.logger.exception("uninstall failed")
-                self.call_from_thread(self._set_and_refresh, app_id, AppStatus.FAILED)
-
-        for spec in to_install:
-            app_id = spec.one_click_app_name
-            self.call_from_thread(self._set_and_refresh, app_id, AppStatus.INSTALLING)
-            try:
-                spec.install()  # Blocking call, runs directly on this worker thread
-                self.call_from_thread(
-                    self._set_and_refresh, app_id, AppStatus.INSTALLED
-                )
-            except Exception:
-                spec.logger.exception("install failed")
-                self.call_from_thread(self._set_and_refresh, app_id, AppStatus.FAILED)
-
-        self.call_from_thread(self._on_deploy_finished)
+        try:
+            run_deploy(
+                to_uninstall,
+                to_install,
+                on_status=lambda spec, status: self.call_from_thread(
+                    self._set_and_refresh, spec.one_click_app_name, status
+                ),
+                max_workers=self.ctx.max_workers,
+                ctx=self.ctx,
+                to_update=to_update,
+            )
+            if isinstance(self.ctx.caprover, CachingCaprover):
+                self.ctx.caprover.log_stats()
+            self.ctx.one_click_apps.log_stats()
+        except Exception:
+            # Outside any one app (a dependency cycle, planning, reporting):
+            # show it, and still unlock the checklist.
+            logging.getLogger(__name__).exception("Deploy failed")
+        finally:
+            self.call_from_thread(self._on_deploy_finished)
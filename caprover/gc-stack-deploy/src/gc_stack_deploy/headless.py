@@ -0,0 +1,204 @@
+"""Deploy without the TUI: apps are chosen on the command line, logs go to stdout.
+
+    gc-stack-deploy -c stack.yaml --headless --apps postgres,windmill --uninstall superset
+
+`--apps` is what a checked box means in the TUI and `--uninstall` an unchecked
+one; apps named in neither are left as they are. What that means for each app
+given its current state is decided by the same `resolve_action()` the TUI
+uses, e.g. a FAILED app named in `--apps` is reinstalled, and one whose
+config changed is updated in place.
+
+`--plan` only probes: it prints, per installed app, what an update would
+change (see plan.py), and exits without touching anything.
+
+    gc-stack-deploy -c stack.yaml --plan
+
+Meant for CI, cron, and running many deploys side by side on one control
+host, so nothing imported from here pulls in Textual.
+"""
+
+import json
+import logging
+import sys
+
+from .apps_registry import run_connections
+from .base import AppSpec, AppStatus, AppStatusInfo, DeploymentContext, probe_statuses
+from .caprover_cache import CachingCaprover
+from .orchestrator import (
+    Action,
+    TaskOutcome,
+    log_resources,
+    resolve_action,
+    run_deploy,
+    split_by_action,
+)
+
+logger = logging.getLogger(__name__)
+
+# Attributes a LogRecord may carry via `extra=`, copied into JSON lines.
+_EXTRA_FIELDS = ("instance", "app", "status", "outcome")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, plus any app/status."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in _EXTRA_FIELDS:
+            if hasattr(record, name):
+                entry[name] = getattr(record, name)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(log_format: str = "plain", stream=None) -> None:
+    """Send every log record to stdout (or `stream`), as plain text or JSON lines."""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if log_format == "json":
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def select_actions(
+    specs: list[AppSpec],
+    statuses: dict[str, AppStatusInfo],
+    install: set[str],
+    uninstall: set[str],
+) -> list[tuple[AppSpec, Action]]:
+    """What to do with each named app, in registry order; NOOPs are left out."""
+    actions = []
+    for spec in specs:
+        app_id = spec.one_click_app_name
+        if app_id not in install and app_id not in uninstall:
+            continue
+        action = resolve_action(statuses[app_id].status, checked=app_id in install)
+        if action is not Action.NOOP:
+            actions.append((spec, action))
+    return actions
+
+
+def deploy_selection(
+    ctx: DeploymentContext,
+    specs: list[AppSpec],
+    install: set[str],
+    uninstall: set[str],
+) -> dict[str, TaskOutcome]:
+    """Probe, then install/uninstall the named apps; outcome per app that had work.
+
+    Raises whatever probing CapRover raised.
+    """
+    statuses = probe_statuses(ctx.caprover, specs, ctx.state, plan=True)
+    log_statuses(statuses)
+
+    actions = select_actions(specs, statuses, install, uninstall)
+    if not actions:
+        logger.info("Nothing to do: every selected app is already as requested.")
+        return {}
+    for spec, action in actions:
+        logger.info(
+            f"{spec.one_click_app_name}: will {action.value}",
+            extra={"app": spec.one_click_app_name},
+        )
+
+    def on_status(spec: AppSpec, status: AppStatus) -> None:
+        logger.info(
+            f"{spec.one_click_app_name}: {status.value}",
+            extra={"app": spec.one_click_app_name, "status": status.value},
+        )
+
+    to_uninstall, to_install, to_update = split_by_action(actions)
+    deploying = to_install + to_update
+    if deploying and ctx.connections and not run_connections(specs, ctx, deploying).check():
+        # The pools would overrun Postgres: start nothing.
+        return {spec.one_click_app_name: TaskOutcome.SKIPPED for spec, _ in actions}
+    outcomes = run_deploy(
+        to_uninstall,
+        to_install,
+        on_status,
+        max_workers=ctx.max_workers,
+        ctx=ctx,
+        to_update=to_update,
+    )
+    if isinstance(ctx.caprover, CachingCaprover):
+        ctx.caprover.log_stats()
+    ctx.one_click_apps.log_stats()
+    return outcomes
+
+
+def log_statuses(statuses: dict[str, AppStatusInfo]) -> None:
+    """Log each app's probed status, with the changes its plan found."""
+    for app_id, info in statuses.items():
+        changed = f" ({', '.join(info.changed)})" if info.changed else ""
+        logger.info(
+            f"{app_id}: currently {info.status.value}{changed}",
+            extra={"app": app_id, "status": info.status.value},
+        )
+        for line in info.plan.lines() if info.plan else []:
+            logger.info(f"  {line}", extra={"app": app_id})
+
+
+def print_plan(ctx: DeploymentContext, specs: list[AppSpec]) -> int:
+    """Probe and log what an update of each installed app would change; change nothing.
+
+    Returns the exit code: 0, or 1 if CapRover could not be probed.
+    """
+    try:
+        statuses = probe_statuses(ctx.caprover, specs, ctx.state, plan=True)
+    except Exception:
+        logger.exception("Probing CapRover apps failed")
+        return 1
+    log_statuses(statuses)
+    if ctx.resources:
+        log_resources(ctx.resources)
+    if ctx.connections:
+        ctx.connections.check()
+    pending = [
+        app_id for app_id, info in statuses.items() if info.plan and not info.plan.empty
+    ]
+    if pending:
+        logger.info(f"To apply: --apps {','.join(pending)}")
+    else:
+        logger.info("Every installed app matches its config.")
+    return 0
+
+
+def run_headless(
+    ctx: DeploymentContext,
+    specs: list[AppSpec],
+    install: set[str],
+    uninstall: set[str],
+) -> int:
+    """Deploy the selection and return the process exit code.
+
+    0 if every selected app ended up where it was asked to be, 1 if any app
+    failed or was skipped (or CapRover could not be probed).
+    """
+    try:
+        outcomes = deploy_selection(ctx, specs, install, uninstall)
+    except Exception:
+        logger.exception("Probing CapRover apps failed")
+        return 1
+
+    failed = 0
+    for app_id, outcome in outcomes.items():
+        level = logging.INFO if outcome is TaskOutcome.SUCCEEDED else logging.ERROR
+        failed += outcome is not TaskOutcome.SUCCEEDED
+        logger.log(
+            level,
+            f"{app_id}: {outcome.value}",
+            extra={"app": app_id, "outcome": outcome.value},
+        )
+    return 1 if failed else 0
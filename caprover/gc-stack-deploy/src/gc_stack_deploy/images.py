@@ -0,0 +1,150 @@
+"""Pull the docker images of every app to install, in the background.
+
+CapRover pulls an app's image inside its deploy call, one app at a time, and
+the call times out if a large image (Windmill, Superset, ...) takes too long.
+ImagePuller starts `docker pull` for every selected app as soon as a run
+begins, a few at a time, while the run carries on with uninstalls and
+database provisioning. Each app's install then waits only for its own image.
+
+A failed pull is not fatal: it is logged, and CapRover gets its usual chance
+to pull the image itself.
+
+Only meaningful when this script runs on the CapRover host itself: elsewhere
+(e.g. a fleet deployed from a control machine) it would only fill this
+machine's disk. `caprover_runs_here()` tells, unless `pullImages` in the
+config says otherwise.
+"""
+
+import contextvars
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# `docker pull` without a TTY prints one line per layer state change, e.g.
+# "4f4fb700ef54: Pull complete". These mark a layer as done.
+_LAYER_DONE = ("Pull complete", "Already exists")
+
+
+def caprover_runs_here() -> bool:
+    """True if this host's Docker runs CapRover itself (its captain-captain service).
+
+    The configured caproverUrl doesn't tell: on the host it is usually the
+    public captain domain too.
+    """
+    try:
+        inspect = subprocess.run(
+            ["docker", "service", "inspect", "--format", "{{.ID}}", "captain-captain"],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:  # no docker here
+        return False
+    return inspect.returncode == 0
+
+
+class ImagePuller:
+    """Bounded pool of background `docker pull`s, one per app."""
+
+    docker_command = ("docker", "pull")
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._pool: ThreadPoolExecutor | None = None
+        self._futures: dict[str, Future] = {}  # app_name -> Future[bool]
+        self._lock = threading.Lock()
+
+    def start(self, specs) -> None:
+        """Resolve and start pulling the image of every spec that has one."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="gc-pull"
+                )
+            for spec in specs:
+                if spec.image_variable is None or spec.app_name in self._futures:
+                    continue
+                self._futures[spec.app_name] = self._pool.submit(
+                    contextvars.copy_context().run, self._resolve_and_pull, spec
+                )
+
+    def wait(self, spec, cancel: threading.Event | None = None) -> bool:
+        """Block until `spec`'s image pull has finished.
+
+        Returns True if the image is now present locally, False if the pull
+        failed or was never started.
+        """
+        with self._lock:
+            future = self._futures.get(spec.app_name)
+        if future is None:
+            return False
+        if not future.done():
+            spec.logger.info(f"Waiting for the {spec.app_name} image to finish pulling")
+        while not wait_futures([future], timeout=0.5).done:
+            if cancel is not None and cancel.is_set():
+                return False
+        return not future.cancelled() and future.result()
+
+    def shutdown(self) -> None:
+        """Drop pulls that have not started; ones under way finish on their own."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _resolve_and_pull(self, spec) -> bool:
+        try:
+            image = spec.docker_image()
+        except Exception as e:
+            spec.logger.warning(f"Could not resolve the {spec.app_name} image: {e}")
+            return False
+        with tracing.span("image pull", "docker", app=spec.app_name):
+            return self.pull(image)
+
+    def pull(self, image: str) -> bool:
+        """`docker pull` one image, streaming per-layer progress into the log."""
+        with tracing.span("docker.pull", "docker", image=image):
+            return self._pull(image)
+
+    def _pull(self, image: str) -> bool:
+        logger.info(f"Pulling {image} ...")
+        started = time.monotonic()
+        layers_done = 0
+        try:
+            proc = subprocess.Popen(
+                [*self.docker_command, image],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            )
+        except OSError as e:
+            logger.warning(f"Could not pull {image}: {e}")
+            return False
+        last_line = ""
+        with proc:
+            for line in proc.stdout:
+                line = line.strip()
+                if not line:
+                    continue
+                last_line = line
+                if line.endswith(_LAYER_DONE):
+                    layers_done += 1
+                    logger.info(f"{image}: {line}")
+                else:
+                    logger.debug(f"{image}: {line}")
+        if proc.returncode != 0:
+            logger.warning(
+                f"Pulling {image} failed ({last_line or f'exit {proc.returncode}'}); "
+                f"CapRover will try to pull it during deploy."
+            )
+            return False
+        logger.info(
+            f"Pulled {image}: {layers_done} layers in {time.monotonic() - started:.1f}s"
+        )
+        return True
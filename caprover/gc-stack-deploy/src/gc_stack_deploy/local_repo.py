@@ -0,0 +1,160 @@
+"""Serve a local one-click app repository over HTTP.
+
+CaproverAPI only fetches one-click definitions from http:// and https:// URLs,
+so a repository checked out on disk (useful for testing) is served from a
+local port for the duration of a run.
+"""
+
+import gzip
+import hashlib
+import http.server
+import logging
+import mimetypes
+import os
+import stat
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+class _RepoFile:
+    """A file of the local repository, held in memory with its gzipped form."""
+
+    # Images are already compressed; gzipping them only costs time.
+    COMPRESSIBLE_MIN_SIZE = 256
+
+    def __init__(self, path: str, mtime_ns: int):
+        self.mtime_ns = mtime_ns  # of the file as read
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        compressible = not self.content_type.startswith("image/") or (
+            self.content_type == "image/svg+xml"
+        )
+        self.gzipped = (
+            gzip.compress(self.body, mtime=0)
+            if compressible and len(self.body) >= self.COMPRESSIBLE_MIN_SIZE
+            else None
+        )
+
+
+class _RepoRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves files from `server.files`, with gzip and ETag revalidation."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool) -> None:
+        started = time.perf_counter()
+        encoding = "identity"
+        repo_file = self.server.files.get(self.path.split("?", 1)[0])
+        if repo_file is None:
+            status, body = 404, b""
+            self.send_response(status)
+        elif repo_file.etag in self.headers.get("If-None-Match", ""):
+            status, body = 304, b""
+            self.send_response(status)
+            self.send_header("ETag", repo_file.etag)
+        else:
+            status, body = 200, repo_file.body
+            if repo_file.gzipped is not None and "gzip" in self.headers.get(
+                "Accept-Encoding", ""
+            ):
+                encoding, body = "gzip", repo_file.gzipped
+            self.send_response(status)
+            self.send_header("Content-Type", repo_file.content_type)
+            self.send_header("ETag", repo_file.etag)
+            self.send_header("Cache-Control", "no-cache")
+            if encoding == "gzip":
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+        logger.info(
+            f"Local repo: {self.command} {self.path} {status} "
+            f"({encoding}, {len(body)} bytes) in "
+            f"{(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    def log_message(self, format, *args):
+        pass  # _serve() logs each request with its latency
+
+
+class _RepoHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, files: "_RepoFiles"):
+        self.files = files
+        super().__init__(address, _RepoRequestHandler)
+
+
+class _RepoFiles:
+    """URL path -> _RepoFile, read from disk on first request, then kept in memory.
+
+    A file is read again once its mtime changes, and a missing one is looked
+    for again on every request, so edits show up without a restart.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        self._files: dict[str, _RepoFile] = {}  # by real path
+        self._lock = threading.Lock()
+
+    def get(self, url_path: str) -> _RepoFile | None:
+        relative = urllib.parse.unquote(url_path).lstrip("/")
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        # Stay inside the repository, and serve files only (no directory listings).
+        if os.path.commonpath([self.directory, path]) != self.directory:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self._lock:
+            repo_file = self._files.get(path)
+            if repo_file is None or repo_file.mtime_ns != st.st_mtime_ns:
+                repo_file = self._files[path] = _RepoFile(path, st.st_mtime_ns)
+            return repo_file
+
+
+class LocalRepoServer:
+    """A context manager for serving a local repository over HTTP.
+
+    Requests are handled concurrently. Each file is read from disk once (and
+    again if it changes) and then served from memory (gzipped if the client accepts it), with an ETag
+    so repeat fetches can be answered with 304 Not Modified.
+    """
+
+    def __init__(self, directory, port=0):
+        self.directory = directory
+        self.port = port
+        self.httpd = None
+        self.server_thread = None
+
+    def __enter__(self):
+        self.httpd = _RepoHTTPServer(("", self.port), _RepoFiles(self.directory))
+        self.port = self.httpd.server_address[1]
+        logger.info(f"Starting local server for repo at http://127.0.0.1:{self.port}")
+
+        self.server_thread = threading.Thread(target=self.httpd.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        return f"http://127.0.0.1:{self.port}/"
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.httpd:
+            logger.info("Shutting down local repo server...")
+            self.httpd.shutdown()
+            self.httpd.server_close()
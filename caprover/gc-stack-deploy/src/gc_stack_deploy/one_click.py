@@ -0,0 +1,308 @@
+"""Read one-click app definitions from the GC one-click repository.
+
+CaproverAPI downloads a definition each time it deploys an app, and we look
+inside some beforehand (e.g. for the default docker image of an app, so it
+can be pulled early). OneClickRepository fetches each definition at most once
+per run, parses it once into a OneClickDefinition, and keeps the raw text in
+an on-disk store so later runs (and other instances deployed from the same
+machine) rarely download anything:
+
+- a stored copy still fresh per the server's `Cache-Control: max-age` is used
+  without touching the network;
+- otherwise it is revalidated with `If-None-Match` / `If-Modified-Since`, and
+  a 304 costs no body;
+- if the repository is unreachable, a stored copy (however old) is used.
+
+`serve_downloads_for()` routes CaproverAPI's own downloads from the same
+repository through here too.
+
+`OneClickDefinition.render()` and `service_settings()` reproduce what
+deploying a one-click app does with a definition, so its outcome can be
+known (see plan.py) without deploying anything.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+logger = logging.getLogger(__name__)
+
+# CapRover's public repository, as built (one JSON file per app, no suffix), the same
+# layout as the GC repository: where a one-click app comes from by default.
+PUBLIC_ONE_CLICK_APP_PATH = "https://oneclickapps.caprover.com/v4/apps/"
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "gc-stack-deploy" / "one-click-apps"
+
+
+@dataclass(frozen=True)
+class OneClickVariable:
+    """One entry of `caproverOneClickApp.variables`."""
+
+    id: str
+    label: str = ""
+    description: str = ""
+    default: str | None = None
+    valid_regex: str | None = None
+
+    def accepts(self, value) -> bool:
+        """Whether CaproverAPI would accept `value` for this variable."""
+        if value is None:
+            return False
+        # Same check as CaproverAPI's _resolve_app_variables.
+        return bool(re.search((self.valid_regex or ".*").strip("/"), str(value)))
+
+
+@dataclass(frozen=True)
+class OneClickDefinition:
+    """A parsed one-click app definition."""
+
+    name: str
+    raw: str
+    services: dict = field(default_factory=dict)
+    variables: dict[str, OneClickVariable] = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, name: str, raw: str) -> "OneClickDefinition":
+        doc = YAML(typ="safe").load(raw) or {}
+        variables = {}
+        for var in doc.get("caproverOneClickApp", {}).get("variables") or []:
+            default = var.get("defaultValue")
+            variables[var["id"]] = OneClickVariable(
+                id=var["id"],
+                label=var.get("label", ""),
+                description=var.get("description", ""),
+                default=None if default is None else str(default),
+                valid_regex=var.get("validRegex"),
+            )
+        return cls(name, raw, doc.get("services") or {}, variables)
+
+    def default(self, variable_id: str) -> str:
+        """The `defaultValue` of a variable, e.g. `$$cap_app_docker_image`.
+
+        Raises
+        ------
+        ValueError
+            If the definition has no default for `variable_id`.
+        """
+        var = self.variables.get(variable_id)
+        if var is None or var.default is None:
+            raise ValueError(
+                f"{variable_id} defaultValue not found in {self.name} one-click app"
+            )
+        return var.default
+
+    def render(
+        self,
+        app_name: str,
+        app_variables: dict,
+        root_domain: str,
+        random_hex: Callable[[int], str] | None = None,
+    ) -> dict:
+        """The definition's services, with every `$$cap_*` variable substituted.
+
+        As CaproverAPI's `_resolve_app_variables` (automated): a variable not
+        in `app_variables` takes its default, and a missing or invalid
+        default raises ValueError. `$$cap_gen_random_hex(n)` becomes
+        `random_hex(n)`, by default n random hex digits; like CaproverAPI,
+        every occurrence of the same expression gets the same value.
+        """
+        random_hex = random_hex or (lambda n: secrets.token_hex(n)[:n])
+        generated = {}
+
+        def generate(match: re.Match) -> str:
+            if match.group(0) not in generated:
+                generated[match.group(0)] = random_hex(int(match.group(1)))
+            return generated[match.group(0)]
+
+        raw = re.sub(r"\$\$cap_gen_random_hex\((\d+)\)", generate, self.raw)
+        values = dict(app_variables)
+        values.update({"$$cap_appname": app_name, "$$cap_root_domain": root_domain})
+        for var in self.variables.values():
+            if values.get(var.id) is not None:
+                continue
+            default = var.default if var.default is not None else ""
+            if not var.accepts(default):
+                raise ValueError(f"Missing or Invalid value for >>{var.id}<<")
+            values[var.id] = default
+        for variable_id, value in values.items():
+            raw = raw.replace(variable_id, str(value))
+        return YAML(typ="safe").load(raw).get("services") or {}
+
+
+def parse_command(command) -> list[str]:
+    """A compose `command` as an argument list, as the CapRover frontend does."""
+    if isinstance(command, list):
+        return command
+    return [
+        m.group(1) or m.group(2) or m.group(0)
+        for m in re.finditer(r'[^\s"\'\n]+|"([^"]*)"|\'([^\']*)\'', command)
+    ]
+
+
+def command_override(command) -> str:
+    """The serviceUpdateOverride that makes a service run a compose `command`."""
+    buf = io.StringIO()
+    YAML().dump({"TaskTemplate": {"ContainerSpec": {"Command": parse_command(command)}}}, buf)
+    return buf.getvalue()
+
+
+def service_settings(service: dict) -> dict:
+    """The `update_app` settings a one-click deploy gives one rendered service.
+
+    The image (or dockerfileLines) is deployed separately.
+    """
+    extras = service.get("caproverExtra") or {}
+    settings = {
+        "instance_count": 1,
+        "persistent_directories": service.get("volumes") or [],
+        "environment_variables": service.get("environment") or {},
+        "expose_as_web_app": str(extras.get("notExposeAsWebApp", "false")).lower() == "false",
+        "container_http_port": int(extras.get("containerHttpPort", 80)),
+    }
+    if service.get("command"):
+        settings["serviceUpdateOverride"] = command_override(service["command"])
+    return settings
+
+
+class OneClickRepository:
+    """Definitions from one repository URL, memoised per run and stored on disk.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, repository: str, cache_dir: Path | None = None):
+        self.repository = repository
+        key = hashlib.sha256(repository.encode()).hexdigest()[:16]
+        self.cache_dir = Path(cache_dir or default_cache_dir()) / key
+        self._lock = threading.Lock()
+        self._name_locks: dict[str, threading.Lock] = {}
+        self._definitions: dict[str, OneClickDefinition] = {}
+        self.downloads = 0  # full bodies transferred
+        self.revalidations = 0  # 304 Not Modified
+        self.stored_hits = 0  # used the on-disk copy without asking
+
+    def get(self, one_click_app_name: str) -> OneClickDefinition:
+        """The parsed definition of `one_click_app_name`."""
+        with self._lock:
+            name_lock = self._name_locks.setdefault(one_click_app_name, threading.Lock())
+        with name_lock:
+            if one_click_app_name not in self._definitions:
+                raw = self._fetch(one_click_app_name)
+                self._definitions[one_click_app_name] = OneClickDefinition.parse(
+                    one_click_app_name, raw
+                )
+            return self._definitions[one_click_app_name]
+
+    def raw(self, one_click_app_name: str) -> str:
+        return self.get(one_click_app_name).raw
+
+    def serve_downloads_for(self, client) -> None:
+        """Make a CaproverAPI fetch definitions from this repository through us.
+
+        Definitions from any other repository are still downloaded by the client.
+        """
+        original = client._download_one_click_app_defn
+
+        def download(repository_path: str, one_click_app_name: str) -> str:
+            if repository_path != self.repository:
+                return original(repository_path, one_click_app_name)
+            return self.raw(one_click_app_name)
+
+        client._download_one_click_app_defn = download
+
+    def log_stats(self) -> None:
+        logger.info(
+            f"One-click definitions: {self.downloads} downloaded, "
+            f"{self.revalidations} revalidated, {self.stored_hits} used from disk"
+        )
+
+    # --- fetching ------------------------------------------------------------
+
+    def _store_path(self, one_click_app_name: str) -> Path:
+        return self.cache_dir / f"{one_click_app_name}.json"
+
+    def _load_stored(self, one_click_app_name: str) -> dict | None:
+        try:
+            return json.loads(self._store_path(one_click_app_name).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, one_click_app_name: str, entry: dict) -> None:
+        path = self._store_path(one_click_app_name)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(entry))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.debug(f"Could not store one-click definition {path}: {e}")
+
+    def _fetch(self, one_click_app_name: str) -> str:
+        # Built repositories name each definition after its app, with no .yml
+        url = self.repository + one_click_app_name
+        stored = self._load_stored(one_click_app_name)
+        now = time.time()
+        if stored and now - stored["fetched_at"] < stored.get("max_age", 0):
+            self.stored_hits += 1
+            return stored["body"]
+
+        request = urllib.request.Request(url)
+        if stored and stored.get("etag"):
+            request.add_header("If-None-Match", stored["etag"])
+        if stored and stored.get("last_modified"):
+            request.add_header("If-Modified-Since", stored["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request) as resp:
+                body = resp.read().decode()
+                headers = resp.headers
+            self.downloads += 1
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or not stored:
+                raise
+            self.revalidations += 1
+            body, headers = stored["body"], e.headers
+        except (urllib.error.URLError, OSError) as e:
+            if not stored:
+                raise
+            logger.warning(f"Could not reach {url} ({e}); using the stored copy")
+            self.stored_hits += 1
+            return stored["body"]
+
+        logger.debug(f"Fetched one-click definition {url}")
+        self._save(
+            one_click_app_name,
+            {
+                "url": url,
+                "etag": headers.get("ETag") or (stored or {}).get("etag"),
+                "last_modified": headers.get("Last-Modified")
+                or (stored or {}).get("last_modified"),
+                "max_age": _max_age(headers.get("Cache-Control")),
+                "fetched_at": now,
+                "body": body,
+            },
+        )
+        return body
+
+
+def _max_age(cache_control: str | None) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    if not match or "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    return int(match.group(1))
@@ -0,0 +1,424 @@
+"""Dependency-aware scheduling of app installs and uninstalls.
+
+Apps declare their prerequisites in `AppSpec.depends_on` (by one-click app name).
+This module turns a batch of AppSpecs into a DAG and runs it on a bounded
+thread pool: an app starts as soon as everything it depends on has finished,
+so apps with no dependencies between them (e.g. Redis, CoMapeo, Filebrowser)
+install side by side.
+
+Only dependencies *within the batch* are enforced. A prerequisite that is not
+part of the batch is assumed to be satisfied already (installed by an earlier
+run, or an external server), exactly as it was before ordering existed.
+
+Nothing here imports Textual: the TUI and any other front-end drive it through
+callbacks.
+"""
+
+import contextvars
+import logging
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from enum import Enum
+from pathlib import Path
+
+from . import tracing
+from .base import AppSpec, AppStatus, DeploymentContext, app_definitions_by_name
+from .resources import ResourcePlan
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyCycleError(ValueError):
+    """Raised when `depends_on` declarations within a batch form a cycle."""
+
+
+def parallel_limit(value, setting: str) -> int:
+    """The value of a config `setting` that bounds how many tasks run at once.
+
+    Raises
+    ------
+    ValueError
+        Unless it is a whole number of at least 1: with 0 the thread pool
+        refuses to start mid-run, and with less nothing ever starts.
+    """
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = None
+    if limit is None or limit < 1 or str(limit) != str(value).strip():
+        raise ValueError(f"{setting} must be a whole number of at least 1, not {value!r}")
+    return limit
+
+
+class TaskOutcome(str, Enum):
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"  # never started, because a prerequisite failed
+
+
+class Action(Enum):
+    INSTALL = "install"
+    UNINSTALL = "uninstall"
+    REINSTALL = "reinstall"
+    UPDATE = "update"  # apply only what differs from the desired state (see plan.py)
+    NOOP = "noop"
+
+
+def resolve_action(current: AppStatus, checked: bool, update: bool = True) -> Action:
+    """The single source of truth for what a checkbox state means, given
+    where the app currently stands. Both the UI note and the actual
+    install/uninstall dispatch read from this, so they can't disagree.
+
+    `update` says whether a CONFIG_CHANGED app that stays checked is brought
+    in line with its config, or left as it is."""
+    if current == AppStatus.FAILED:
+        return Action.REINSTALL if checked else Action.UNINSTALL
+    if current == AppStatus.CONFIG_CHANGED:
+        if not checked:
+            return Action.UNINSTALL
+        return Action.UPDATE if update else Action.NOOP
+    is_installed = current == AppStatus.INSTALLED
+    if checked and not is_installed:
+        return Action.INSTALL
+    if not checked and is_installed:
+        return Action.UNINSTALL
+    return Action.NOOP
+
+
+def split_by_action(
+    actions: Iterable[tuple[AppSpec, Action]],
+) -> tuple[list[AppSpec], list[AppSpec], list[AppSpec]]:
+    """(to_uninstall, to_install, to_update) for `run_deploy()`; a reinstall is in the first two."""
+    to_uninstall: list[AppSpec] = []
+    to_install: list[AppSpec] = []
+    to_update: list[AppSpec] = []
+    for spec, action in actions:
+        if action in (Action.UNINSTALL, Action.REINSTALL):
+            to_uninstall.append(spec)
+        if action in (Action.INSTALL, Action.REINSTALL):
+            to_install.append(spec)
+        if action is Action.UPDATE:
+            to_update.append(spec)
+    return to_uninstall, to_install, to_update
+
+
+def dependency_graph(specs: Iterable[AppSpec]) -> dict[str, set[str]]:
+    """Map each app id to the ids it depends on, restricted to `specs`.
+
+    App ids are `one_click_app_name`, the same key `depends_on` uses.
+    """
+    specs = list(specs)
+    ids = {s.one_click_app_name for s in specs}
+    return {s.one_click_app_name: set(s.depends_on) & ids for s in specs}
+
+
+def _reverse_graph(graph: dict[str, set[str]]) -> dict[str, set[str]]:
+    """Flip edges: each app then "depends on" the apps that depend on it."""
+    reversed_graph = {app_id: set() for app_id in graph}
+    for app_id, deps in graph.items():
+        for dep in deps:
+            reversed_graph[dep].add(app_id)
+    return reversed_graph
+
+
+def topological_order(specs: Iterable[AppSpec], reverse: bool = False) -> list[AppSpec]:
+    """Order `specs` so that every app comes after its prerequisites.
+
+    Ties are broken by input order (i.e. APPS_REGISTRY order), so the result is
+    deterministic. With `reverse=True`, dependents come before their
+    prerequisites, which is the safe order for uninstalling.
+
+    Raises
+    ------
+    DependencyCycleError
+        If the `depends_on` declarations form a cycle.
+    """
+    specs = list(specs)
+    graph = dependency_graph(specs)
+    if reverse:
+        graph = _reverse_graph(graph)
+    remaining = {app_id: set(deps) for app_id, deps in graph.items()}
+
+    ordered: list[AppSpec] = []
+    while remaining:
+        ready = [
+            s
+            for s in specs
+            if s.one_click_app_name in remaining
+            and not remaining[s.one_click_app_name]
+        ]
+        if not ready:
+            raise DependencyCycleError(
+                f"Dependency cycle among apps: {sorted(remaining)}"
+            )
+        for spec in ready:
+            ordered.append(spec)
+            del remaining[spec.one_click_app_name]
+        for deps in remaining.values():
+            deps.difference_update(s.one_click_app_name for s in ready)
+    return ordered
+
+
+def run_dag(
+    specs: Iterable[AppSpec],
+    task: Callable[[AppSpec], None],
+    *,
+    max_workers: int,
+    reverse: bool = False,
+    on_start: Callable[[AppSpec], None] | None = None,
+    on_finish: Callable[[AppSpec, TaskOutcome], None] | None = None,
+) -> dict[str, TaskOutcome]:
+    """Run `task` once per spec, honouring dependencies, at most `max_workers` at a time.
+
+    A task that raises is logged and recorded as FAILED; every app that
+    (transitively) depends on it is recorded as SKIPPED without running.
+    The callbacks run on the calling thread, never on a pool thread, so
+    callers may treat them as sequential.
+
+    Returns
+    -------
+    Outcome per app id.
+    """
+    max_workers = parallel_limit(max_workers, "max_workers")
+    ordered = topological_order(specs, reverse=reverse)
+    graph = dependency_graph(ordered)
+    if reverse:
+        graph = _reverse_graph(graph)
+    dependents = _reverse_graph(graph)
+    by_id = {s.one_click_app_name: s for s in ordered}
+    waiting_on = {app_id: set(deps) for app_id, deps in graph.items()}
+
+    outcomes: dict[str, TaskOutcome] = {}
+    running = {}  # Future -> app id
+
+    def _finish(app_id: str, outcome: TaskOutcome) -> None:
+        outcomes[app_id] = outcome
+        if on_finish:
+            on_finish(by_id[app_id], outcome)
+
+    def _skip_dependents_of(failed_id: str) -> None:
+        stack = [failed_id]
+        while stack:
+            for dependent in sorted(dependents[stack.pop()]):
+                if dependent in outcomes:
+                    continue
+                by_id[dependent].logger.warning(
+                    f"Skipping {by_id[dependent].app_name}: "
+                    f"prerequisite {by_id[failed_id].app_name} did not succeed"
+                )
+                _finish(dependent, TaskOutcome.SKIPPED)
+                stack.append(dependent)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="gc-deploy"
+    ) as pool:
+        while len(outcomes) < len(ordered):
+            in_flight = set(running.values())
+            for spec in ordered:
+                if len(running) >= max_workers:
+                    break
+                app_id = spec.one_click_app_name
+                if app_id in outcomes or app_id in in_flight or waiting_on[app_id]:
+                    continue
+                if on_start:
+                    on_start(spec)
+                # Tasks see the caller's context variables (active tracer, fleet instance).
+                context = contextvars.copy_context()
+                running[pool.submit(context.run, task, spec)] = app_id
+                in_flight.add(app_id)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                app_id = running.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    by_id[app_id].logger.exception(f"{task.__name__} failed")
+                    _finish(app_id, TaskOutcome.FAILED)
+                    _skip_dependents_of(app_id)
+                else:
+                    _finish(app_id, TaskOutcome.SUCCEEDED)
+                    for deps in waiting_on.values():
+                        deps.discard(app_id)
+    return outcomes
+
+
+def run_deploy(
+    to_uninstall: list[AppSpec],
+    to_install: list[AppSpec],
+    on_status: Callable[[AppSpec, AppStatus], None],
+    max_workers: int,
+    ctx: DeploymentContext | None = None,
+    to_update: Iterable[AppSpec] = (),
+) -> dict[str, TaskOutcome]:
+    """Uninstall then install (or update) a batch of apps, reporting each status change.
+
+    Uninstalls run first, in reverse dependency order, so an app is never
+    removed while something that depends on it is still installed. This
+    also supports "reinstall": the same spec in both lists. Apps `to_update`
+    run alongside the installs, in the same dependency order, but only apply
+    the changes their plan finds (`AppSpec.update()`).
+
+    Given the run's `ctx`, the database needs of every app to install are
+    planned before anything starts, so the first app to install provisions
+    them all in one session, and their docker images start pulling in the
+    background. Pooled Postgres connections are closed at the end.
+    The run is traced into a fresh `ctx.tracer`; a per-app timing summary is
+    logged at the end, and the trace is written under `ctx.trace_dir`.
+    SSL certificates are queued on `ctx.certificates` during the installs and
+    issued after them (see certificates.py); an app whose certificates fail is
+    reported CONFIG_CHANGED, so an update retries them. Each app that uninstalls
+    successfully is dropped from `ctx.state`; each that installs or updates is
+    recorded in it once its certificates are issued, with any that failed.
+    The table of `ctx.resources` (see resources.py) is logged before anything starts.
+
+    Returns
+    -------
+    Outcome per app id of the install phase (or of the uninstall phase, for
+    apps that were only uninstalled).
+    """
+    to_update = list(to_update)
+    if ctx is None:
+        return _run_phases(to_uninstall, to_install, to_update, on_status, max_workers)
+
+    if (to_install or to_update) and ctx.resources:
+        log_resources(ctx.resources)
+    ctx.tracer = tracing.Tracer()
+    with tracing.activate(ctx.tracer):
+        if not ctx.dry_run:
+            ctx.provisioner.plan(to_install + to_update)
+            if ctx.images:
+                ctx.images.start(to_install)
+            ctx.certificates.collect()
+        try:
+            state = None if ctx.dry_run else ctx.state
+            return _run_phases(
+                to_uninstall,
+                to_install,
+                to_update,
+                on_status,
+                max_workers,
+                ctx.caprover,
+                state,
+                lambda: ctx.certificates.issue(ctx.caprover, cancel=ctx.cancel),
+            )
+        finally:
+            ctx.certificates.close()
+            if ctx.images:
+                ctx.images.shutdown()
+            ctx.postgres_pool.close()
+            _report_timings(ctx)
+
+
+def log_resources(resources: ResourcePlan) -> None:
+    for line in resources.lines():
+        logger.info(line)
+
+
+def _report_timings(ctx: DeploymentContext) -> None:
+    lines = ctx.tracer.summary()
+    if lines:
+        logger.info("Timing per app:")
+        for line in lines:
+            logger.info(f"  {line}")
+    if ctx.trace_dir:
+        name = time.strftime("deploy-%Y%m%d-%H%M%S.json", time.localtime(ctx.tracer.started_at))
+        try:
+            path = ctx.tracer.write(Path(ctx.trace_dir) / name)
+        except OSError as e:
+            logger.warning(f"Could not write the deploy trace: {e}")
+        else:
+            logger.info(f"Trace written to {path} (open it in https://ui.perfetto.dev)")
+
+
+def _run_phases(
+    to_uninstall,
+    to_install,
+    to_update,
+    on_status,
+    max_workers,
+    cap=None,
+    state=None,
+    issue_certificates=None,
+):
+    update_ids = {spec.one_click_app_name for spec in to_update}
+
+    def uninstall(spec: AppSpec) -> None:
+        spec.uninstall()
+        if state is not None:
+            state.forget(spec)
+
+    def install(spec: AppSpec) -> None:
+        if spec.one_click_app_name in update_ids:
+            spec.update()
+        else:
+            spec.install()
+
+    uninstall_outcomes = run_dag(
+        to_uninstall,
+        uninstall,
+        max_workers=max_workers,
+        reverse=True,
+        on_start=lambda spec: on_status(spec, AppStatus.UNINSTALLING),
+        on_finish=lambda spec, outcome: _report(
+            on_status, spec, outcome, AppStatus.NOT_INSTALLED
+        ),
+    )
+    install_outcomes = run_dag(
+        [*to_install, *to_update],
+        install,
+        max_workers=max_workers,
+        on_start=lambda spec: on_status(spec, AppStatus.INSTALLING),
+        on_finish=lambda spec, outcome: _report(
+            on_status, spec, outcome, AppStatus.INSTALLED
+        ),
+    )
+    failures = issue_certificates() if issue_certificates is not None else {}
+    if state is not None:
+        _record_installs(state, cap, [*to_install, *to_update], install_outcomes, failures)
+    _report_certificates(failures, [*to_install, *to_update], install_outcomes, on_status)
+    return {**uninstall_outcomes, **install_outcomes}
+
+
+def _record_installs(state, cap, specs, outcomes, failures) -> None:
+    """Record the apps that installed in the deploy state, with their failed certificates.
+
+    An app whose SSL failed is recorded as such, so that probing it reports
+    CONFIG_CHANGED on the next run too, and an update retries it.
+    """
+    installed = [
+        spec for spec in specs if outcomes.get(spec.one_click_app_name) is TaskOutcome.SUCCEEDED
+    ]
+    if not installed:
+        return
+    try:
+        definitions = app_definitions_by_name(cap)
+    except Exception as e:  # the installs themselves succeeded
+        logger.warning(f"Could not record the deploy state: {e}")
+        return
+    for spec in installed:
+        ssl_failed = [name for name in spec.service_names if name in failures]
+        try:
+            state.record_install(spec, definitions, ssl_failed)
+        except Exception as e:
+            spec.logger.warning(f"Could not record the deploy state: {e}")
+
+
+def _report_certificates(failures, specs, outcomes, on_status) -> None:
+    """Mark apps whose certificates failed: up and running, but not as configured."""
+    for spec in specs:
+        failed = [name for name in spec.service_names if name in failures]
+        if not failed or outcomes.get(spec.one_click_app_name) is not TaskOutcome.SUCCEEDED:
+            continue
+        spec.logger.error(f"SSL failed for {', '.join(failed)}; check the app to retry")
+        outcomes[spec.one_click_app_name] = TaskOutcome.FAILED
+        on_status(spec, AppStatus.CONFIG_CHANGED)
+
+
+def _report(on_status, spec: AppSpec, outcome: TaskOutcome, success: AppStatus) -> None:
+    # A skipped app was never touched, so its status is left as-is.
+    if outcome is TaskOutcome.SUCCEEDED:
+        on_status(spec, success)
+    elif outcome is TaskOutcome.FAILED:
+        on_status(spec, AppStatus.FAILED)
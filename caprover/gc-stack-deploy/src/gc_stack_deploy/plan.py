@@ -0,0 +1,351 @@
+"""Work out what deploying an app would change on CapRover, before changing anything.
+
+An app's desired state is what installing it would leave behind: its
+one-click definition rendered with the app's variables, set up the way a
+one-click deploy sets up each service (see one_click.service_settings), with
+the app's own `mutations()` on top (SSL, websockets, memory limits, domains).
+`plan_app()` diffs that, service by service, against the live CapRover app
+definitions: the settings gc-stack-deploy manages, each environment variable
+it sets, and the deployed image.
+
+Only settings the one-click definition or the app's config actually set are
+changes. Those a one-click deploy merely defaults (one instance, port 80,
+exposed as a web app, no volumes, no override) may since have been tuned by
+hand, e.g. a service scaled to three instances: where they differ from a
+fresh install they are the plan's `drift`, reported but left as they are.
+
+The result is an AppPlan: a list of Changes that can be printed (environment
+variable values never are: they hold passwords) and applied. Applying makes
+only the writes the changes need, one batched AppMutation per changed service
+plus a redeploy where the image differs, so updating an app that already
+matches costs nothing but the list_apps call that planned it.
+
+An app may deploy services of its own on top of its one-click definition
+(`AppSpec.deployed_services`, e.g. Windmill's extra worker groups). One
+that is not in CapRover yet is added by the update, and one the config no
+longer wants (`AppSpec.obsolete_services`) is removed, leaving the app's
+other services alone. A missing service of the one-click definition itself
+still takes a reinstall.
+
+Not diffed: values a one-click deploy generates (`$$cap_gen_random_hex`),
+environment variables and domains gc-stack-deploy never sets, and the
+one-click definition of apps from CapRover's public repository
+(`AppSpec.uses_gc_repository = False`), which are planned from their
+mutations alone.
+"""
+
+from dataclasses import dataclass, field
+
+from ruamel.yaml import YAML
+
+from .app_mutation import AppMutation, apply_update
+from .deploy_tracker import DeployTracker
+from .one_click import service_settings
+
+# Stands in for `$$cap_gen_random_hex(n)` while rendering: never diffed.
+GENERATED = "@@generated@@"
+
+# Settings compared as plain values: definition key -> update_app keyword.
+_SCALARS = {
+    "instanceCount": "instance_count",
+    "containerHttpPort": "container_http_port",
+    "forceSsl": "force_ssl",
+    "websocketSupport": "support_websocket",
+}
+# Changes whose values are too long or too secret to print.
+_OPAQUE = ("serviceUpdateOverride",)
+
+
+@dataclass(frozen=True)
+class Change:
+    """One setting of one CapRover app that differs from the desired state."""
+
+    service: str
+    field: str  # definition key, "envVars.<NAME>", "customDomain.<domain>" or "image"
+    current: object
+    desired: object
+
+    def describe(self) -> str:
+        if self.field.startswith("envVars."):
+            verb = "added" if self.current is None else "changed"
+            return f"{self.service}: {self.field} {verb}"
+        if self.field in _OPAQUE:
+            return f"{self.service}: {self.field} changed"
+        return f"{self.service}: {self.field}: {self.current!r} -> {self.desired!r}"
+
+
+@dataclass
+class AppPlan:
+    app_name: str
+    changes: list[Change] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)  # services not in CapRover at all
+    desired: dict[str, dict] = field(default_factory=dict)  # service -> definition
+    added: dict[str, dict] = field(default_factory=dict)  # service -> rendered one-click service
+    removed: list[str] = field(default_factory=list)  # services the app no longer has
+    drift: list[Change] = field(default_factory=list)  # from install defaults; never applied
+
+    @property
+    def empty(self) -> bool:
+        return not self.changes and not self.missing and not self.added and not self.removed
+
+    def fields(self) -> tuple[str, ...]:
+        """The kinds of setting that change, e.g. ("envVars", "forceSsl")."""
+        fields = [c.field.split(".")[0] for c in self.changes]
+        if self.added or self.removed:
+            fields.insert(0, "services")
+        return tuple(dict.fromkeys(fields))
+
+    def lines(self) -> list[str]:
+        lines = [f"{name}: missing (reinstall to recreate)" for name in self.missing]
+        lines += [f"{name}: added" for name in self.added]
+        lines += [f"{name}: removed" for name in self.removed]
+        lines += [change.describe() for change in self.changes]
+        return lines + [f"{change.describe()} (left as is)" for change in self.drift]
+
+    def apply(self, cap, certificates=None, *, timeout: float = 1800, cancel=None) -> None:
+        """Make the changes, and only those; SSL may be left to `certificates`.
+
+        Removed services go first, so what they held is free for the
+        others; added services are deployed last (waiting up to `timeout`
+        for each, see DeployTracker), then changed like the rest.
+
+        Raises
+        ------
+        RuntimeError
+            If a service is missing: that takes a reinstall, not an update.
+        """
+        if self.missing:
+            raise RuntimeError(
+                f"{self.app_name}: {', '.join(self.missing)} missing from CapRover; reinstall it"
+            )
+        for service in self.removed:
+            cap.delete_app(service)
+        self._apply_changes(cap, certificates, [s for s in self.desired if s not in self.added])
+        if self.added:
+            DeployTracker(cap, self.added, timeout=timeout, cancel=cancel).run()
+            self._apply_changes(cap, certificates, list(self.added))
+
+    def _apply_changes(self, cap, certificates, services: list[str]) -> None:
+        for service in services:
+            changes = [c for c in self.changes if c.service == service]
+            if not changes:
+                continue
+            mutation, image = _mutation_for(service, self.desired[service], changes)
+            mutation.apply(cap, certificates)
+            if image:
+                cap.deploy_app(service, image_name=image)
+
+
+def _mutation_for(service: str, desired: dict, changes: list[Change]):
+    mutation = AppMutation(service)
+    image = None
+    for change in changes:
+        name, _, detail = change.field.partition(".")
+        if name == "envVars":
+            mutation.update(environment_variables={detail: change.desired})
+        elif name in _SCALARS:
+            mutation.update(**{_SCALARS[name]: change.desired})
+        elif name == "notExposeAsWebApp":
+            mutation.update(expose_as_web_app=not change.desired)
+        elif name == "ports":
+            mutation.update(
+                port_mapping=[f"{p['hostPort']}:{p['containerPort']}" for p in desired["ports"]]
+            )
+        elif name == "volumes":
+            mutation.update(
+                persistent_directories=[
+                    f"{v.get('volumeName') or v.get('hostPath')}:{v['containerPath']}"
+                    for v in desired["volumes"]
+                ]
+            )
+        elif name == "serviceUpdateOverride":
+            mutation.update(serviceUpdateOverride=desired["serviceUpdateOverride"])
+        elif name == "hasDefaultSubDomainSsl":
+            mutation.enable_ssl()
+        elif name == "customDomain":
+            if change.current is None:
+                mutation.add_domain(detail, ssl=change.desired == "SSL")
+            else:
+                mutation.enable_ssl(detail)
+        elif name == "redirectDomain":
+            mutation.redirect_domain(change.desired)
+        elif name == "image":
+            image = change.desired
+    return mutation, image
+
+
+def _override_data(yaml_str: str | None):
+    return YAML(typ="safe").load(yaml_str or "") or {}
+
+
+def _deployed_image(definition: dict) -> str | None:
+    for version in definition.get("versions") or []:
+        if version.get("version") == definition.get("deployedVersion"):
+            return version.get("deployedImageName")
+    return None
+
+
+def _domains(definition: dict) -> dict[str, str]:
+    return {
+        d["publicDomain"]: "SSL" if d.get("hasSsl") else "no SSL"
+        for d in definition.get("customDomain") or []
+    }
+
+
+def diff_definition(
+    service: str, live: dict, desired: dict, image: str | None = None
+) -> list[Change]:
+    """Changes that turn the `live` definition of `service` into `desired`."""
+    changes = []
+
+    live_env = {e["key"]: e["value"] for e in live.get("envVars") or []}
+    for item in desired.get("envVars") or []:
+        current = live_env.get(item["key"])
+        if current is None or str(current) != str(item["value"]):
+            changes.append(Change(service, f"envVars.{item['key']}", current, item["value"]))
+
+    for key in (*_SCALARS, "notExposeAsWebApp"):
+        wanted = desired.get(key)
+        if wanted is None:
+            continue
+        cast = int if key in ("instanceCount", "containerHttpPort") else bool
+        current = live.get(key)
+        if (current is None and cast is int) or cast(current) != cast(wanted):
+            changes.append(Change(service, key, current, cast(wanted)))
+
+    def ports(d):
+        return sorted((str(p["hostPort"]), str(p["containerPort"])) for p in d.get("ports") or [])
+
+    def volumes(d):
+        return sorted(
+            (v.get("volumeName") or v.get("hostPath"), v["containerPath"])
+            for v in d.get("volumes") or []
+        )
+
+    if ports(live) != ports(desired):
+        changes.append(Change(service, "ports", ports(live), ports(desired)))
+    if volumes(live) != volumes(desired):
+        changes.append(Change(service, "volumes", volumes(live), volumes(desired)))
+    if _override_data(live.get("serviceUpdateOverride")) != _override_data(
+        desired.get("serviceUpdateOverride")
+    ):
+        changes.append(
+            Change(
+                service,
+                "serviceUpdateOverride",
+                live.get("serviceUpdateOverride"),
+                desired.get("serviceUpdateOverride"),
+            )
+        )
+
+    # SSL and domains can only be added through the API, never removed.
+    if desired.get("hasDefaultSubDomainSsl") and not live.get("hasDefaultSubDomainSsl"):
+        changes.append(Change(service, "hasDefaultSubDomainSsl", False, True))
+    live_domains = _domains(live)
+    for domain, ssl in _domains(desired).items():
+        if live_domains.get(domain) not in (ssl, "SSL"):
+            changes.append(Change(service, f"customDomain.{domain}", live_domains.get(domain), ssl))
+    if desired.get("redirectDomain") and desired["redirectDomain"] != live.get("redirectDomain"):
+        changes.append(
+            Change(service, "redirectDomain", live.get("redirectDomain") or "", desired["redirectDomain"])
+        )
+
+    if image and image != _deployed_image(live):
+        changes.append(Change(service, "image", _deployed_image(live), image))
+    return changes
+
+
+def _rendered_services(spec) -> dict[str, tuple[dict, dict, str | None, dict]]:
+    """service -> (update_app settings, defaults, image, service) from the app's one-click definition.
+
+    The settings are those the definition sets; the defaults, those a
+    one-click deploy fills in where it doesn't.
+    """
+    services = spec.deployed_services(
+        spec.one_click_definition().render(
+            spec.app_name,
+            spec.app_variables(),
+            spec.ctx.caprover.root_domain,
+            random_hex=lambda n: GENERATED,
+        )
+    )
+    rendered = {}
+    for name, service in services.items():
+        settings = service_settings(service)
+        settings["environment_variables"] = {
+            k: v
+            for k, v in settings["environment_variables"].items()
+            if GENERATED not in str(v)
+        }
+        # A fresh app's override is empty unless the service has a command.
+        settings.setdefault("serviceUpdateOverride", "")
+        extras = service.get("caproverExtra") or {}
+        given = {
+            "environment_variables": True,
+            "persistent_directories": bool(service.get("volumes")),
+            "expose_as_web_app": "notExposeAsWebApp" in extras,
+            "container_http_port": "containerHttpPort" in extras,
+            "serviceUpdateOverride": bool(service.get("command")),
+        }
+        defaults = {k: v for k, v in settings.items() if not given.get(k)}
+        settings = {k: v for k, v in settings.items() if given.get(k)}
+        image = None if extras.get("dockerfileLines") else service.get("image")
+        rendered[name] = (settings, defaults, image, service)
+    return rendered
+
+
+def _with_settings(definition: dict, settings: dict) -> dict:
+    """`definition` once a one-click deploy has set it up with `settings`."""
+    # Only what the one-click deploy sets; unset keys keep their live values.
+    app = apply_update(definition, **settings)
+    if "environment_variables" in settings:
+        app["envVars"] = [
+            {"key": k, "value": v} for k, v in settings["environment_variables"].items()
+        ]
+    return app
+
+
+def _with_mutations(definition: dict, service: str, mutations) -> dict:
+    for mutation in mutations:
+        if mutation.app_name == service:
+            definition = mutation.render(definition)
+    return definition
+
+
+def plan_app(spec, definitions: dict[str, dict]) -> AppPlan:
+    """What it takes to bring the installed `spec` to its desired state.
+
+    `definitions` are the live CapRover app definitions, keyed by app name.
+    """
+    rendered = _rendered_services(spec) if spec.uses_gc_repository else {}
+    mutations = spec.mutations()
+    services = list(rendered) + [
+        m.app_name for m in mutations if m.app_name not in rendered
+    ]
+
+    plan = AppPlan(spec.app_name)
+    for service in dict.fromkeys(services):
+        live = definitions.get(service)
+        settings, defaults, image, deployed = rendered.get(service, ({}, {}, None, None))
+        if live is None and (deployed is None or service in spec.service_names):
+            plan.missing.append(service)
+            continue
+        if live is None:
+            # Deploying it sets up its one-click settings and image; only its
+            # mutations are left to diff.
+            plan.added[service] = deployed
+            live, image = _with_settings({}, {**defaults, **settings}), None
+        desired = _with_mutations(_with_settings(live, settings), service, mutations)
+        plan.desired[service] = desired
+        changes = diff_definition(service, live, desired, image)
+        plan.changes += changes
+        if defaults:
+            fresh = _with_mutations(
+                _with_settings(live, {**defaults, **settings}), service, mutations
+            )
+            changed = {c.field for c in changes}
+            plan.drift += [
+                c for c in diff_definition(service, live, fresh) if c.field not in changed
+            ]
+    plan.removed = [name for name in spec.obsolete_services(definitions) if name in definitions]
+    return plan
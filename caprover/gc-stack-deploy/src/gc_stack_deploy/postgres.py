@@ -0,0 +1,251 @@
+"""PostgreSQL connections and database provisioning shared across a deploy run.
+
+PostgresPool: reusable connections keyed by (user, dbname), so apps installing
+    one after another (or side by side) don't each pay a new TLS handshake and
+    authentication round-trip. This matters most against remote servers such
+    as Azure Flexible Server.
+
+DatabaseProvisioner: collects every selected app's `databases` and
+    `provisioning_sql()` up front, then creates them all in one admin session
+    the first time any app needs them.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import psycopg
+from psycopg import sql
+
+from . import tracing
+from .readiness import ReadinessTimeout, wait_until
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PostgresConnectionConfig:
+    """Connection info for a PostgreSQL server in a Docker container."""
+
+    host: str
+    user: str
+    password: str
+    ssl: bool
+    port: int = 5432
+
+    def connstr(self, dbname=None):
+        sslmode = "require" if self.ssl else "disable"
+        s = (
+            f"host={self.host} port={self.port} user={self.user} "
+            f"password={self.password} sslmode={sslmode}"
+        )
+        if dbname:
+            s += f" dbname={dbname}"
+        return s
+
+
+def connect_with_retries(*args, timeout=60, cancel=None, **kwargs):
+    """
+    Open a PostgreSQL connection, retrying while the server is not ready yet.
+
+    Retries back off exponentially (with jitter) from a fraction of a second,
+    so a server that is already up costs no waiting at all.
+
+    Parameters
+    ----------
+    *args :
+        Positional arguments passed directly to psycopg.connect.
+    timeout : float, optional
+        Seconds to keep retrying before giving up (default 60).
+    cancel : threading.Event, optional
+        Stop retrying as soon as this is set.
+    **kwargs :
+        Keyword arguments passed directly to psycopg.connect.
+
+    Returns
+    -------
+    psycopg.Connection
+        A live PostgreSQL connection object. The caller must close it.
+
+    Raises
+    ------
+    psycopg.OperationalError
+        If connection cannot be established before the timeout.
+    """
+
+    def attempt():
+        try:
+            return psycopg.connect(*args, **kwargs)
+        except psycopg.OperationalError as e:
+            errors.append(e)
+            return None
+
+    errors = []
+    try:
+        return wait_until(
+            attempt, description="PostgreSQL server", timeout=timeout, cancel=cancel
+        )
+    except ReadinessTimeout:
+        raise errors[-1]
+
+
+@contextmanager
+def postgres_patient_connect(*args, timeout=60, cancel=None, **kwargs):
+    """
+    Context manager that retries initial PostgreSQL connection (e.g. waits for server to be ready)
+
+    After successful connect, it does not retry or reconnect for subsequent errors
+    during the context block. Takes the same arguments as `connect_with_retries`.
+
+    Yields
+    ------
+    psycopg.Connection
+        A live PostgreSQL connection object.
+    """
+    with connect_with_retries(*args, timeout=timeout, cancel=cancel, **kwargs) as conn:
+        yield conn
+
+
+class PostgresPool:
+    """Thread-safe pool of idle connections, keyed by (user, dbname).
+
+    A connection is only ever used by the thread that borrowed it. Connections
+    are opened on demand (waiting for the server to be ready) and kept open
+    until `close()`. `timeout` and `cancel` bound how long opening one waits
+    for the server (see connect_with_retries).
+    """
+
+    def __init__(self, timeout: float = 60, cancel: threading.Event | None = None):
+        self.timeout = timeout
+        self.cancel = cancel
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, list] = defaultdict(list)
+        self.opened = 0  # connections created over the pool's lifetime
+
+    @contextmanager
+    def connection(
+        self, cfg: PostgresConnectionConfig, dbname: str | None = None, autocommit=True
+    ):
+        """Borrow a connection as `cfg.user` to `dbname` (the user's default db if None).
+
+        Without autocommit, the transaction commits when the block exits
+        normally and rolls back if it raises.
+        """
+        key = (cfg.user, dbname)
+        conn = None
+        with self._lock:
+            while self._idle[key] and conn is None:
+                candidate = self._idle[key].pop()
+                if not (candidate.closed or candidate.broken):
+                    conn = candidate
+        if conn is None:
+            with tracing.span("postgres.connect", "postgres", user=cfg.user, dbname=dbname):
+                conn = connect_with_retries(
+                    cfg.connstr(dbname),
+                    timeout=self.timeout,
+                    cancel=self.cancel,
+                    autocommit=autocommit,
+                )
+            with self._lock:
+                self.opened += 1
+        conn.autocommit = autocommit
+
+        try:
+            yield conn
+            if not autocommit:
+                conn.commit()
+        except BaseException:
+            if not conn.closed and not conn.broken:
+                conn.rollback()
+            raise
+        finally:
+            if not (conn.closed or conn.broken):
+                with self._lock:
+                    self._idle[key].append(conn)
+
+    @contextmanager
+    def dedicated(self, cfg: PostgresConnectionConfig, dbname: str | None = None):
+        """A connection of its own, outside the pool, closed afterwards.
+
+        A single attempt, for polling a server that may be restarting without
+        disturbing the pooled connections others are using.
+        """
+        with psycopg.connect(cfg.connstr(dbname), connect_timeout=5, autocommit=True) as conn:
+            yield conn
+
+    def close(self) -> None:
+        """Close every idle connection. The pool can still be used afterwards."""
+        with self._lock:
+            idle, self._idle = self._idle, defaultdict(list)
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class DatabaseProvisioner:
+    """Creates the databases, roles and grants that the apps in a run need.
+
+    `plan()` registers what the whole batch needs. The first `ensure()` call
+    then provisions all of it in a single admin session; later calls only
+    connect if they ask for something the batch didn't cover.
+    """
+
+    def __init__(self, pool: PostgresPool, admin: PostgresConnectionConfig):
+        self.pool = pool
+        self.admin = admin
+        self._lock = threading.Lock()
+        self._databases: list[str] = []
+        self._statements: list = []
+        self._done_databases: set[str] = set()
+        self._done_statements: list = []
+
+    def plan(self, specs) -> None:
+        """Register the databases and SQL of every spec that is about to be installed."""
+        with self._lock:
+            for spec in specs:
+                for dbname in spec.databases:
+                    if dbname not in self._databases:
+                        self._databases.append(dbname)
+                self._statements.extend(
+                    s for s in spec.provisioning_sql() if s not in self._statements
+                )
+
+    def ensure(self, databases=(), statements=()) -> None:
+        """Make sure `databases` exist and `statements` have run, batching pending work."""
+        with self._lock:
+            for dbname in databases:
+                if dbname not in self._databases:
+                    self._databases.append(dbname)
+            self._statements.extend(s for s in statements if s not in self._statements)
+
+            pending_dbs = [d for d in self._databases if d not in self._done_databases]
+            pending_sql = [s for s in self._statements if s not in self._done_statements]
+            if not pending_dbs and not pending_sql:
+                return
+
+            logger.info(
+                f"Provisioning {len(pending_dbs)} database(s) and "
+                f"{len(pending_sql)} role/grant statement(s) in one session"
+            )
+            with tracing.span(
+                "postgres.provision",
+                "postgres",
+                databases=len(pending_dbs),
+                statements=len(pending_sql),
+            ), self.pool.connection(self.admin) as conn, conn.cursor() as cur:
+                cur.execute("SELECT datname FROM pg_database")
+                existing = {row[0] for row in cur.fetchall()}
+                for dbname in pending_dbs:
+                    if dbname not in existing:
+                        cur.execute(
+                            sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname))
+                        )
+                    self._done_databases.add(dbname)
+                for statement in pending_sql:
+                    try:
+                        cur.execute(statement)
+                    except psycopg.errors.DuplicateObject:
+                        pass  # role already exists from an earlier run
+                    self._done_statements.append(statement)
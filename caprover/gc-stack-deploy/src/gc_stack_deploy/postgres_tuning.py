@@ -0,0 +1,163 @@
+"""Tune the stack's own Postgres server to its share of the VM.
+
+The one-click Postgres runs on the image's defaults (128MB of
+shared_buffers, 4MB of work_mem, 100 connections, ...), whatever the VM. Once
+Postgres is installed (or updated), `tuned_settings()` derives the main
+memory, parallelism and autovacuum settings from the service's memory and
+CPU limits (see resources.py) and from how many connections the configured
+apps may open, and a PostgresTuner applies them:
+
+- `ALTER SYSTEM` writes every setting to postgresql.auto.conf, then the
+  configuration is reloaded;
+- if a setting that only takes effect on restart (shared_buffers,
+  max_connections, ...) differs from what was last written, or is still
+  waiting for a restart, the service is restarted and waited for;
+- the values the server actually runs with are then logged.
+
+Settings that are already in place cause no restart, so tuning again on
+every deploy is safe.
+"""
+
+import logging
+import math
+import threading
+from collections.abc import Callable
+
+import psycopg
+from psycopg import sql
+
+from . import tracing
+from .postgres import PostgresConnectionConfig, PostgresPool
+from .readiness import wait_until
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024**2
+GiB = 1024**3
+
+# Each setting's row in pg_settings, and what postgresql.auto.conf says now.
+_CURRENT = """
+SELECT s.name, s.context, s.pending_restart, f.setting
+FROM pg_settings s
+LEFT JOIN pg_file_settings f
+  ON f.name = s.name AND f.sourcefile LIKE '%%postgresql.auto.conf'
+WHERE s.name = ANY(%s)
+"""
+
+
+def _mb(n: float) -> str:
+    return f"{int(n) // MiB}MB"
+
+
+def tuned_settings(memory: int, cpus: float, connections: int) -> dict[str, str]:
+    """Postgres settings for a server limited to `memory` bytes and `cpus` CPUs.
+
+    `connections` is how many connections the apps may open at once;
+    10 more are left for admin sessions such as this script's.
+    """
+    cpus = max(1, math.ceil(cpus))
+    max_connections = max(100, math.ceil((connections + 10) / 10) * 10)
+    shared_buffers = max(128 * MiB, memory // 4)
+    maintenance_work_mem = min(2 * GiB, memory // 16)
+    autovacuum_workers = min(6, max(2, cpus))
+    autovacuum_work_mem = max(64 * MiB, maintenance_work_mem // autovacuum_workers)
+    # A query may use a few work_mem at once (sorts, hashes).
+    work_mem = max(4 * MiB, (memory - shared_buffers) // (max_connections * 3))
+    return {
+        "max_connections": str(max_connections),
+        "shared_buffers": _mb(shared_buffers),
+        "effective_cache_size": _mb(memory * 3 // 4),
+        "work_mem": _mb(work_mem),
+        "maintenance_work_mem": _mb(maintenance_work_mem),
+        "max_worker_processes": str(max(8, cpus)),
+        "max_parallel_workers": str(cpus),
+        "max_parallel_workers_per_gather": str(max(1, cpus // 2)),
+        "random_page_cost": "1.1",  # cloud disks are SSDs
+        "autovacuum_max_workers": str(autovacuum_workers),
+        "autovacuum_work_mem": _mb(autovacuum_work_mem),
+        "autovacuum_vacuum_scale_factor": "0.05",
+        "autovacuum_analyze_scale_factor": "0.02",
+        "autovacuum_vacuum_cost_limit": "1000",
+    }
+
+
+class PostgresTuner:
+    """Applies settings to a running server as `admin` (a superuser).
+
+    `restart` restarts the server's service (it needn't wait for it).
+    """
+
+    def __init__(
+        self,
+        pool: PostgresPool,
+        admin: PostgresConnectionConfig,
+        restart: Callable[[], None],
+        *,
+        timeout: float = 300,
+        cancel: threading.Event | None = None,
+    ):
+        self.pool = pool
+        self.admin = admin
+        self.restart = restart
+        self.timeout = timeout
+        self.cancel = cancel
+
+    def apply(self, settings: dict[str, str]) -> dict[str, str]:
+        """Apply `settings`, restarting the server if need be.
+
+        Returns
+        -------
+        The value the server runs with for each setting.
+        """
+        with tracing.span("postgres.tune", "postgres"), self.pool.connection(
+            self.admin
+        ) as conn:
+            rows = conn.execute(_CURRENT, [list(settings)]).fetchall()
+            needs_restart = [
+                name
+                for name, context, pending, written in rows
+                if context == "postmaster" and (pending or written != settings[name])
+            ]
+            for name, value in settings.items():
+                conn.execute(
+                    sql.SQL("ALTER SYSTEM SET {} = {}").format(
+                        sql.Identifier(name), sql.Literal(value)
+                    )
+                )
+            conn.execute("SELECT pg_reload_conf()")
+            started = conn.execute("SELECT pg_postmaster_start_time()").fetchone()[0]
+
+        if needs_restart:
+            logger.info(f"Restarting Postgres to change {', '.join(needs_restart)}")
+            self.restart()
+            wait_until(
+                lambda: self._restarted_since(started),
+                description="Postgres to restart",
+                timeout=self.timeout,
+                cancel=self.cancel,
+            )
+            # The idle pooled connections were to the old server: reconnect once.
+            self.pool.close()
+        return self.effective(settings)
+
+    def _restarted_since(self, started) -> bool:
+        # Probed outside the pool, which other apps of the run are using meanwhile.
+        try:
+            with self.pool.dedicated(self.admin) as conn:
+                now = conn.execute("SELECT pg_postmaster_start_time()").fetchone()[0]
+        except psycopg.OperationalError:
+            return False
+        return now > started
+
+    def effective(self, settings) -> dict[str, str]:
+        """Log and return the value the server runs with for each of `settings`."""
+        with self.pool.connection(self.admin) as conn:
+            effective = dict(
+                conn.execute(
+                    "SELECT name, current_setting(name) FROM unnest(%s::text[]) AS name",
+                    [list(settings)],
+                ).fetchall()
+            )
+        for name, value in effective.items():
+            logger.info(f"Postgres {name} = {value}")
+        return effective
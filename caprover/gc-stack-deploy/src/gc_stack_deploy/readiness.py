@@ -0,0 +1,205 @@
+"""Wait for services to become ready by polling real signals instead of sleeping.
+
+`wait_until()` polls a check with exponential backoff and jitter until it
+passes, a deadline expires, or the run is cancelled. The checks below each
+answer one question cheaply, and never raise for "not ready yet":
+
+- tcp_port_open: is anything listening?
+- http_responds: does an HTTP endpoint answer (with anything but a 5xx)?
+- postgres_accepts_connections: would `pg_isready` succeed?
+- caprover_app_built: has CapRover finished building/deploying the app?
+- docker_service_converged: is the Swarm service's latest task running?
+  (docker_service_running also says when Docker can't tell)
+
+Fast machines finish waiting as soon as the signal flips; slow ones get a
+clear ReadinessTimeout instead of a silent failure later on.
+"""
+
+import logging
+import random
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+import psycopg
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessTimeout(TimeoutError):
+    """The awaited signal did not show up before the deadline."""
+
+
+class ReadinessCancelled(RuntimeError):
+    """The run was cancelled (e.g. the user quit) while waiting."""
+
+
+@dataclass
+class Backoff:
+    """Exponential backoff with "full jitter" between polls.
+
+    Each delay is drawn uniformly from [0, min(maximum, initial * factor**n)],
+    so many waiters polling the same thing don't fall into lockstep. With
+    `equal_jitter`, from the upper half of that range instead: for retries
+    that must never come straight back (e.g. rate-limited ones).
+    """
+
+    initial: float = 0.25
+    factor: float = 2.0
+    maximum: float = 10.0
+    equal_jitter: bool = False
+
+    def delays(self) -> Iterator[float]:
+        ceiling = self.initial
+        while True:
+            yield random.uniform(ceiling / 2 if self.equal_jitter else 0, ceiling)
+            ceiling = min(self.maximum, ceiling * self.factor)
+
+
+def wait_until(
+    check: Callable[[], object],
+    *,
+    description: str,
+    timeout: float,
+    cancel: threading.Event | None = None,
+    backoff: Backoff | None = None,
+):
+    """Poll `check` until it returns something truthy, and return that.
+
+    Exceptions raised by `check` count as "not ready" and are chained onto
+    the ReadinessTimeout if the deadline passes.
+
+    Raises
+    ------
+    ReadinessTimeout
+        If `timeout` seconds pass without `check` succeeding.
+    ReadinessCancelled
+        If `cancel` is set while waiting.
+    """
+    with tracing.span("wait", "wait", description=description):
+        return _poll(check, description, timeout, cancel, backoff or Backoff())
+
+
+def _poll(check, description, timeout, cancel, backoff):
+    deadline = time.monotonic() + timeout
+    last_exc = None
+    for delay in backoff.delays():
+        if cancel is not None and cancel.is_set():
+            raise ReadinessCancelled(f"Cancelled while waiting for {description}")
+        try:
+            result = check()
+        except Exception as e:
+            last_exc = e
+            logger.debug(f"Waiting for {description}: {e}")
+        else:
+            if result:
+                return result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ReadinessTimeout(
+                f"{description} not ready after {timeout:.0f}s"
+            ) from last_exc
+        # Event.wait doubles as an interruptible sleep.
+        (cancel or threading.Event()).wait(min(delay, remaining))
+
+
+def tcp_port_open(host: str, port: int, timeout: float = 2.0) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def http_responds(url: str, timeout: float = 5.0) -> bool:
+    """True once `url` answers with any status below 500.
+
+    4xx still means the app is up (e.g. a login redirect or auth wall);
+    5xx is what CapRover's nginx returns while the container is down.
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=timeout):
+            return True
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def postgres_accepts_connections(connstr: str, timeout: float = 5.0) -> bool:
+    """Like `pg_isready`: can a session be opened right now?"""
+    try:
+        with psycopg.connect(connstr, connect_timeout=max(1, int(timeout))):
+            return True
+    except psycopg.OperationalError:
+        return False
+
+
+def caprover_app_built(cap, app_name: str) -> bool:
+    """True once CapRover has finished building and deploying `app_name`.
+
+    Raises RuntimeError if the build failed, since waiting longer won't help.
+    """
+    data = cap.get_app_info(app_name).get("data", {})
+    if data.get("isBuildFailed"):
+        raise RuntimeError(f"CapRover build of {app_name} failed")
+    return not data.get("isAppBuilding")
+
+
+def docker_service_converged(app_name: str) -> bool:
+    """True once the CapRover app's Swarm service has finished any rolling
+    update and has a running task.
+
+    Only meaningful when this script runs on the CapRover host itself:
+    anywhere else it is always False, so checks that must also work off-host
+    should use docker_service_running and treat None as unknown.
+    """
+    return docker_service_running(app_name) is True
+
+
+def docker_service_running(app_name: str) -> bool | None:
+    """Like docker_service_converged, but None if Docker can't tell (e.g. this
+    is not the CapRover host, or the service doesn't exist)."""
+    service = f"srv-captain--{app_name}"
+    with tracing.span("docker.service", "docker", service=service):
+        try:
+            return _service_converged(service)
+        except OSError:  # no docker here
+            return None
+
+
+def _service_converged(service: str) -> bool | None:
+    inspect = subprocess.run(
+        ["docker", "service", "inspect", "--format", "{{.UpdateStatus.State}}", service],
+        capture_output=True,
+        text=True,
+    )
+    if inspect.returncode != 0:
+        return None
+    if inspect.stdout.strip() not in ("", "<no value>", "completed"):
+        return False  # "updating", "paused", "rollback_*"
+    tasks = subprocess.run(
+        [
+            "docker",
+            "service",
+            "ps",
+            service,
+            "--filter",
+            "desired-state=running",
+            "--format",
+            "{{.CurrentState}}",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    return tasks.returncode == 0 and any(
+        line.startswith("Running") for line in tasks.stdout.splitlines()
+    )
@@ -0,0 +1,245 @@
+"""Share the VM's memory and CPUs between the services of the stack.
+
+Every service used to get the same 1.5 GiB memory limit (and no CPU limit),
+whatever the size of the VM: on the default 4 GB VM, a handful of apps could
+together be allowed several times the memory there is, and the kernel, not
+Docker, ended up picking what to kill.
+
+Instead, a ResourceBudget (the host's memory and CPUs, or the stack config's
+`resources:` section, less what is kept back for Docker, CapRover and the OS)
+is divided between the services of every configured app, in proportion to
+each app's `resource_profile` (a weight per service suffix):
+
+- Reservations add up to the budget, so Swarm never schedules more than the
+  VM holds;
+- Limits let each service burst above its share (`memoryBurst`, `cpuBurst`
+  times it), never beyond the budget.
+
+A service running several instances (`AppSpec.instance_counts`) splits its
+reservation between them, while each may burst to the service's limit, so
+scaling a service changes nothing for the others.
+
+Both are written to the services' serviceUpdateOverride:
+
+    TaskTemplate:
+      Resources:
+        Limits: {MemoryBytes: ..., NanoCPUs: ...}
+        Reservations: {MemoryBytes: ..., NanoCPUs: ...}
+
+The stack config may set any of:
+
+    resources:
+      memory: 8GiB          # default: this host's memory
+      cpus: 4               # default: this host's CPU count
+      reservedMemory: 1GiB  # kept back for Docker, CapRover and the OS
+      reservedCpus: 0.5
+      memoryBurst: 1.5      # limit = share * burst
+      cpuBurst: 3
+      weights:              # scale an app's share, by its config key
+        windmill-only: 2
+"""
+
+import functools
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+
+from .service_override import OverrideDocument, override_transform
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024**2
+GiB = 1024**3
+NANO_CPUS = 10**9
+MIN_MEMORY_LIMIT = 256 * MiB  # below this, expect services to be OOM-killed
+
+_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "kib": 1024,
+    "m": 1000**2,
+    "mb": 1000**2,
+    "mib": MiB,
+    "g": 1000**3,
+    "gb": 1000**3,
+    "gib": GiB,
+}
+
+
+def parse_bytes(value) -> int:
+    """A size in bytes, from an int or a string such as "512MiB" or "8G"."""
+    if isinstance(value, int | float):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match[2].lower() not in _UNITS:
+        raise ValueError(f"Not a size: {value!r} (expected e.g. 512MiB or 8GiB)")
+    return int(float(match[1]) * _UNITS[match[2].lower()])
+
+
+def format_bytes(n: int) -> str:
+    return f"{n / GiB:.1f} GiB" if n >= GiB else f"{n / MiB:.0f} MiB"
+
+
+def host_resources() -> tuple[int, float] | None:
+    """This host's memory in bytes and CPU count; None where they can't be read."""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+    return memory, float(os.cpu_count() or 1)
+
+
+@dataclass(frozen=True)
+class Allocation:
+    """One service's share of the budget."""
+
+    memory_reservation: int  # bytes
+    memory_limit: int
+    cpu_reservation: float  # CPUs
+    cpu_limit: float
+    instances: int = 1  # reservations are each instance's, limits the service's
+
+    def transform(self):
+        """A serviceUpdateOverride transform writing this allocation."""
+        transform = functools.partial(set_resources, allocation=self)
+        transform.accepts_document = True
+        return transform
+
+
+@override_transform
+def set_resources(suo: OverrideDocument, allocation: Allocation) -> None:
+    resources = "TaskTemplate.Resources"
+    suo.set(f"{resources}.Limits.MemoryBytes", allocation.memory_limit)
+    suo.set(f"{resources}.Limits.NanoCPUs", int(allocation.cpu_limit * NANO_CPUS))
+    suo.set(f"{resources}.Reservations.MemoryBytes", allocation.memory_reservation)
+    suo.set(
+        f"{resources}.Reservations.NanoCPUs", int(allocation.cpu_reservation * NANO_CPUS)
+    )
+
+
+@dataclass
+class ResourcePlan:
+    """The allocation of every planned service, by CapRover app name."""
+
+    budget: "ResourceBudget"
+    allocations: dict[str, Allocation] = field(default_factory=dict)
+    postgres_connections: int = 0  # how many the planned apps may open at once
+
+    def allocation(self, service_name: str) -> Allocation | None:
+        return self.allocations.get(service_name)
+
+    def lines(self) -> list[str]:
+        """The allocation table, one line per service."""
+        budget = self.budget
+        names = {
+            name: name if a.instances == 1 else f"{name} x{a.instances}"
+            for name, a in self.allocations.items()
+        }
+        width = max([len("service"), *map(len, names.values())])
+        lines = [
+            f"Resources: {format_bytes(budget.memory)} and {budget.cpus:g} CPUs for "
+            f"{len(self.allocations)} services "
+            f"({format_bytes(budget.reserved_memory)} and {budget.reserved_cpus:g} CPUs "
+            f"kept back)",
+            f"  {'service':<{width}}  memory reserved / limit  CPUs reserved / limit",
+        ]
+        for name, a in self.allocations.items():
+            memory = f"{format_bytes(a.memory_reservation)} / {format_bytes(a.memory_limit)}"
+            lines.append(
+                f"  {names[name]:<{width}}  {memory:<23}  {a.cpu_reservation:.2f} / {a.cpu_limit:.2f}"
+            )
+        return lines
+
+
+@dataclass
+class ResourceBudget:
+    """What the apps may use between them, and how their shares may burst."""
+
+    memory: int  # bytes, already less reserved_memory
+    cpus: float
+    reserved_memory: int = 0
+    reserved_cpus: float = 0
+    memory_burst: float = 1.5
+    cpu_burst: float = 3.0
+    weights: dict[str, float] = field(default_factory=dict)  # by one_click_app_name
+
+    @classmethod
+    def from_config(cls, config: dict, detect_host: bool = True) -> "ResourceBudget | None":
+        """The budget of a stack config's `resources:` section, filled in from this host.
+
+        Returns None if the memory or the CPUs are neither configured nor
+        detectable (e.g. `detect_host` is False because this is not the VM).
+        """
+        section = config.get("resources") or {}
+        host = host_resources() if detect_host else None
+        if "memory" in section:
+            memory = parse_bytes(section["memory"])
+        elif host:
+            memory = host[0]
+        else:
+            return None
+        if "cpus" in section:
+            cpus = float(section["cpus"])
+        elif host:
+            cpus = host[1]
+        else:
+            return None
+        reserved_memory = parse_bytes(section.get("reservedMemory", "1GiB"))
+        reserved_cpus = float(section.get("reservedCpus", 0.5 if cpus > 1 else 0))
+        if reserved_memory >= memory or reserved_cpus >= cpus:
+            raise ValueError(
+                f"resources: keeping back {format_bytes(reserved_memory)} and "
+                f"{reserved_cpus:g} CPUs leaves nothing of {format_bytes(memory)} "
+                f"and {cpus:g} CPUs"
+            )
+        return cls(
+            memory=memory - reserved_memory,
+            cpus=cpus - reserved_cpus,
+            reserved_memory=reserved_memory,
+            reserved_cpus=reserved_cpus,
+            memory_burst=float(section.get("memoryBurst", 1.5)),
+            cpu_burst=float(section.get("cpuBurst", 3.0)),
+            weights={k: float(v) for k, v in (section.get("weights") or {}).items()},
+        )
+
+    def allocate(self, specs) -> ResourcePlan:
+        """Divide the budget between the services of `specs`, by weight."""
+        weights, instances = {}, {}
+        for spec in specs:
+            scale = self.weights.get(spec.one_click_app_name, 1.0)
+            for suffix, weight in spec.resource_profile.items():
+                if weight * scale > 0:
+                    weights[spec.app_name + suffix] = weight * scale
+                    # A service scaled down to none keeps its share for later.
+                    instances[spec.app_name + suffix] = max(
+                        1, spec.instance_counts.get(suffix, 1)
+                    )
+        total = sum(weights.values())
+        plan = ResourcePlan(
+            self,
+            postgres_connections=sum(
+                spec.postgres_connections() for spec in specs if not spec.pooled
+            ),
+        )
+        for name, weight in weights.items():
+            share = weight / total
+            memory = int(self.memory * share) // MiB * MiB
+            n = instances[name]
+            plan.allocations[name] = Allocation(
+                memory_reservation=memory // n // MiB * MiB,
+                memory_limit=min(self.memory, int(memory * self.memory_burst) // MiB * MiB),
+                cpu_reservation=round(self.cpus * share / n, 3),
+                cpu_limit=round(min(self.cpus, self.cpus * share * self.cpu_burst), 3),
+                instances=n,
+            )
+        starved = [n for n, a in plan.allocations.items() if a.memory_limit < MIN_MEMORY_LIMIT]
+        if starved:
+            logger.warning(
+                f"Memory budget of {format_bytes(self.memory)} is too small: "
+                f"{', '.join(starved)} would be limited to under "
+                f"{format_bytes(MIN_MEMORY_LIMIT)}"
+            )
+        return plan
@@ -0,0 +1,148 @@
+"""Edit a CapRover serviceUpdateOverride YAML document in memory.
+
+An app's serviceUpdateOverride is a YAML string merged into its Docker Swarm
+service spec. Rather than parse and re-serialize that string once per edit,
+parse it once into an OverrideDocument, apply any number of path-based edits,
+and dump it once:
+
+    doc = OverrideDocument.parse(suo)
+    doc.set("TaskTemplate.Resources.Limits.MemoryBytes", 1610612736)
+    doc.delete("TaskTemplate.ContainerSpec.HealthCheck")
+    suo = doc.dump()
+
+Transforms written with `@override_transform` take and return either a YAML
+string or an OverrideDocument, so the same function works standalone and in
+an `apply_overrides()` pipeline (where the document is parsed only once).
+"""
+
+import functools
+import io
+from collections.abc import Callable, Iterable, Mapping
+
+from ruamel.yaml import YAML
+
+Path = str | Iterable[str]
+
+
+def _keys(path: Path) -> list[str]:
+    """Dot-delimited string (e.g. "a.b.c") or list of key segments."""
+    return path.split(".") if isinstance(path, str) else list(path)
+
+
+class OverrideDocument:
+    """A parsed serviceUpdateOverride, edited in place. Edit methods return self."""
+
+    def __init__(self, data=None, yaml: YAML | None = None):
+        self.data = {} if data is None else data
+        self._yaml = yaml or self._new_yaml()
+
+    @staticmethod
+    def _new_yaml() -> YAML:
+        ryaml = YAML()
+        ryaml.preserve_quotes = True
+        return ryaml
+
+    @classmethod
+    def parse(cls, yaml_str: str | None) -> "OverrideDocument":
+        """Parse a YAML string; empty or None is an empty document."""
+        ryaml = cls._new_yaml()
+        return cls(ryaml.load(yaml_str or "") or {}, ryaml)
+
+    def dump(self) -> str:
+        buf = io.StringIO()
+        self._yaml.dump(self.data, buf)
+        return buf.getvalue()
+
+    def _parent(self, keys: list[str], create: bool):
+        node = self.data
+        for key in keys[:-1]:
+            if create:
+                node = node.setdefault(key, {})
+            elif isinstance(node, Mapping) and key in node:
+                node = node[key]
+            else:
+                return None
+        return node
+
+    def get(self, path: Path, default=None):
+        keys = _keys(path)
+        parent = self._parent(keys, create=False)
+        if not isinstance(parent, Mapping):
+            return default
+        return parent.get(keys[-1], default)
+
+    def set(self, path: Path, value) -> "OverrideDocument":
+        """Set a value at a (nested) key, creating intermediate mappings as needed."""
+        keys = _keys(path)
+        self._parent(keys, create=True)[keys[-1]] = value
+        return self
+
+    def delete(self, path: Path) -> "OverrideDocument":
+        """Remove a key if present. Parent mappings are left in place."""
+        keys = _keys(path)
+        parent = self._parent(keys, create=False)
+        if isinstance(parent, Mapping):
+            parent.pop(keys[-1], None)
+        return self
+
+    def merge(self, path: Path, values: Mapping) -> "OverrideDocument":
+        """Deep-merge `values` into the mapping at `path` (created if missing)."""
+        target = self.get(path)
+        if not isinstance(target, Mapping):
+            target = {}
+            self.set(path, target)
+        _deep_merge(target, values)
+        return self
+
+    def append(self, path: Path, *items) -> "OverrideDocument":
+        """Append to the list at `path` (created if missing)."""
+        target = self.get(path)
+        if not isinstance(target, list):
+            target = []
+            self.set(path, target)
+        target.extend(items)
+        return self
+
+
+def _deep_merge(target, values: Mapping) -> None:
+    for key, value in values.items():
+        if isinstance(value, Mapping) and isinstance(target.get(key), Mapping):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def override_transform(edit: Callable[..., None]):
+    """Turn an in-place edit of an OverrideDocument into a transform.
+
+    The transform accepts an OverrideDocument (edited and returned as-is) or a
+    YAML string (parsed, edited and returned re-serialized).
+    """
+
+    @functools.wraps(edit)
+    def transform(suo, *args, **kwargs):
+        if isinstance(suo, OverrideDocument):
+            edit(suo, *args, **kwargs)
+            return suo
+        doc = OverrideDocument.parse(suo)
+        edit(doc, *args, **kwargs)
+        return doc.dump()
+
+    transform.accepts_document = True
+    return transform
+
+
+def apply_overrides(suo: str | None, *transforms) -> str:
+    """Apply transforms left to right, parsing and serializing `suo` only once.
+
+    Plain string -> string transforms still work, at the cost of a round-trip
+    each: they are handed the serialized document and their result is parsed
+    again.
+    """
+    doc = OverrideDocument.parse(suo)
+    for transform in transforms:
+        if getattr(transform, "accepts_document", False):
+            doc = transform(doc)
+        else:
+            doc = OverrideDocument.parse(transform(doc.dump()))
+    return doc.dump()
@@ -9,23 +9,17 @@ Guardian Connector stack.  The script is able to inject the same variable value
 
 """
 
+# Only light modules are imported up here. Each subcommand imports what it
+# needs (CapRover client, Postgres driver, Textual, ...) once it knows it
+# needs it, so `init` and `--help` start instantly; see tests/startup_test.py.
 import argparse
-import http.server
-import importlib.resources
 import logging
 import os
 import shutil
-import socketserver
 import sys
-import threading
 from contextlib import nullcontext
 
-from caprover_api import caprover_api
-from ruamel.yaml import YAML
-
-from .apps_registry import PostgresApp
-from .base import DeploymentContext, PostgresConnectionConfig
-from .gui import Deployer
+from .tracing import default_trace_dir
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -34,6 +28,8 @@ logger = logging.getLogger(__name__)
 
 def load_config(file_path):
     """Load configuration from YAML file."""
+    from ruamel.yaml import YAML
+
     try:
         with open(file_path, "r") as file:
             ryaml = YAML()
@@ -44,126 +40,11 @@ def load_config(file_path):
     return config
 
 
-def _verify_existing_postgres_app(
-    cap, pg_app_name, postgres_from_container, postgres_from_vm
-):
-    """
-    If the pg_app_name app exists in CapRover, sanity-check that its configuration
-    (host and port) match what was parsed from YAML `from_container`/`from_vm`
-
-    Warn on mismatch. We don't fail (but maybe we should).
-    """
-    # FIXME: this check short-circuits when we are deploying a local Postgres
-    # and downstream apps in the same go, even though we could have benefited from
-    # these important checks.
-    app = cap.get_app(pg_app_name)
-    if not app:
-        # No `postgres` app in CapRover — external Postgres or has not been deployed yet.
-        return
-
-    if postgres_from_container.host != "srv-captain--postgres":
-        logger.warn(
-            f"===== A `{pg_app_name}` app exists in CapRover, but from_container.host is "
-            f"{postgres_from_container.host!r} (expected 'srv-captain--postgres'). "
-            f"Downstream apps may fail to connect. ====="
-        )
-
-    mappings = app.get("ports") or []
-    host_ports = [
-        int(m["hostPort"])
-        for m in mappings
-        if int(m.get("containerPort", 0)) == postgres_from_container.port
-    ]
-    if host_ports and postgres_from_vm.port not in host_ports:
-        logger.warn(
-            f"===== Deployed `postgres` app maps host port(s) {host_ports} -> "
-            f"{postgres_from_container.port}, but from_vm.port="
-            f"{postgres_from_vm.port} in YAML. The script's bare-metal "
-            f"connection will likely fail. Update from_vm.port to match. ====="
-        )
-
-
-def build_deployment_context(config, gc_repository, dry_run):
-    # Initialize CapRover API with URL and password from config
-    cap = caprover_api.CaproverAPI(
-        dashboard_url=config["caproverUrl"], password=config["caproverPassword"]
-    )
-
-    # this is the connection to be used by inter-container networking:
-    # i.e. how other CapRover apps reach Postgres. Used in connection strings.
-    postgres_from_container = PostgresConnectionConfig(
-        host=config["postgres"]["from_container"]["host"],
-        port=int(config["postgres"]["from_container"]["port"]),
-        user=config["postgres"]["user"],
-        password=config["postgres"]["pass"],
-        ssl=bool(config["postgres"]["from_container"]["ssl"]),
-    )
-    # this is the connection to be used from this script (which runs on the host).
-    # Used for one-time setup of databases, users, etc.
-    postgres_from_vm = PostgresConnectionConfig(
-        host=config["postgres"]["from_vm"]["host"],
-        port=int(config["postgres"]["from_vm"]["port"]),
-        user=config["postgres"]["user"],
-        password=config["postgres"]["pass"],
-        ssl=bool(config["postgres"]["from_vm"]["ssl"]),
-    )
-
-    # Upfront validation: does not change or persist anything
-    if not dry_run:
-        _verify_existing_postgres_app(
-            cap,
-            config["postgres"].get("app_name", PostgresApp.one_click_app_name),
-            postgres_from_container,
-            postgres_from_vm,
-        )
-
-    webapps_use_ssl = config.get("webappsUseSsl", True)
-    return DeploymentContext(
-        cap,
-        postgres_from_container,
-        postgres_from_vm,
-        gc_repository,
-        webapps_use_ssl,
-        dry_run,
-    )
-
-
 def is_local_path(path):
     """Check if a path is a local file system path."""
     return not (path.startswith("http://") or path.startswith("https://"))
 
 
-class LocalRepoServer:
-    """A context manager for serving a local repository over HTTP."""
-
-    def __init__(self, directory, port=0):
-        self.directory = directory
-        self.port = port
-        self.httpd = None
-        self.server_thread = None
-
-    def __enter__(self):
-        handler = http.server.SimpleHTTPRequestHandler
-        # Use a lambda to bind the directory to the handler
-        handler_class = lambda *args, **kwargs: handler(
-            *args, directory=self.directory, **kwargs
-        )
-        self.httpd = socketserver.TCPServer(("", self.port), handler_class)
-        self.port = self.httpd.server_address[1]
-        logger.info(f"Starting local server for repo at http://127.0.0.1:{self.port}")
-
-        self.server_thread = threading.Thread(target=self.httpd.serve_forever)
-        self.server_thread.daemon = True
-        self.server_thread.start()
-        return f"http://127.0.0.1:{self.port}/"
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.httpd:
-            logger.info("Shutting down local repo server...")
-            self.httpd.shutdown()
-            self.httpd.server_close()
-
-
 def copy_example(dest):
     """
     Copy example config shipped with the package to a local destination
@@ -173,22 +54,38 @@ def copy_example(dest):
     dest : Path
         Destination file to write
     """
+    import importlib.resources
+
     examples = importlib.resources.files("gc_stack_deploy.example_configs")
     for path in examples.iterdir():
         if path.is_file() and path.name == "stack.example.yaml":
             shutil.copy(path, dest)
 
 
+def _app_names(value: str) -> set[str]:
+    """argparse type for a comma-separated list of one-click app names."""
+    from .apps_registry import APPS_REGISTRY
+
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    known = {cls.one_click_app_name for cls in APPS_REGISTRY}
+    unknown = names - known
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown app(s) {', '.join(sorted(unknown))}; choose from {', '.join(sorted(known))}"
+        )
+    return names
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=argparse.RawTextHelpFormatter
     )
 
-    # OPTIONAL "init" or "deploy" subcommand
+    # OPTIONAL "init", "deploy" or "fleet" subcommand
     parser.add_argument(
         "command",
         nargs="?",
-        choices=["init", "deploy"],
+        choices=["init", "deploy", "fleet"],
         default="deploy",
         help="Optional subcommand",
     )
@@ -197,7 +94,7 @@ def main():
         "-c",
         "--config-file",
         required=True,
-        help="Path to configuration YAML file (copy stack.example.yaml)",
+        help="Path to configuration YAML file (copy stack.example.yaml); for `fleet`, the fleet file",
     )
     parser.add_argument(
         "--repo",
@@ -210,16 +107,102 @@ def main():
         default=False,
         help="Enable or disable dry-run (default: disabled)",
     )
+    parser.add_argument(
+        "--trace-dir",
+        default=str(default_trace_dir()),
+        help=f"Directory for per-run timing traces, viewable in https://ui.perfetto.dev; empty to disable (default: {default_trace_dir()})",
+    )
+    parser.add_argument(
+        "--async-client",
+        action="store_true",
+        help="Talk to CapRover over a shared pool of keep-alive connections (experimental)",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Deploy without the interactive UI, logging to stdout; exits 1 if any app fails",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print what updating each installed app would change, then exit without changing anything",
+    )
+    parser.add_argument(
+        "--apps",
+        type=_app_names,
+        default=set(),
+        help="With --headless or `fleet`: comma-separated apps that should be installed",
+    )
+    parser.add_argument(
+        "--uninstall",
+        type=_app_names,
+        default=set(),
+        help="With --headless or `fleet`: comma-separated apps that should be uninstalled",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["plain", "json"],
+        default="plain",
+        help="With --headless or `fleet`: plain text or JSON lines (default: plain)",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        help="With `fleet`: how many instances to deploy at once (default: maxParallelInstances in the fleet file, else 4)",
+    )
+    parser.add_argument(
+        "--log-dir",
+        default=str(default_trace_dir().parent / "logs"),
+        help=f"With `fleet`: directory for one log file per instance (default: {default_trace_dir().parent / 'logs'})",
+    )
     args = parser.parse_args()
+    if args.command == "fleet":
+        args.headless = True  # a fleet is always deployed without the TUI
+        if args.plan:
+            parser.error("--plan is not supported with `fleet`")
+    if args.plan:
+        args.headless = True
+    if (args.apps or args.uninstall) and not args.headless:
+        parser.error("--apps and --uninstall require --headless")
+    if args.apps & args.uninstall:
+        parser.error(
+            f"apps both to install and uninstall: {', '.join(sorted(args.apps & args.uninstall))}"
+        )
+    if args.headless:
+        from .headless import configure_logging
+
+        configure_logging(args.log_format)
 
     if args.command == "init":
         print("init -> " + args.config_file)
         copy_example(args.config_file)
         return
 
-    # Load configuration
-    config = load_config(args.config_file)
     repo_path = args.repo
+    if args.command == "fleet":
+        from .fleet import FleetConfigError, configure_fleet_logging, load_fleet
+
+        try:
+            instances, max_parallel = load_fleet(
+                args.config_file, args.apps, args.uninstall
+            )
+        except (OSError, FleetConfigError) as e:
+            parser.error(str(e))
+        if args.max_parallel is not None and args.max_parallel < 1:
+            parser.error("--max-parallel must be at least 1")
+        configure_fleet_logging(args.log_format)
+    else:
+        # Load configuration
+        config = load_config(args.config_file)
+        unconfigured = (args.apps | args.uninstall) - config.keys()
+        if unconfigured:
+            parser.error(f"no config block for: {', '.join(sorted(unconfigured))}")
+        from .orchestrator import parallel_limit
+
+        try:
+            parallel_limit(config.get("maxParallelDeploys", 3), "maxParallelDeploys")
+        except ValueError as e:
+            parser.error(f"{args.config_file}: {e}")
 
     # Allow to resolve local one-click-app repos via HTTP (useful for testing).
     # CapRoverAPI only supports http://, https:// URLs.
@@ -232,13 +215,68 @@ def main():
                 f"Local repository path does not exist or is not a directory: {repo_dir}"
             )
             sys.exit(1)
+        from .local_repo import LocalRepoServer
+
         context_manager = LocalRepoServer(repo_dir)
     else:
         context_manager = nullcontext(repo_path)
 
-    # Launch Deployer GUI application
+    from .deployment import build_deployment_context
+    from .state import state_path_for
+
     with context_manager as repo_url:
-        ctx = build_deployment_context(config, repo_url, args.dry_run)
+        if args.command == "fleet":
+            from .fleet import current_instance, run_fleet
+            from .one_click import OneClickRepository
+
+            # All instances share one store of one-click definitions.
+            one_click_apps = OneClickRepository(repo_url)
+
+            def build_context(instance_config):
+                trace_dir = args.trace_dir and os.path.join(
+                    args.trace_dir, current_instance.get()
+                )
+                return build_deployment_context(
+                    instance_config,
+                    repo_url,
+                    args.dry_run,
+                    trace_dir=trace_dir or None,
+                    one_click_apps=one_click_apps,
+                    async_client=args.async_client,
+                    state_path=state_path_for(args.config_file, current_instance.get()),
+                    # This host isn't the instances' VM: only `resources:` counts.
+                    detect_host=False,
+                )
+
+            results = run_fleet(
+                instances,
+                build_context,
+                max_parallel=args.max_parallel or max_parallel,
+                log_dir=args.log_dir or None,
+            )
+            sys.exit(0 if all(r.ok for r in results) else 1)
+
+        ctx = build_deployment_context(
+            config,
+            repo_url,
+            args.dry_run,
+            trace_dir=args.trace_dir or None,
+            async_client=args.async_client,
+            state_path=state_path_for(args.config_file),
+        )
+        if args.headless:
+            from .apps_registry import configured_apps
+            from .headless import print_plan, run_headless
+
+            specs = configured_apps(config, ctx)
+            if args.plan:
+                sys.exit(print_plan(ctx, specs))
+            sys.exit(run_headless(ctx, specs, args.apps, args.uninstall))
+
+        # Launch Deployer GUI application. Imported here so that headless runs
+        # never load Textual.
+        from .gui import Deployer
+
         Deployer(config, ctx).run()
 
 
@@ -253,6 +291,9 @@ def dev_target() -> None:
     $ pip install textual-dev
     $ textual run --dev "gc_stack_deploy.stack_deploy:dev_target"
     """
+    from .deployment import build_deployment_context
+    from .gui import Deployer
+
     config = load_config("./tests/stack.test.yaml")
     repo_url = "https://conservationmetrics.github.io/gc-deploy/one-click-apps/v4/apps/"
     ctx = build_deployment_context(config, repo_url, False)
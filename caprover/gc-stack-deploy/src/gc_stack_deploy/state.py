@@ -0,0 +1,209 @@
+"""What each app was last installed with, kept in a JSON file next to the stack config.
+
+After every successful install, the app's fingerprint is recorded:
+
+- a hash of its rendered one-click variables (and of the stack-wide settings
+  its install reads, such as webappsUseSsl);
+- the docker image it was deployed with;
+- a hash of the serviceUpdateOverride of each of its CapRover apps, as it
+  stood once the install was done;
+- the CapRover apps it deployed, so that an update only ever deletes apps
+  the tool itself created (see WindmillApp.obsolete_services);
+- which of those its SSL certificates failed for (they are issued after the
+  installs, see certificates.py);
+- when the install finished.
+
+Probing compares an INSTALLED app against its record: if the config now
+renders different variables or a different image, someone has since
+edited a serviceUpdateOverride in the CapRover dashboard, or its SSL failed, the app is
+reported CONFIG_CHANGED, which its checked "update" box turns into an update. Apps
+whose fingerprint is unchanged are left alone.
+
+Only hashes are stored, never the variables themselves (they hold passwords).
+An app that is installed but has no record yet (installed before this file
+existed, or by hand) is adopted: its current fingerprint becomes the baseline.
+
+    stack.yaml -> stack.state.json
+    fleet.yaml -> fleet.<instance>.state.json
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+def state_path_for(config_file: str | Path, instance: str | None = None) -> Path:
+    """Where the deploy state of a stack config lives: beside it, as `<stem>.state.json`.
+
+    For an instance of a fleet, `config_file` is the fleet file, and the state
+    is `<stem>.<instance>.state.json` beside it.
+    """
+    path = Path(config_file)
+    infix = f".{instance}" if instance else ""
+    return path.with_name(f"{path.stem}{infix}.state.json")
+
+
+def _digest(value) -> str:
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class AppFingerprint:
+    app_name: str
+    variables: str  # digest of the rendered one-click variables
+    image: str | None  # None: the app has no image variable, or it couldn't be resolved
+    service_override: str  # digest of every service's serviceUpdateOverride
+    installed_at: str | None = None  # UTC, ISO 8601; None for an adopted app
+    services: tuple[str, ...] = ()  # its CapRover apps; () if recorded before they were
+    ssl_failed: tuple[str, ...] = ()  # those of them whose certificates failed
+
+    def changes(self, current: "AppFingerprint") -> tuple[str, ...]:
+        """What differs in `current` from this recorded fingerprint."""
+        changed = []
+        if current.variables != self.variables:
+            changed.append("variables")
+        if current.image and self.image and current.image != self.image:
+            changed.append("image")
+        if current.service_override != self.service_override:
+            changed.append("serviceUpdateOverride")
+        if self.ssl_failed:
+            changed.append("SSL")
+        return tuple(changed)
+
+
+def fingerprint(spec, definitions: dict[str, dict]) -> AppFingerprint:
+    """`spec` as its config renders it now, with its services' overrides from `definitions`."""
+    try:
+        image = spec.docker_image()
+    except Exception as e:  # e.g. the one-click repository is unreachable
+        logger.debug(f"{spec.app_name}: could not resolve the docker image: {e}")
+        image = None
+    return AppFingerprint(
+        app_name=spec.app_name,
+        variables=_digest(
+            {
+                "variables": spec.app_variables(),
+                "webapps_use_ssl": spec.ctx.webapps_use_ssl,
+            }
+        ),
+        image=image,
+        service_override=_digest(
+            [
+                (definitions.get(name) or {}).get("serviceUpdateOverride") or ""
+                for name in spec.service_names
+            ]
+        ),
+        services=tuple(name for name in spec.deployed_service_names if name in definitions),
+    )
+
+
+class DeployState:
+    """Fingerprints per one-click app id, loaded from and saved to `path`.
+
+    With `persist=False` (dry runs), changes are kept in memory only.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str | Path, persist: bool = True):
+        self.path = Path(path)
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._apps: dict[str, AppFingerprint] = {}
+        try:
+            stored = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable deploy state {self.path}: {e}")
+            return
+        if stored.get("version") != STATE_VERSION:
+            logger.warning(f"Ignoring deploy state {self.path}: unknown version")
+            return
+        for app_id, entry in (stored.get("apps") or {}).items():
+            try:
+                self._apps[app_id] = AppFingerprint(
+                    **{
+                        **entry,
+                        "services": tuple(entry.get("services") or ()),
+                        "ssl_failed": tuple(entry.get("ssl_failed") or ()),
+                    }
+                )
+            except TypeError:
+                logger.warning(f"Ignoring malformed deploy state for {app_id}")
+
+    def get(self, app_id: str) -> AppFingerprint | None:
+        with self._lock:
+            return self._apps.get(app_id)
+
+    def compare(self, spec, definitions: dict[str, dict]) -> tuple[str, ...]:
+        """What changed for an installed app since it was recorded; () if nothing.
+
+        An app with no record (or one recorded under another app_name) is
+        adopted as it stands, and reported unchanged.
+        """
+        try:
+            current = fingerprint(spec, definitions)
+        except Exception as e:  # e.g. a config the install itself would reject
+            logger.warning(f"{spec.app_name}: could not fingerprint its config: {e}")
+            return ()
+        recorded = self.get(spec.one_click_app_name)
+        if recorded is None or recorded.app_name != spec.app_name:
+            logger.info(f"{spec.app_name}: no deploy state yet, recording it as installed now")
+            self._put(spec.one_click_app_name, current)
+            return ()
+        return recorded.changes(current)
+
+    def record_install(
+        self, spec, definitions: dict[str, dict], ssl_failed: tuple[str, ...] = ()
+    ) -> None:
+        """Record what `spec` was just installed with, and which of its services' SSL failed."""
+        current = fingerprint(spec, definitions)
+        installed_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self._put(
+            spec.one_click_app_name,
+            AppFingerprint(
+                **{
+                    **asdict(current),
+                    "installed_at": installed_at,
+                    "ssl_failed": tuple(ssl_failed),
+                }
+            ),
+        )
+
+    def forget(self, spec) -> None:
+        """Drop the record of an uninstalled app."""
+        with self._lock:
+            if self._apps.pop(spec.one_click_app_name, None) is None:
+                return
+        self._save()
+
+    def _put(self, app_id: str, entry: AppFingerprint) -> None:
+        with self._lock:
+            self._apps[app_id] = entry
+        self._save()
+
+    def _save(self) -> None:
+        if not self.persist:
+            return
+        with self._lock:
+            document = {
+                "version": STATE_VERSION,
+                "apps": {app_id: asdict(entry) for app_id, entry in sorted(self._apps.items())},
+            }
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(document, indent=2) + "\n")
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning(f"Could not save deploy state {self.path}: {e}")
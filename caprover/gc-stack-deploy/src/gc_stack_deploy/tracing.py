@@ -0,0 +1,232 @@
+"""Span-based timing of a deploy run, exported in Chrome trace format.
+
+Wrap any phase in `span()`; it records start, duration, thread and tags,
+even when the phase raises:
+
+    with tracing.span("docker.pull", "docker", image=image):
+        ...
+
+Spans are only recorded while a Tracer is active (`run_deploy()` activates
+the run's `ctx.tracer`); otherwise `span()` costs next to nothing. The active
+tracer is a context variable, so concurrent runs (see fleet.py) each record
+into their own; thread pools that work for a run must submit through
+`contextvars.copy_context().run`. A span
+inherits the `app` tag of the span it is nested in on the same thread, so
+CapRover, Postgres and Docker calls made during an install are attributed
+to that app.
+
+At the end of a run, `Tracer.write()` produces a JSON file that Perfetto
+(https://ui.perfetto.dev) or chrome://tracing opens directly, and
+`Tracer.summary()` gives one line per app of where its time went.
+"""
+
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float  # seconds since the tracer was created
+    duration: float
+    thread_id: int
+    thread_name: str
+    span_id: int
+    parent_id: int | None
+    args: dict = field(default_factory=dict)
+
+    @property
+    def app(self) -> str | None:
+        return self.args.get("app")
+
+
+# (span id, app) of the innermost open span on this thread.
+_current: contextvars.ContextVar[tuple[int, str | None] | None] = (
+    contextvars.ContextVar("gc_stack_deploy_span", default=None)
+)
+
+
+class Tracer:
+    """Collects finished spans from any thread."""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, category: str = "deploy", **args):
+        parent = _current.get()
+        if "app" not in args and parent is not None and parent[1] is not None:
+            args["app"] = parent[1]
+        span_id = next(self._ids)
+        token = _current.set((span_id, args.get("app")))
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            ended = time.perf_counter()
+            _current.reset(token)
+            thread = threading.current_thread()
+            with self._lock:
+                self.spans.append(
+                    Span(
+                        name,
+                        category,
+                        started - self._origin,
+                        ended - started,
+                        thread.ident,
+                        thread.name,
+                        span_id,
+                        parent[0] if parent else None,
+                        args,
+                    )
+                )
+
+    def to_chrome_trace(self) -> dict:
+        """The Trace Event Format: complete ("X") events plus thread names."""
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        tids = {}
+        events = []
+        for s in sorted(spans, key=lambda s: s.start):
+            tid = tids.setdefault(s.thread_id, len(tids) + 1)
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": s.category,
+                    "ph": "X",
+                    "ts": round(s.start * 1e6),
+                    "dur": round(s.duration * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {k: str(v) for k, v in s.args.items()},
+                }
+            )
+        names = {s.thread_id: s.thread_name for s in spans}
+        events.extend(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": names[thread_id]},
+            }
+            for thread_id, tid in tids.items()
+        )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"startedAt": self.started_at},
+        }
+
+    def write(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome_trace()))
+        return path
+
+    def summary(self, top: int = 4) -> list[str]:
+        """One line per app install/uninstall: total time, then its costliest steps.
+
+        Steps are the spans directly inside the install/uninstall span, grouped
+        by name, so nested calls (e.g. Docker checks inside a readiness wait)
+        are not counted twice.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        children = defaultdict(list)
+        for s in spans:
+            children[s.parent_id].append(s)
+
+        lines = []
+        for s in sorted(spans, key=lambda s: s.start):
+            if s.category != "app":
+                continue
+            steps = defaultdict(lambda: [0.0, 0])
+            for child in children[s.span_id]:
+                steps[child.name][0] += child.duration
+                steps[child.name][1] += 1
+            costliest = sorted(steps.items(), key=lambda kv: -kv[1][0])[:top]
+            details = ", ".join(
+                f"{name} {total:.1f}s" + (f" (x{count})" if count > 1 else "")
+                for name, (total, count) in costliest
+            )
+            status = " FAILED" if "error" in s.args else ""
+            lines.append(
+                f"{s.app} {s.name}{status}: {s.duration:.1f}s"
+                + (f" — {details}" if details else "")
+            )
+        return lines
+
+
+def default_trace_dir() -> Path:
+    base = os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+    return Path(base) / "gc-stack-deploy" / "traces"
+
+
+_active: contextvars.ContextVar[Tracer | None] = contextvars.ContextVar(
+    "gc_stack_deploy_tracer", default=None
+)
+
+
+@contextmanager
+def activate(tracer: Tracer):
+    """Record `span()`s in this context into `tracer` for the duration of the block."""
+    token = _active.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active.reset(token)
+
+
+def span(name: str, category: str = "deploy", **args):
+    """A span in the active tracer, or a no-op if none is active."""
+    tracer = _active.get()
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, category, **args)
+
+
+class TracedCaprover:
+    """Wraps a CaproverAPI so each method call is a "caprover.<method>" span.
+
+    The span's `service` tag is the CapRover app the call is about.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def traced(*args, **kwargs):
+            if name == "deploy_one_click_app":
+                service = kwargs.get("app_name", args[1] if len(args) > 1 else None)
+            else:
+                service = kwargs.get("app_name", args[0] if args else None)
+            tags = {"service": service} if isinstance(service, str) else {}
+            with span(f"caprover.{name}", "caprover", **tags):
+                return attr(*args, **kwargs)
+
+        return traced
@@ -0,0 +1,79 @@
+from gc_stack_deploy.app_mutation import AppMutation
+from gc_stack_deploy.apps_registry import apply_memory_limit, disable_healthcheck
+
+
+class RecordingCaprover:
+    """Records every call made on it; get_app returns an empty override."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_app(self, app_name):
+        self.calls.append(("get_app", app_name))
+        return {"appName": app_name, "serviceUpdateOverride": None}
+
+    def update_app(self, app_name, **kwargs):
+        self.calls.append(("update_app", app_name, kwargs))
+
+    def add_domain(self, app_name, domain):
+        self.calls.append(("add_domain", app_name, domain))
+
+    def enable_ssl(self, app_name, custom_domain=None):
+        self.calls.append(("enable_ssl", app_name, custom_domain))
+
+    def writes(self):
+        return [c for c in self.calls if c[0] != "get_app"]
+
+
+class TestAppMutation:
+    def test_plain_settings_and_overrides_become_one_update(self):
+        cap = RecordingCaprover()
+        (
+            AppMutation("files")
+            .update(support_websocket=True, environment_variables={"A": "1"})
+            .update(environment_variables={"B": "2"}, force_ssl=False)
+            .override(disable_healthcheck, apply_memory_limit)
+            .apply(cap)
+        )
+        [(method, app, kwargs)] = cap.writes()
+        assert (method, app) == ("update_app", "files")
+        assert kwargs["support_websocket"] is True
+        assert kwargs["force_ssl"] is False
+        assert kwargs["environment_variables"] == {"A": "1", "B": "2"}
+        assert "HealthCheck" in kwargs["serviceUpdateOverride"]
+        assert "MemoryBytes" in kwargs["serviceUpdateOverride"]
+
+    def test_ssl_and_domains_go_last(self):
+        cap = RecordingCaprover()
+        (
+            AppMutation("landing")
+            .override(apply_memory_limit)
+            .update(force_ssl=True)
+            .enable_ssl()
+            .add_domain("example.net", ssl=True)
+            .redirect_domain("example.net")
+            .apply(cap)
+        )
+        assert [c[0] for c in cap.writes()] == [
+            "update_app",
+            "add_domain",
+            "enable_ssl",
+            "enable_ssl",
+            "update_app",
+        ]
+        assert cap.writes()[2] == ("enable_ssl", "landing", None)
+        assert cap.writes()[3] == ("enable_ssl", "landing", "example.net")
+        assert cap.writes()[-1][2] == {
+            "force_ssl": True,
+            "redirectDomain": "example.net",
+        }
+
+    def test_no_override_means_no_read(self):
+        cap = RecordingCaprover()
+        AppMutation("x").update(support_websocket=True).apply(cap)
+        assert [c[0] for c in cap.calls] == ["update_app"]
+
+    def test_empty_mutation_makes_no_calls(self):
+        cap = RecordingCaprover()
+        AppMutation("x").apply(cap)
+        assert cap.calls == []
@@ -1,10 +1,28 @@
+import pytest
+from fake_caprover import fake_ctx
+from gc_stack_deploy import apps_registry
 from gc_stack_deploy.apps_registry import (
+    FilebrowserApp,
     apply_memory_limit,
     disable_healthcheck,
     set_yaml_value,
 )
+from gc_stack_deploy.one_click import OneClickDefinition
 from ruamel.yaml import YAML
 
+# Filebrowser comes from CapRover's public repository; this stands in for it.
+FILEBROWSER = """captainVersion: 4
+services:
+  $$cap_appname:
+    image: filebrowser/filebrowser:$$cap_version
+    caproverExtra:
+      containerHttpPort: "80"
+caproverOneClickApp:
+  variables:
+    - id: $$cap_version
+      defaultValue: v2.31.2
+"""
+
 
 def load_yaml(s):
     return YAML().load(s)
@@ -100,3 +118,63 @@ class TestApplyMemoryLimit:
             "      MemoryBytes: 1610612736\n"
         )
         assert apply_memory_limit(existing) == expected
+
+
+class TestFilebrowserInstall:
+    @pytest.fixture
+    def probed(self, monkeypatch):
+        urls = []
+        # Not the CapRover host: Docker can't tell.
+        monkeypatch.setattr(apps_registry, "docker_service_running", lambda app: None)
+        monkeypatch.setattr(apps_registry, "http_responds", lambda url: urls.append(url) or True)
+        return urls
+
+    def install(self, fake, use_ssl, deferred=False):
+        ctx = fake_ctx(fake, use_ssl, readiness_timeout=5)
+        ctx.public_one_click_apps._definitions["filebrowser"] = OneClickDefinition.parse(
+            "filebrowser", FILEBROWSER
+        )
+        if deferred:
+            ctx.certificates.collect()
+        FilebrowserApp({"admin_password": "pw"}, ctx)._install()
+        return ctx
+
+    def test_password_is_cleared_once_it_answers_off_host(self, fake, probed):
+        ctx = self.install(fake, use_ssl=False)
+        env = {e["key"]: e["value"] for e in fake.apps["filebrowser"]["envVars"]}
+        assert probed == [f"http://filebrowser.{ctx.caprover.root_domain}/health"]
+        assert env["FB_PASSWORD"] == ""
+
+    def test_deployed_version_runs_with_the_password_and_database(
+        self, fake, probed, monkeypatch
+    ):
+        deployed = []
+        handle = fake.handle
+
+        def record_deploys(endpoint, body, arg):
+            if endpoint == "deploy":
+                app = fake.apps[arg]
+                env = {e["key"]: e["value"] for e in app["envVars"]}
+                deployed.append((env.get("FB_PASSWORD"), app["volumes"]))
+            return handle(endpoint, body, arg)
+
+        monkeypatch.setattr(fake, "handle", record_deploys)
+        self.install(fake, use_ssl=False)
+        ((password, volumes),) = deployed
+        assert password.startswith("$2")  # bcrypt
+        assert {"volumeName": "filebrowser-database", "containerPath": "/database"} in volumes
+        assert fake.apps["filebrowser"]["deployedVersion"] == 0
+
+    def test_deferred_certificate_is_waited_on_over_http(self, fake, probed):
+        ctx = self.install(fake, use_ssl=True, deferred=True)
+        env = {e["key"]: e["value"] for e in fake.apps["filebrowser"]["envVars"]}
+        assert probed == [f"http://filebrowser.{ctx.caprover.root_domain}/health"]
+        assert env["FB_PASSWORD"] == ""
+
+        assert ctx.certificates.issue(ctx.caprover) == {}
+        assert fake.apps["filebrowser"]["hasDefaultSubDomainSsl"]
+        assert fake.apps["filebrowser"]["forceSsl"]
+
+    def test_inline_certificate_is_waited_on_over_https(self, fake, probed):
+        ctx = self.install(fake, use_ssl=True)
+        assert probed == [f"https://filebrowser.{ctx.caprover.root_domain}/health"]
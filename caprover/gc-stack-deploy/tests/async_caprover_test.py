@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+from fake_caprover import FakeCaprover, fake_ctx
+from gc_stack_deploy.apps_registry import ComapeoCloudApp
+from gc_stack_deploy.async_caprover import (
+    AsyncCaprover,
+    CaproverError,
+    ConnectionPool,
+    SyncCaprover,
+    TransientError,
+)
+
+
+def run(fake, scenario, **pool_kwargs):
+    """Run `scenario(cap)` against `fake` on a fresh loop; return (result, pool)."""
+
+    async def main():
+        pool = ConnectionPool(**pool_kwargs)
+        cap = await AsyncCaprover.connect(fake.url, fake.password, pool=pool)
+        cap.build_poll_interval = 0.01
+        try:
+            return await scenario(cap), pool
+        finally:
+            await pool.close()
+
+    return asyncio.run(main())
+
+
+class TestConnectionPool:
+    def test_connections_are_kept_alive(self, fake):
+        async def scenario(cap):
+            for _ in range(5):
+                await cap.list_apps()
+
+        _, pool = run(fake, scenario)
+        assert pool.opened == 1
+        assert pool.requests == 7  # login, system info, 5 x list_apps
+
+    def test_requests_in_flight_are_limited_per_host(self, fake):
+        fake.inject("list_apps", latency=0.05)
+
+        async def scenario(cap):
+            await asyncio.gather(*(cap.list_apps() for _ in range(6)))
+
+        _, pool = run(fake, scenario, per_host=2)
+        assert pool.opened == 2
+        assert fake.calls["list_apps"] == 6
+
+    def test_a_connection_closed_by_the_server_is_replaced(self, fake):
+        async def scenario(cap):
+            await cap.list_apps()
+            # The server drops every idle connection, e.g. on restart.
+            for connections in cap.pool._idle.values():
+                for _, writer in connections:
+                    writer.transport.abort()
+            await asyncio.sleep(0)
+            return await cap.list_apps()
+
+        response, pool = run(fake, scenario)
+        assert response["data"]["appDefinitions"] == []
+        assert pool.opened == 2
+
+
+class TestAsyncCaprover:
+    def test_one_login_is_shared_by_concurrent_requests(self, fake):
+        async def scenario(cap):
+            await asyncio.gather(*(cap.get_app("x") for _ in range(5)))
+            return cap.logins
+
+        logins, _ = run(fake, scenario)
+        assert logins == 1
+        assert fake.calls["login"] == 1
+
+    def test_invalid_token_logs_in_again(self, fake):
+        async def scenario(cap):
+            cap._token = "expired"
+            await asyncio.gather(cap.list_apps(), cap.list_apps())
+            return cap.logins
+
+        logins, _ = run(fake, scenario)
+        assert logins == 2
+
+    def test_wrong_password(self, fake):
+        with pytest.raises(CaproverError, match="incorrect"):
+            asyncio.run(
+                AsyncCaprover.connect(fake.url, "nope", pool=ConnectionPool())
+            )
+
+    def test_update_merges_like_caprover_api(self, fake):
+        async def scenario(cap):
+            await cap.create_app("redis", has_persistent_data=True)
+            await cap.update_app("redis", environment_variables={"A": "1"})
+            await cap.update_app(
+                "redis",
+                environment_variables={"B": "2"},
+                persistent_directories=["redis-data:/data", "/srv/conf:/etc/redis"],
+                port_mapping=["6380:6379"],
+                expose_as_web_app=False,
+                serviceUpdateOverride="TaskTemplate: {}\n",
+            )
+
+        run(fake, scenario)
+        app = fake.apps["redis"]
+        assert app["envVars"] == [{"key": "A", "value": "1"}, {"key": "B", "value": "2"}]
+        assert app["volumes"] == [
+            {"volumeName": "redis-data", "containerPath": "/data"},
+            {"hostPath": "/srv/conf", "containerPath": "/etc/redis"},
+        ]
+        assert app["ports"] == [{"hostPort": "6380", "containerPort": "6379"}]
+        assert app["notExposeAsWebApp"] is True
+        assert app["serviceUpdateOverride"] == "TaskTemplate: {}\n"
+
+    @pytest.mark.parametrize("kind", ["5xx", "in_progress", "timeout"])
+    def test_transient_failures_are_retried(self, fake, kind):
+        fake.inject("update", timeout_seconds=0.01)
+
+        async def scenario(cap):
+            await cap.create_app("redis", wait_for_app_build=False)
+            fake.fail_next("update", kind, times=2)
+            await cap.update_app("redis", instance_count=2)
+
+        run(fake, scenario)
+        assert fake.apps["redis"]["instanceCount"] == 2
+        assert fake.calls["update"] == 3
+
+    def test_retries_give_up(self, fake):
+        async def scenario(cap):
+            cap.attempts = 2
+            fake.fail_next("list_apps", "5xx", times=2)
+            await cap.list_apps()
+
+        with pytest.raises(TransientError, match="502"):
+            run(fake, scenario)
+
+    def test_deploy_one_click_app(self, fake):
+        async def scenario(cap):
+            await cap.deploy_one_click_app(
+                "comapeo-cloud",
+                "comapeo",
+                app_variables={"$$cap_comapeocloud_docker_image": "comapeo:1.0"},
+                one_click_repository=fake.one_click_repository,
+            )
+
+        run(fake, scenario)
+        app = fake.apps["comapeo"]
+        assert app["versions"][-1]["deployedImageName"] == "comapeo:1.0"
+        assert app["instanceCount"] == 1
+
+    def test_one_click_services_wait_for_their_dependencies(self, tmp_path):
+        (tmp_path / "pair.yml").write_text(
+            "captainVersion: 4\n"
+            "services:\n"
+            "  $$cap_appname:\n"
+            "    image: web:$$cap_tag\n"
+            "    depends_on: [$$cap_appname-db]\n"
+            "    command: serve --name 'my app'\n"
+            "  $$cap_appname-db:\n"
+            "    image: db:1\n"
+            "    caproverExtra: {notExposeAsWebApp: 'true'}\n"
+            "caproverOneClickApp:\n"
+            "  variables:\n"
+            "    - id: $$cap_tag\n"
+            "      validRegex: /^[0-9]+$/\n"
+        )
+        with FakeCaprover(one_click_apps_dir=tmp_path) as fake:
+
+            async def scenario(cap):
+                with pytest.raises(ValueError, match="cap_tag"):
+                    await cap.deploy_one_click_app(
+                        "pair", "shop", one_click_repository=fake.one_click_repository
+                    )
+                await cap.deploy_one_click_app(
+                    "pair",
+                    "shop",
+                    app_variables={"$$cap_tag": "7"},
+                    one_click_repository=fake.one_click_repository,
+                )
+
+            run(fake, scenario)
+            assert list(fake.apps) == ["shop-db", "shop"]
+            assert fake.apps["shop-db"]["notExposeAsWebApp"] is True
+            assert fake.apps["shop"]["versions"][-1]["deployedImageName"] == "web:7"
+            assert "- my app" in fake.apps["shop"]["serviceUpdateOverride"]
+
+    def test_delete_app_matching_pattern(self, fake):
+        async def scenario(cap):
+            for name in ("superset", "superset-redis", "windmill"):
+                await cap.create_app(name, wait_for_app_build=False)
+            await cap.delete_app_matching_pattern("^superset")
+
+        run(fake, scenario)
+        assert list(fake.apps) == ["windmill"]
+
+
+class TestSyncCaprover:
+    def test_calls_from_many_threads_share_the_loop(self, fake):
+        from concurrent.futures import ThreadPoolExecutor
+
+        cap = SyncCaprover.connect(fake.url, fake.password)
+        assert cap.root_domain == "fake.example"
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(lambda n: cap.create_app(f"app{n}"), range(8)))
+        assert sorted(fake.apps) == [f"app{n}" for n in range(8)]
+        assert fake.calls["login"] == 1
+
+    def test_install_comapeo(self, fake):
+        spec = ComapeoCloudApp({"app_name": "comapeo"}, fake_ctx(fake))
+        spec.install()
+        app = fake.apps["comapeo"]
+        assert app["forceSsl"] and app["websocketSupport"]
+        assert "MemoryBytes" in app["serviceUpdateOverride"]
@@ -0,0 +1,77 @@
+import typing
+
+from gc_stack_deploy.apps_registry import RedisApp, SupersetApp, WindmillApp
+from gc_stack_deploy.base import AppStatus, DeploymentContext, probe_statuses
+from gc_stack_deploy.caprover_cache import CachingCaprover
+
+
+class CountingCaprover:
+    """Serves a fixed list of app definitions and counts list_apps() calls."""
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.list_calls = 0
+
+    def list_apps(self):
+        self.list_calls += 1
+        return {"data": {"appDefinitions": self.definitions}}
+
+
+def definition(name, **extra):
+    return {"appName": name, **extra}
+
+
+class TestProbeStatuses:
+    def test_one_api_call_for_all_apps(self):
+        cap = CountingCaprover([definition("redis")])
+        specs = [
+            RedisApp({}, None),
+            WindmillApp({"app_name": "windmill"}, None),
+            SupersetApp({"app_name": "superset"}, None),
+        ]
+        probe_statuses(cap, specs)
+        assert cap.list_calls == 1
+
+    def test_multi_service_app_needs_every_service(self):
+        cap = CountingCaprover(
+            [definition("windmill"), definition("windmill-worker")]
+        )
+        spec = WindmillApp({"app_name": "windmill"}, None)
+        status = probe_statuses(cap, [spec])["windmill-only"].status
+        assert status is AppStatus.FAILED
+
+        cap.definitions.append(definition("windmill-worker-native"))
+        status = probe_statuses(cap, [spec])["windmill-only"].status
+        assert status is AppStatus.INSTALLED
+
+    def test_not_installed(self):
+        cap = CountingCaprover([definition("unrelated")])
+        info = probe_statuses(cap, [RedisApp({}, None)])["redis"]
+        assert info.status is AppStatus.NOT_INSTALLED
+        assert info.image is None
+
+    def test_details_come_from_deployed_version(self):
+        cap = CountingCaprover(
+            [
+                definition(
+                    "redis",
+                    deployedVersion=1,
+                    versions=[
+                        {"version": 0, "deployedImageName": "redis:6"},
+                        {"version": 1, "deployedImageName": "redis:7"},
+                    ],
+                    instanceCount=2,
+                    hasDefaultSubDomainSsl=True,
+                )
+            ]
+        )
+        info = probe_statuses(cap, [RedisApp({}, None)])["redis"]
+        assert info.status is AppStatus.INSTALLED
+        assert info.image == "redis:7"
+        assert info.instance_count == 2
+        assert info.ssl is True
+
+
+class TestDeploymentContext:
+    def test_type_hints_resolve(self):
+        assert typing.get_type_hints(DeploymentContext)["caprover"] is CachingCaprover
@@ -0,0 +1,92 @@
+"""Micro-benchmark: one parse per transform vs. one parse per pipeline.
+
+Applies N transforms to a large serviceUpdateOverride, first the old way
+(each transform parses and re-serializes the YAML string), then through
+apply_overrides() (parsed once, serialized once).
+
+Usage
+-----
+$ python tests/benchmarks/bench_service_override.py [--env-vars 500] [--transforms 6]
+"""
+
+import argparse
+import timeit
+
+from gc_stack_deploy.apps_registry import apply_memory_limit, disable_healthcheck
+from gc_stack_deploy.service_override import (
+    OverrideDocument,
+    apply_overrides,
+    override_transform,
+)
+
+
+def large_override(env_vars: int) -> str:
+    """An override with many env vars, labels and mounts, like a busy Windmill worker."""
+    doc = OverrideDocument()
+    doc.append(
+        "TaskTemplate.ContainerSpec.Env",
+        *(f"SETTING_{i}=value-{i}" for i in range(env_vars)),
+    )
+    doc.merge(
+        "TaskTemplate.ContainerSpec.Labels",
+        {f"com.example.label{i}": f"v{i}" for i in range(env_vars // 5)},
+    )
+    doc.append(
+        "TaskTemplate.ContainerSpec.Mounts",
+        *(
+            {"Type": "volume", "Source": f"vol{i}", "Target": f"/data/{i}"}
+            for i in range(env_vars // 10)
+        ),
+    )
+    return doc.dump()
+
+
+def transforms(count: int):
+    extra = [
+        override_transform(
+            lambda doc, i=i: doc.set(f"TaskTemplate.ContainerSpec.Labels.bench{i}", i)
+        )
+        for i in range(max(0, count - 2))
+    ]
+    return [disable_healthcheck, apply_memory_limit, *extra]
+
+
+def one_round_trip_per_transform(suo: str, pipeline) -> str:
+    for transform in pipeline:
+        suo = transform(suo)
+    return suo
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--env-vars", type=int, default=500)
+    parser.add_argument("--transforms", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    suo = large_override(args.env_vars)
+    pipeline = transforms(args.transforms)
+    assert one_round_trip_per_transform(suo, pipeline) == apply_overrides(
+        suo, *pipeline
+    )
+
+    before = min(
+        timeit.repeat(
+            lambda: one_round_trip_per_transform(suo, pipeline),
+            number=1,
+            repeat=args.repeat,
+        )
+    )
+    after = min(
+        timeit.repeat(
+            lambda: apply_overrides(suo, *pipeline), number=1, repeat=args.repeat
+        )
+    )
+    print(
+        f"{len(suo.splitlines())}-line override, {len(pipeline)} transforms: "
+        f"{before * 1000:.1f} ms -> {after * 1000:.1f} ms ({before / after:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Timing and call-count recording for the benchmark suite.
+
+Run with `pytest --benchmarks`. Results can be saved and compared:
+
+    pytest tests/benchmarks --benchmark-save=before.json
+    # ... change things ...
+    pytest tests/benchmarks --benchmark-compare=before.json
+
+A benchmark fails under --benchmark-compare when its median wall-clock time
+or any of its recorded counts (e.g. CapRover API calls) grew by more than
+--benchmark-threshold compared to the saved run.
+"""
+
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+
+class BenchmarkRecorder:
+    def __init__(self, baseline: dict, threshold: float):
+        self.baseline = baseline
+        self.threshold = threshold
+        self.results: dict[str, dict] = {}
+
+    def measure(self, name: str, fn, *, rounds: int = 5, warmup: int = 1) -> dict:
+        """Time `fn()` over several rounds and record the median."""
+        for _ in range(warmup):
+            fn()
+        times = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return self.record(
+            name, statistics.median(times), min=min(times), rounds=rounds
+        )
+
+    def record(self, name: str, wall: float, counts: dict | None = None, **extra) -> dict:
+        """Record a measurement; fail if it regressed against the baseline."""
+        result = {"wall": wall, "counts": dict(counts or {}), **extra}
+        self.results[name] = result
+        self._compare(name, result)
+        return result
+
+    def _compare(self, name: str, result: dict) -> None:
+        before = self.baseline.get(name)
+        if before is None:
+            return
+        limit = 1 + self.threshold
+        regressions = []
+        if result["wall"] > before["wall"] * limit:
+            regressions.append(
+                f"wall {before['wall'] * 1000:.1f} ms -> {result['wall'] * 1000:.1f} ms"
+            )
+        for key, count in result["counts"].items():
+            old = before.get("counts", {}).get(key)
+            if old is not None and count > old * limit:
+                regressions.append(f"{key} {old} -> {count}")
+        if regressions:
+            pytest.fail(f"{name} regressed: " + "; ".join(regressions), pytrace=False)
+
+
+def _load_baseline(path: str | None) -> dict:
+    if not path:
+        return {}
+    return json.loads(Path(path).read_text())["benchmarks"]
+
+
+@pytest.fixture(scope="session")
+def _recorder(request):
+    config = request.config
+    recorder = BenchmarkRecorder(
+        _load_baseline(config.getoption("--benchmark-compare")),
+        config.getoption("--benchmark-threshold"),
+    )
+    config._benchmark_recorder = recorder
+    yield recorder
+    save_path = config.getoption("--benchmark-save")
+    if save_path:
+        Path(save_path).write_text(
+            json.dumps(
+                {
+                    "created": datetime.now(timezone.utc).isoformat(),
+                    "python": sys.version.split()[0],
+                    "machine": platform.platform(),
+                    "benchmarks": recorder.results,
+                },
+                indent=2,
+            )
+        )
+
+
+@pytest.fixture
+def bench(_recorder) -> BenchmarkRecorder:
+    return _recorder
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    recorder = getattr(config, "_benchmark_recorder", None)
+    if recorder is None or not recorder.results:
+        return
+    terminalreporter.section("benchmarks")
+    for name, result in sorted(recorder.results.items()):
+        counts = ", ".join(f"{k}={v}" for k, v in sorted(result["counts"].items()))
+        terminalreporter.write_line(
+            f"{name:<45} {result['wall'] * 1000:10.2f} ms  {counts}".rstrip()
+        )
@@ -0,0 +1,61 @@
+"""Macro-benchmarks: deploy the test stack against a stubbed CapRover.
+
+These go through the same worker logic as the TUI (`Deployer._run_deploy`
+hands the batch to `run_deploy` with the run's context), with CapRover,
+Postgres provisioning and image pulls replaced by stand-ins that only take
+time. Wall-clock and CapRover call counts are recorded.
+"""
+
+import time
+from pathlib import Path
+
+import pytest
+from fake_caprover import make_ctx
+from gc_stack_deploy.apps_registry import APPS_REGISTRY, FilebrowserApp
+from gc_stack_deploy.caprover_cache import CachingCaprover
+from gc_stack_deploy.orchestrator import TaskOutcome, run_deploy
+from gc_stack_deploy.stack_deploy import load_config
+from stub_caprover import LatencyCaprover, NoImages, StubProvisioner
+
+STACK_CONFIG = Path(__file__).parents[3] / "tests" / "stack.test.yaml"
+
+
+def make_stack(max_workers: int):
+    config = load_config(STACK_CONFIG)
+    stub = LatencyCaprover()
+    ctx = make_ctx(CachingCaprover(stub), max_workers=max_workers, images=NoImages())
+    ctx.provisioner = StubProvisioner(latency=0.05)
+    # Filebrowser waits on a real Docker service and HTTP endpoint.
+    specs = [
+        cls(config[cls.one_click_app_name], ctx)
+        for cls in APPS_REGISTRY
+        if cls.one_click_app_name in config and cls is not FilebrowserApp
+    ]
+    return ctx, stub, specs
+
+
+def deploy(bench, name, to_uninstall, to_install, ctx, stub):
+    stub.calls.clear()
+    started = time.perf_counter()
+    outcomes = run_deploy(
+        to_uninstall,
+        to_install,
+        on_status=lambda spec, status: None,
+        max_workers=ctx.max_workers,
+        ctx=ctx,
+    )
+    wall = time.perf_counter() - started
+    assert set(outcomes.values()) == {TaskOutcome.SUCCEEDED}
+    bench.record(name, wall, counts={"api_calls": sum(stub.calls.values()), **stub.calls})
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_install_stack(bench, max_workers):
+    ctx, stub, specs = make_stack(max_workers)
+    deploy(bench, f"deploy.install_stack[workers={max_workers}]", [], specs, ctx, stub)
+
+
+def test_reinstall_stack(bench):
+    ctx, stub, specs = make_stack(max_workers=3)
+    deploy(bench, "deploy.setup", [], specs, ctx, stub)
+    deploy(bench, "deploy.reinstall_stack", specs, specs, ctx, stub)
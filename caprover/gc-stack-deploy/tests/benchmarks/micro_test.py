@@ -0,0 +1,60 @@
+"""Micro-benchmarks for helpers that run many times per deploy."""
+
+import itertools
+
+from bench_service_override import large_override
+from gc_stack_deploy.apps_registry import (
+    apply_memory_limit,
+    construct_app_variables,
+    disable_healthcheck,
+    patch_service_update_override,
+    set_yaml_value,
+)
+from gc_stack_deploy.base import AppStatus
+from gc_stack_deploy.gui import _derive_status_note
+
+SUO = large_override(200)
+
+
+class OverrideOnlyCaprover:
+    def get_app(self, app_name):
+        return {"appName": app_name, "serviceUpdateOverride": SUO}
+
+    def update_app(self, app_name, **kwargs):
+        pass
+
+
+def test_set_yaml_value(bench):
+    bench.measure(
+        "micro.set_yaml_value",
+        lambda: set_yaml_value(SUO, "TaskTemplate.Resources.Limits.MemoryBytes", 1),
+    )
+
+
+def test_patch_service_update_override(bench):
+    cap = OverrideOnlyCaprover()
+    bench.measure(
+        "micro.patch_service_update_override",
+        lambda: patch_service_update_override(
+            cap, "superset-worker", disable_healthcheck, apply_memory_limit
+        ),
+    )
+
+
+def test_construct_app_variables(bench):
+    app_cfg = {f"setting_{i}": f"value-{i}" for i in range(1000)}
+    bench.measure(
+        "micro.construct_app_variables",
+        lambda: construct_app_variables(app_cfg, {"$$cap_postgres_host": "pg"}),
+        rounds=20,
+    )
+
+
+def test_derive_status_note(bench):
+    cases = list(itertools.product(AppStatus, (True, False))) * 500
+
+    def derive_all():
+        for current, checked in cases:
+            _derive_status_note(current, checked)
+
+    bench.measure("micro.derive_status_note", derive_all, rounds=20)
@@ -0,0 +1,157 @@
+"""In-process stand-ins for CapRover, Postgres and Docker with realistic latency.
+
+LatencyCaprover mimics the CaproverAPI methods our apps call (with the
+gc-deploy fork's one-click semantics: services are named after `app_name`)
+and sleeps for a scaled-down version of what each call costs on a real
+CapRover. Relative costs matter more than absolute ones: SSL is the slowest
+write, a one-click deploy costs a create + update + deploy per service.
+"""
+
+import copy
+import re
+import threading
+import time
+from collections import Counter
+
+from gc_stack_deploy.apps_registry import APPS_REGISTRY
+
+# Seconds per call on a small VM, roughly. Multiplied by `scale`.
+LATENCY = {
+    "list_apps": 0.15,
+    "update_app": 1.0,
+    "add_domain": 1.0,
+    "enable_ssl": 5.0,
+    "delete_app": 1.0,
+    "create_app": 1.0,
+    "deploy_app": 3.0,
+    "get_app_info": 0.1,
+}
+
+SERVICE_SUFFIXES = {cls.one_click_app_name: cls.service_suffixes for cls in APPS_REGISTRY}
+
+
+class LatencyCaprover:
+    def __init__(self, scale: float = 0.01, root_domain: str = "bench.example"):
+        self.scale = scale
+        self.root_domain = root_domain
+        self.apps: dict[str, dict] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+        time.sleep(LATENCY[method] * self.scale)
+
+    def list_apps(self):
+        self._call("list_apps")
+        with self._lock:
+            apps = copy.deepcopy(list(self.apps.values()))
+        return {"status": 100, "data": {"appDefinitions": apps}}
+
+    def get_app(self, app_name):
+        return next(
+            (a for a in self.list_apps()["data"]["appDefinitions"] if a["appName"] == app_name),
+            {},
+        )
+
+    def get_app_info(self, app_name):
+        self._call("get_app_info")
+        return {"data": {"isAppBuilding": False, "isBuildFailed": False}}
+
+    def create_app(self, app_name, has_persistent_data=False):
+        self._call("create_app")
+        with self._lock:
+            self.apps[app_name] = {
+                "appName": app_name,
+                "serviceUpdateOverride": "",
+                "versions": [],
+                "deployedVersion": 0,
+                "instanceCount": 1,
+                "hasDefaultSubDomainSsl": False,
+            }
+
+    def update_app(self, app_name, **kwargs):
+        self._call("update_app")
+        with self._lock:
+            app = self.apps[app_name]
+            if "serviceUpdateOverride" in kwargs:
+                app["serviceUpdateOverride"] = kwargs["serviceUpdateOverride"]
+
+    def deploy_app(self, app_name, image_name=None, docker_file_lines=None):
+        self._call("deploy_app")
+        with self._lock:
+            app = self.apps[app_name]
+            version = len(app["versions"])
+            app["versions"].append(
+                {"version": version, "deployedImageName": image_name or app_name}
+            )
+            app["deployedVersion"] = version
+
+    def add_domain(self, app_name, custom_domain):
+        self._call("add_domain")
+
+    def enable_ssl(self, app_name, custom_domain=None):
+        self._call("enable_ssl")
+        if custom_domain is None:
+            with self._lock:
+                self.apps[app_name]["hasDefaultSubDomainSsl"] = True
+
+    def deploy_one_click_app(
+        self,
+        one_click_app_name,
+        app_name,
+        app_variables=None,
+        automated=False,
+        one_click_repository=None,
+    ):
+        for suffix in SERVICE_SUFFIXES[one_click_app_name]:
+            self.create_app(app_name + suffix)
+            self.update_app(app_name + suffix)
+            self.deploy_app(app_name + suffix)
+
+    def delete_app(self, app_name, delete_volumes=False):
+        self._call("delete_app")
+        with self._lock:
+            self.apps.pop(app_name, None)
+
+    def delete_app_matching_pattern(
+        self, app_name_pattern, delete_volumes=False, automated=False
+    ):
+        for app in self.list_apps()["data"]["appDefinitions"]:
+            if re.search(app_name_pattern, app["appName"]):
+                self.delete_app(app["appName"], delete_volumes=delete_volumes)
+
+
+class StubProvisioner:
+    """Stands in for DatabaseProvisioner: one session's worth of latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sessions = 0
+        self._lock = threading.Lock()
+        self._pending = False
+
+    def plan(self, specs) -> None:
+        self._pending = any(s.databases or s.provisioning_sql() for s in specs)
+
+    def ensure(self, databases=(), statements=()) -> None:
+        # The whole batch was planned up front, so the first call does it all.
+        with self._lock:
+            if self._pending:
+                self.sessions += 1
+                time.sleep(self.latency)
+                self._pending = False
+
+
+class NoImages:
+    """Stands in for ImagePuller: every image is already present."""
+
+    def start(self, specs) -> None:
+        pass
+
+    def wait(self, spec, cancel=None) -> bool:
+        return True
+
+    def shutdown(self) -> None:
+        pass
@@ -0,0 +1,88 @@
+import pytest
+from gc_stack_deploy.apps_registry import apply_memory_limit, patch_service_update_override
+from gc_stack_deploy.caprover_cache import CachingCaprover
+
+
+class FakeCaprover:
+    """Minimal in-memory stand-in for CaproverAPI that counts list_apps() calls."""
+
+    root_domain = "example.net"
+
+    def __init__(self, *names):
+        self.apps = {n: {"appName": n, "serviceUpdateOverride": ""} for n in names}
+        self.list_calls = 0
+
+    def list_apps(self):
+        self.list_calls += 1
+        return {"status": 100, "data": {"appDefinitions": list(self.apps.values())}}
+
+    def update_app(self, app_name, **kwargs):
+        self.apps[app_name].update(kwargs)
+
+    def deploy_one_click_app(self, one_click_app_name, app_name, **kwargs):
+        for name in (app_name, f"{app_name}-worker"):
+            self.apps[name] = {"appName": name, "serviceUpdateOverride": ""}
+
+    def delete_app_matching_pattern(self, pattern, delete_volumes=False, automated=False):
+        self.apps = {n: a for n, a in self.apps.items() if not n.startswith("windmill")}
+
+    def enable_ssl(self, app_name, custom_domain=None):
+        raise RuntimeError("Let's Encrypt said no")
+
+
+class TestCachingCaprover:
+    def test_reads_are_served_from_one_snapshot(self):
+        fake = FakeCaprover("postgres", "redis")
+        cap = CachingCaprover(fake)
+        assert cap.get_app("postgres")["appName"] == "postgres"
+        assert cap.get_app("redis")["appName"] == "redis"
+        assert cap.get_app("missing") == {}
+        cap.list_apps()
+        assert fake.list_calls == 1
+        assert (cap.hits, cap.misses) == (3, 1)
+
+    def test_update_invalidates_only_that_app(self):
+        fake = FakeCaprover("postgres", "redis")
+        cap = CachingCaprover(fake)
+        cap.get_app("postgres")
+        cap.update_app("redis", instanceCount=2)
+        cap.get_app("postgres")
+        assert fake.list_calls == 1
+        assert cap.get_app("redis")["instanceCount"] == 2
+        assert fake.list_calls == 2
+
+    def test_one_click_deploy_invalidates_all_its_services(self):
+        fake = FakeCaprover("postgres")
+        cap = CachingCaprover(fake)
+        assert cap.get_app("windmill-worker") == {}
+        cap.deploy_one_click_app("windmill-only", "windmill")
+        assert cap.get_app("windmill-worker")["appName"] == "windmill-worker"
+        assert fake.list_calls == 2
+
+    def test_delete_patches_snapshot_without_refetching(self):
+        fake = FakeCaprover("postgres", "windmill", "windmill-worker")
+        cap = CachingCaprover(fake)
+        cap.list_apps()
+        cap.delete_app_matching_pattern("^windmill", automated=True)
+        assert cap.get_app("windmill") == {}
+        assert cap.get_app("postgres")["appName"] == "postgres"
+        assert fake.list_calls == 1
+
+    def test_failed_write_still_invalidates(self):
+        fake = FakeCaprover("postgres")
+        cap = CachingCaprover(fake)
+        cap.get_app("postgres")
+        with pytest.raises(RuntimeError):
+            cap.enable_ssl("postgres")
+        cap.get_app("postgres")
+        assert fake.list_calls == 2
+
+    def test_unwrapped_attributes_are_delegated(self):
+        assert CachingCaprover(FakeCaprover()).root_domain == "example.net"
+
+    def test_patching_several_services_reads_each_once(self):
+        fake = FakeCaprover("superset", "superset-worker", "superset-init-and-beat")
+        cap = CachingCaprover(fake)
+        for svc in ("superset", "superset-worker", "superset-init-and-beat"):
+            patch_service_update_override(cap, svc, apply_memory_limit)
+        assert fake.list_calls == 1
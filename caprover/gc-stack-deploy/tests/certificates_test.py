@@ -0,0 +1,148 @@
+from fake_caprover import fake_ctx, make_ctx
+from gc_stack_deploy.app_mutation import AppMutation
+from gc_stack_deploy.apps_registry import ComapeoCloudApp
+from gc_stack_deploy.base import AppSpec, AppStatus
+from gc_stack_deploy.certificates import CertificateQueue
+from gc_stack_deploy.orchestrator import TaskOutcome, run_deploy
+from gc_stack_deploy.readiness import Backoff
+from gc_stack_deploy.state import DeployState
+
+
+class StubCaprover:
+    """Just enough CapRover for SSL: `enable_ssl` fails the first `failures` times."""
+
+    def __init__(self, failures=0, **definition):
+        self.definition = {"customDomain": [], **definition}
+        self.failures = failures
+        self.calls = []
+
+    def get_app(self, app_name):
+        return self.definition
+
+    def update_app(self, app_name, **settings):
+        self.calls.append(("update_app", app_name, settings))
+
+    def add_domain(self, app_name, domain):
+        self.calls.append(("add_domain", app_name, domain))
+
+    def enable_ssl(self, app_name, domain=None):
+        self.calls.append(("enable_ssl", app_name, domain))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Let's Encrypt: too many failed authorizations")
+
+    def list_apps(self):
+        return {"data": {"appDefinitions": []}}
+
+
+def fast_queue(**kwargs):
+    return CertificateQueue(backoff=Backoff(initial=0.001, maximum=0.001), **kwargs)
+
+
+class TestCertificateQueue:
+    def test_ssl_waits_for_the_queue(self):
+        cap = StubCaprover()
+        queue = fast_queue()
+        queue.collect()
+        AppMutation("web").add_domain("web.example.org", ssl=True).enable_ssl().update(
+            force_ssl=True, support_websocket=True
+        ).apply(cap, queue)
+        assert cap.calls == [
+            ("update_app", "web", {"support_websocket": True}),
+            ("add_domain", "web", "web.example.org"),
+        ]
+
+        assert queue.issue(cap) == {}
+        assert cap.calls[2:] == [
+            ("enable_ssl", "web", None),
+            ("enable_ssl", "web", "web.example.org"),
+            ("update_app", "web", {"force_ssl": True}),
+        ]
+        assert queue.issue(cap) == {}  # drained
+
+    def test_inline_when_not_collecting(self):
+        cap = StubCaprover()
+        AppMutation("web").enable_ssl().update(force_ssl=True).apply(cap, fast_queue())
+        assert [c[0] for c in cap.calls] == ["enable_ssl", "update_app"]
+
+    def test_existing_certificates_are_skipped(self):
+        cap = StubCaprover(
+            hasDefaultSubDomainSsl=True,
+            customDomain=[{"publicDomain": "web.example.org", "hasSsl": True}],
+        )
+        queue = fast_queue()
+        queue.collect()
+        queue.defer("web", [None, "web.example.org"], {"force_ssl": True})
+        queue.issue(cap)
+        assert cap.calls == [("update_app", "web", {"force_ssl": True})]
+
+    def test_failures_are_retried_then_reported(self):
+        queue = fast_queue(attempts=3)
+        queue.collect()
+        queue.defer("web", [None], {"force_ssl": True})
+        flaky = StubCaprover(failures=2)
+        assert queue.issue(flaky) == {}
+        assert [c[0] for c in flaky.calls] == ["enable_ssl"] * 3 + ["update_app"]
+
+        queue.defer("web", [None], {"force_ssl": True})
+        broken = StubCaprover(failures=3)
+        (error,) = queue.issue(broken).values()
+        assert "too many" in str(error)
+        assert ("update_app", "web", {"force_ssl": True}) not in broken.calls
+
+
+class SslApp(AppSpec):
+    one_click_app_name = "web"
+
+    def mutations(self):
+        return [AppMutation(self.app_name).enable_ssl().update(force_ssl=True)]
+
+    def _install(self):
+        self.apply_mutations()
+
+
+class TestRunDeploy:
+    def test_certificates_are_issued_after_every_install(self):
+        cap = StubCaprover(failures=5)
+        ctx = make_ctx(cap)
+        ctx.certificates = fast_queue(attempts=2)
+        statuses = []
+        outcomes = run_deploy(
+            [],
+            [SslApp({}, ctx)],
+            lambda spec, status: statuses.append(status),
+            max_workers=1,
+            ctx=ctx,
+        )
+        assert outcomes == {"web": TaskOutcome.FAILED}
+        assert statuses == [
+            AppStatus.INSTALLING,
+            AppStatus.INSTALLED,
+            AppStatus.CONFIG_CHANGED,  # up, but without SSL: an update retries it
+        ]
+
+    def test_failed_certificates_are_recorded_for_the_next_run(self, tmp_path):
+        ctx = make_ctx(StubCaprover(failures=2), state=DeployState(tmp_path / "state.json"))
+        ctx.certificates = fast_queue(attempts=2)
+        run_deploy([], [SslApp({}, ctx)], lambda spec, status: None, max_workers=1, ctx=ctx)
+        state = DeployState(tmp_path / "state.json")
+        assert state.get("web").ssl_failed == ("web",)
+        assert state.compare(SslApp({}, ctx), {}) == ("SSL",)
+
+        ctx = make_ctx(StubCaprover(), state=state)
+        ctx.certificates = fast_queue(attempts=2)
+        run_deploy([], [SslApp({}, ctx)], lambda spec, status: None, max_workers=1, ctx=ctx)
+        assert state.compare(SslApp({}, ctx), {}) == ()
+
+    def test_install_comapeo_with_deferred_ssl(self, fake):
+        ctx = fake_ctx(fake)
+        spec = ComapeoCloudApp({"app_name": "comapeo"}, ctx)
+        ctx.certificates.collect()
+        spec.install()
+        assert not fake.apps["comapeo"]["hasDefaultSubDomainSsl"]
+        assert not fake.apps["comapeo"]["forceSsl"]
+
+        assert ctx.certificates.issue(ctx.caprover) == {}
+        assert fake.apps["comapeo"]["hasDefaultSubDomainSsl"]
+        assert fake.apps["comapeo"]["forceSsl"]
+
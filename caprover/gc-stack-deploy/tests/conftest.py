@@ -0,0 +1,48 @@
+import pytest
+from fake_caprover import FakeCaprover
+
+
+@pytest.fixture
+def fake():
+    """A running FakeCaprover."""
+    with FakeCaprover() as fake:
+        yield fake
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks", "benchmark suite (tests/benchmarks)")
+    group.addoption(
+        "--benchmarks",
+        action="store_true",
+        help="Run the benchmark suite too. Implied by the other --benchmark-* options.",
+    )
+    group.addoption(
+        "--benchmark-save", metavar="PATH", help="Write benchmark results to PATH as JSON."
+    )
+    group.addoption(
+        "--benchmark-compare",
+        metavar="PATH",
+        help="Fail benchmarks that regressed against the results saved in PATH.",
+    )
+    group.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=0.25,
+        metavar="FRACTION",
+        help="Allowed regression in wall-clock time or call counts (default: 0.25).",
+    )
+
+
+def benchmarks_enabled(config) -> bool:
+    return bool(
+        config.getoption("--benchmarks")
+        or config.getoption("--benchmark-save")
+        or config.getoption("--benchmark-compare")
+    )
+
+
+def pytest_ignore_collect(collection_path, config):
+    # Benchmarks are slow and timing-sensitive: opt-in only.
+    if collection_path.name == "benchmarks" and not benchmarks_enabled(config):
+        return True
+    return None
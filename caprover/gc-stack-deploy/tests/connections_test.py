@@ -0,0 +1,98 @@
+import logging
+from dataclasses import replace
+
+from contextlib import contextmanager
+
+from fake_caprover import PG, fake_ctx, make_ctx
+from gc_stack_deploy.apps_registry import PostgresApp, configured_apps, run_connections
+from gc_stack_deploy.connections import ConnectionBudget
+from gc_stack_deploy.headless import run_headless
+from gc_stack_deploy.resources import GiB, ResourceBudget
+
+POSTGRES = replace(PG, host="srv-captain--postgres")
+BOUNCER = replace(PG, host="srv-captain--pgbouncer")
+
+STACK = {
+    "windmill-only": {"app_name": "windmill", "server_database_connections": 20},
+    "superset-only": {"app_name": "superset"},
+    "gc-explorer": {"postgres_database": "warehouse"},
+}
+
+
+class TestConnectionBudget:
+    def test_pools_are_totalled_per_app(self):
+        ctx = make_ctx(postgres=POSTGRES)
+        configured_apps(STACK, ctx)
+        assert ctx.connections.server == {"windmill": 30, "superset": 35, "gc-explorer": 10}
+        assert ctx.connections.lines()[-1] == "Postgres connections: 75 of 97"
+
+    def test_warns_when_close_and_fails_when_over(self, caplog):
+        with caplog.at_level(logging.WARNING):
+            assert ConnectionBudget(100, {"windmill": 90}).check()
+        assert "close to the 97" in caplog.text
+        caplog.clear()
+        with caplog.at_level(logging.WARNING):
+            assert not ConnectionBudget(50, {"windmill": 30, "superset": 35}).check()
+        assert "may open 65 connections to Postgres, which allows 47" in caplog.text
+
+    def test_pgbouncer_takes_the_apps_that_may_share(self):
+        ctx = make_ctx(
+            postgres=POSTGRES, postgres_pooler=BOUNCER, postgres_max_connections=50
+        )
+        specs = configured_apps({**STACK, "pgbouncer": {"max_client_connections": 40}}, ctx)
+        windmill, superset, explorer = (s for s in specs if s.app_name != "pgbouncer")
+
+        # Windmill's advisory locks need a session of their own.
+        assert windmill.app_variables()["$$cap_database_url"].startswith(
+            "postgres://postgres:pw@srv-captain--postgres:5432/"
+        )
+        assert superset.app_variables()["$$cap_postgres_host"] == "srv-captain--pgbouncer"
+        assert explorer.app_variables()["$$cap_postgres_host"] == "srv-captain--pgbouncer"
+        assert "pgbouncer" in superset.depends_on and "pgbouncer" not in windmill.depends_on
+        bouncer = next(s for s in specs if s.app_name == "pgbouncer")
+        assert bouncer.app_variables()["$$cap_postgres_host"] == "srv-captain--postgres"
+
+        assert ctx.connections.server == {"pgbouncer": 20, "windmill": 30}
+        assert ctx.connections.pooled == {"superset": 35, "gc-explorer": 10}
+        assert not ctx.connections.check()  # 45 clients, 40 allowed
+
+    def test_deploy_refused_when_over(self, fake, caplog):
+        ctx = fake_ctx(fake, postgres=POSTGRES, postgres_max_connections=40)
+        specs = configured_apps(STACK, ctx)
+        assert run_headless(ctx, specs, {"gc-explorer"}, set()) == 1
+        assert "gc-explorer: skipped" in caplog.text
+        assert not fake.apps
+
+    def test_install_pgbouncer(self, fake):
+        ctx = fake_ctx(fake, postgres=POSTGRES, postgres_pooler=BOUNCER)
+        (bouncer,) = configured_apps({"pgbouncer": {"server_connections": 15}}, ctx)
+        bouncer.install()
+        env = {e["key"]: e["value"] for e in fake.apps["pgbouncer"]["envVars"]}
+        assert env["DB_HOST"] == "srv-captain--postgres"
+        assert str(env["MAX_USER_CONNECTIONS"]) == "15"
+        assert env["POOL_MODE"] == "transaction"
+        assert bouncer.plan().empty
+
+    def test_untuned_runs_count_against_the_live_server(self, monkeypatch):
+        class Server:
+            def execute(self, statement):
+                assert statement == "SHOW max_connections"
+                return self
+
+            def fetchone(self):
+                return ("60",)
+
+        ctx = make_ctx(postgres=POSTGRES, postgres_max_connections=None)
+        monkeypatch.setattr(
+            ctx.postgres_pool, "dedicated", contextmanager(lambda cfg: (yield Server()))
+        )
+        ctx.resource_budget = ResourceBudget(memory=8 * GiB, cpus=4)
+        specs = configured_apps({**STACK, "postgres": {"user": "postgres", "pass": "pw"}}, ctx)
+        (postgres,) = (s for s in specs if isinstance(s, PostgresApp))
+        tuned = ctx.connections.max_connections
+        assert tuned > 60
+
+        others = [s for s in specs if s is not postgres]
+        assert run_connections(specs, ctx, others).max_connections == 60
+        assert not ctx.connections.check()  # 75 of 57: Postgres isn't retuned this run
+        assert run_connections(specs, ctx, [postgres]).max_connections == tuned
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+
+import pytest
+from fake_caprover import FakeCaprover
+from gc_stack_deploy.async_caprover import SyncCaprover
+from gc_stack_deploy.deploy_tracker import DeployFailed, DeployTracker
+from gc_stack_deploy.deployment import CaproverClient
+from gc_stack_deploy.readiness import Backoff, ReadinessCancelled, ReadinessTimeout
+
+FAST = Backoff(initial=0.01, maximum=0.02)
+
+SHOP = {
+    "shop-db": {"image": "db:1", "volumes": ["shop-db-data:/var/lib/db"]},
+    "shop": {"image": "web:7", "depends_on": ["shop-db"]},
+}
+
+
+def track(fake, services=SHOP, **kwargs):
+    cap = SyncCaprover.connect(fake.url, fake.password)
+    tracker = DeployTracker(
+        cap, services, backoff=FAST, check_containers=False, **{"timeout": 5, **kwargs}
+    )
+    tracker.run()
+    return tracker
+
+
+class TestDeployTracker:
+    def test_long_builds_are_followed_to_the_end(self, caplog):
+        with FakeCaprover(build_seconds=0.3) as fake:
+            with caplog.at_level(logging.INFO, logger="gc_stack_deploy.deploy_tracker"):
+                tracker = track(fake)
+
+        assert tracker.phase == {"shop-db": "built", "shop": "built"}
+        assert fake.apps["shop"]["versions"][-1]["deployedImageName"] == "web:7"
+        assert fake.apps["shop-db"]["hasPersistentData"]
+        messages = [r.getMessage().split(" (")[0] for r in caplog.records]
+        # The web service is only submitted once the database is built.
+        assert messages == [
+            "shop-db: submitted",
+            "shop-db: building",
+            "shop-db: built",
+            "shop: submitted",
+            "shop: building",
+            "shop: built",
+        ]
+
+    def test_failed_build_fails_and_dependents_never_start(self):
+        with FakeCaprover() as fake:
+            fake.failing_builds.add("shop-db")
+            with pytest.raises(DeployFailed, match="shop-db"):
+                track(fake)
+            assert "shop" not in fake.apps
+
+    def test_timeout_counts_from_submission(self):
+        with FakeCaprover(build_seconds=5) as fake:
+            with pytest.raises(ReadinessTimeout, match="shop-db still building"):
+                track(fake, timeout=0.2)
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        cancel.set()
+        with FakeCaprover() as fake:
+            with pytest.raises(ReadinessCancelled):
+                track(fake, cancel=cancel)
+
+
+class TestCaproverClient:
+    def test_deploy_returns_once_submitted(self):
+        with FakeCaprover(build_seconds=5) as fake:
+            cap = CaproverClient(dashboard_url=fake.url, password=fake.password)
+            cap.create_app("shop", wait_for_app_build=False)
+            started = time.monotonic()
+            cap.deploy_app("shop", image_name="web:7", wait_for_app_build=False)
+            assert time.monotonic() - started < 1
+            assert cap.get_app_info("shop")["data"]["isAppBuilding"]
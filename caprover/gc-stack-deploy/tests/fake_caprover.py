@@ -0,0 +1,389 @@
+"""An in-memory CapRover API server, for tests and local timing runs.
+
+FakeCaprover implements the HTTP endpoints `caprover_api.CaproverAPI` calls
+(login, system info, app definitions, register / update / delete, app data
+(deploy + build status), custom domains, SSL), keeps every app in memory,
+and serves one-click app definitions from `/one-click-apps/`. It needs no
+Docker and no network.
+
+Each endpoint can be given latency and faults, to see how deploys behave
+when CapRover is slow or flaky:
+
+    with FakeCaprover() as fake:
+        fake.inject("update", latency=0.2, in_progress_rate=0.1)
+        fake.fail_next("enable_base_ssl", "5xx")
+        cap = CaproverAPI(dashboard_url=fake.url, password=fake.password)
+        ...
+        print(fake.calls)  # Counter of requests per endpoint
+
+Faults:
+- "5xx": an HTML 502 from nginx, as when CapRover restarts;
+- "in_progress": CapRover's "Another operation still in progress" error;
+- "timeout": the connection is dropped after `timeout_seconds`, no response.
+
+Endpoint names: login, system_info, list_apps, register, delete, update,
+app_data, deploy, custom_domain, enable_base_ssl, enable_custom_ssl, one_click.
+
+Tests build their DeploymentContext with `make_ctx()`, or `fake_ctx()` to
+deploy to a FakeCaprover; conftest.py provides a running one as `fake`.
+"""
+
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from gc_stack_deploy.async_caprover import SyncCaprover
+from gc_stack_deploy.base import DeploymentContext, PostgresConnectionConfig
+from gc_stack_deploy.caprover_cache import CachingCaprover
+
+STATUS_OK = 100
+STATUS_ERROR_GENERIC = 1000
+STATUS_ERROR_ALREADY_EXIST = 1103
+STATUS_WRONG_PASSWORD = 1105
+STATUS_AUTH_TOKEN_INVALID = 1106
+NOT_FOUND = 1111
+
+ONE_CLICK_APPS_DIR = Path(__file__).parents[2] / "one-click-apps" / "v4" / "apps"
+
+ROUTES = {
+    ("POST", "/api/v2/login"): "login",
+    ("GET", "/api/v2/user/system/info"): "system_info",
+    ("GET", "/api/v2/user/apps/appDefinitions"): "list_apps",
+    ("POST", "/api/v2/user/apps/appDefinitions/register"): "register",
+    ("POST", "/api/v2/user/apps/appDefinitions/delete"): "delete",
+    ("POST", "/api/v2/user/apps/appDefinitions/update"): "update",
+    ("POST", "/api/v2/user/apps/appDefinitions/customdomain"): "custom_domain",
+    ("POST", "/api/v2/user/apps/appDefinitions/enablebasedomainssl"): "enable_base_ssl",
+    ("POST", "/api/v2/user/apps/appDefinitions/enablecustomdomainssl"): "enable_custom_ssl",
+}
+APP_DATA_PREFIX = "/api/v2/user/apps/appData/"
+ONE_CLICK_PREFIX = "/one-click-apps/"
+
+
+@dataclass
+class Fault:
+    """Behaviour injected into one endpoint. Rates are probabilities per request."""
+
+    latency: float = 0.0  # seconds added to every request
+    error_rate: float = 0.0  # HTTP 502
+    in_progress_rate: float = 0.0  # "Another operation still in progress"
+    timeout_rate: float = 0.0  # connection dropped after timeout_seconds
+    timeout_seconds: float = 1.0
+
+
+def new_app_definition(app_name: str, has_persistent_data: bool) -> dict:
+    """What CapRover stores for a freshly registered app."""
+    return {
+        "appName": app_name,
+        "hasPersistentData": has_persistent_data,
+        "description": "",
+        "instanceCount": 1,
+        "captainDefinitionRelativeFilePath": "./captain-definition",
+        "networks": ["captain-overlay-network"],
+        "envVars": [],
+        "volumes": [],
+        "ports": [],
+        "versions": [],
+        "deployedVersion": 0,
+        "notExposeAsWebApp": False,
+        "customDomain": [],
+        "hasDefaultSubDomainSsl": False,
+        "forceSsl": False,
+        "websocketSupport": False,
+        "containerHttpPort": 80,
+        "preDeployFunction": "",
+        "serviceUpdateOverride": "",
+        "redirectDomain": "",
+        "appPushWebhook": {},
+        "tags": [],
+    }
+
+
+class FakeCaprover:
+    """A running fake CapRover. Use as a context manager; state is in `apps`."""
+
+    def __init__(
+        self,
+        password: str = "captain42",
+        root_domain: str = "fake.example",
+        build_seconds: float = 0.0,
+        one_click_apps_dir: Path | None = ONE_CLICK_APPS_DIR,
+        seed: int = 0,
+    ):
+        self.password = password
+        self.root_domain = root_domain
+        self.build_seconds = build_seconds  # how long a deploy reports isAppBuilding
+        self.failing_builds: set[str] = set()  # apps whose next deploys fail to build
+        self.one_click_apps_dir = one_click_apps_dir
+        self.apps: dict[str, dict] = {}
+        self.calls: Counter = Counter()
+        self.faults: dict[str, Fault] = {}
+        self._scheduled: dict[str, deque] = defaultdict(deque)
+        self._build_done_at: dict[str, float] = {}
+        self._token = "fake-token"
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._httpd = None
+
+    # --- setup ---------------------------------------------------------------
+
+    def inject(self, endpoint: str = "*", **fault) -> None:
+        """Set the Fault for one endpoint, or for every endpoint with "*"."""
+        self.faults[endpoint] = Fault(**fault)
+
+    def fail_next(self, endpoint: str, kind: str, times: int = 1) -> None:
+        """Make the next `times` requests to `endpoint` fail: "5xx", "in_progress" or "timeout"."""
+        self._scheduled[endpoint].extend([kind] * times)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    @property
+    def one_click_repository(self) -> str:
+        return self.url + ONE_CLICK_PREFIX
+
+    def __enter__(self) -> "FakeCaprover":
+        self._httpd = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), _handler_for(self)
+        )
+        self._httpd.daemon_threads = True
+        threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # --- request handling ----------------------------------------------------
+
+    def _fault_for(self, endpoint: str) -> tuple[Fault, str | None]:
+        with self._lock:
+            fault = self.faults.get(endpoint) or self.faults.get("*") or Fault()
+            if self._scheduled[endpoint]:
+                return fault, self._scheduled[endpoint].popleft()
+            roll = self._random.random()
+        for kind, rate in (
+            ("timeout", fault.timeout_rate),
+            ("5xx", fault.error_rate),
+            ("in_progress", fault.in_progress_rate),
+        ):
+            if roll < rate:
+                return fault, kind
+            roll -= rate
+        return fault, None
+
+    def handle(self, endpoint: str, body: dict, app_name: str | None):
+        """Return (status, body); body is a dict (JSON) or str (raw text)."""
+        with self._lock:
+            if endpoint == "login":
+                if body.get("password") != self.password:
+                    return _error(STATUS_WRONG_PASSWORD, "Password is incorrect.")
+                return _ok({"token": self._token})
+            if endpoint == "system_info":
+                return _ok({"rootDomain": self.root_domain, "hasRootSsl": True})
+            if endpoint == "list_apps":
+                return _ok(
+                    {
+                        "appDefinitions": json.loads(json.dumps(list(self.apps.values()))),
+                        "rootDomain": self.root_domain,
+                        "defaultNginxConfig": "",
+                    }
+                )
+            if endpoint == "register":
+                name = body["appName"]
+                if name in self.apps:
+                    return _error(STATUS_ERROR_ALREADY_EXIST, "App already exists")
+                self.apps[name] = new_app_definition(
+                    name, bool(body.get("hasPersistentData"))
+                )
+                return _ok(description="App Definition Saved")
+
+            name = app_name or body.get("appName")
+            if name not in self.apps:
+                return _error(NOT_FOUND, f"App ({name}) could not be found.")
+            app = self.apps[name]
+
+            if endpoint == "delete":
+                del self.apps[name]
+                self._build_done_at.pop(name, None)
+                return _ok(description="App is deleted")
+            if endpoint == "update":
+                app.update({k: v for k, v in body.items() if k != "appName"})
+                return _ok(description="Updated App Definition Saved")
+            if endpoint == "custom_domain":
+                domain = body["customDomain"]
+                if not any(d["publicDomain"] == domain for d in app["customDomain"]):
+                    app["customDomain"].append({"publicDomain": domain, "hasSsl": False})
+                return _ok(description="Custom domain is now enabled")
+            if endpoint == "enable_base_ssl":
+                app["hasDefaultSubDomainSsl"] = True
+                return _ok(description="Root domain SSL is now enabled")
+            if endpoint == "enable_custom_ssl":
+                for d in app["customDomain"]:
+                    if d["publicDomain"] == body["customDomain"]:
+                        d["hasSsl"] = True
+                        return _ok(description="Custom domain SSL is now enabled")
+                return _error(STATUS_ERROR_GENERIC, "Custom domain not attached")
+            if endpoint == "deploy":
+                definition = json.loads(body.get("captainDefinitionContent") or "{}")
+                version = len(app["versions"])
+                app["versions"].append(
+                    {
+                        "version": version,
+                        "deployedImageName": definition.get("imageName")
+                        or f"img-captain--{name}:{version}",
+                        "timeStamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        "gitHash": body.get("gitHash", ""),
+                    }
+                )
+                if name not in self.failing_builds:
+                    app["deployedVersion"] = version
+                self._build_done_at[name] = time.monotonic() + self.build_seconds
+                return _ok(description="Deploy is started")
+            if endpoint == "app_data":
+                building = time.monotonic() < self._build_done_at.get(name, 0)
+                failed = not building and name in self.failing_builds and bool(app["versions"])
+                return _ok(
+                    {"isAppBuilding": building, "isBuildFailed": failed, "logs": {"lines": []}}
+                )
+        raise AssertionError(f"Unhandled endpoint {endpoint}")
+
+    def one_click_definition(self, name: str) -> str | None:
+        if self.one_click_apps_dir is None:
+            return None
+        # Served as a built repository does: "postgres", never "postgres.yml".
+        path = self.one_click_apps_dir / f"{name}.yml"
+        return path.read_text() if path.is_file() else None
+
+
+# Where test contexts say Postgres is; nothing connects to it.
+PG = PostgresConnectionConfig(host="127.0.0.1", user="postgres", password="pw", ssl=False)
+
+
+class NoAppsCaprover:
+    """A CapRover with no apps, for runs that only probe (dry runs)."""
+
+    def list_apps(self):
+        return {"status": STATUS_OK, "data": {"appDefinitions": []}}
+
+
+def make_ctx(
+    cap=None,
+    repository: str = "http://repo/",
+    use_ssl: bool = True,
+    dry_run: bool = False,
+    postgres: PostgresConnectionConfig = PG,
+    postgres_max_connections: int | None = 100,  # None: ask `postgres`
+    **kwargs,
+) -> DeploymentContext:
+    """A DeploymentContext reaching `postgres` both from containers and from here."""
+    return DeploymentContext(
+        cap,
+        postgres,
+        postgres,
+        repository,
+        use_ssl,
+        dry_run,
+        postgres_max_connections=postgres_max_connections,
+        **kwargs,
+    )
+
+
+def fake_ctx(fake: FakeCaprover, use_ssl: bool = True, dry_run: bool = False, **kwargs):
+    """A context deploying to `fake`, with one-click apps from its repository."""
+    cap = CachingCaprover(SyncCaprover.connect(fake.url, fake.password))
+    return make_ctx(cap, fake.one_click_repository, use_ssl, dry_run, **kwargs)
+
+
+def _ok(data: dict | None = None, description: str = "") -> tuple[int, dict]:
+    body = {"status": STATUS_OK, "description": description}
+    if data is not None:
+        body["data"] = data
+    return 200, body
+
+
+def _error(status: int, description: str) -> tuple[int, dict]:
+    return 200, {"status": status, "description": description}
+
+
+def _handler_for(fake: FakeCaprover):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def _route(self, method: str, path: str) -> tuple[str | None, str | None]:
+            if path.startswith(APP_DATA_PREFIX):
+                app_name = path[len(APP_DATA_PREFIX) :]
+                return ("deploy" if method == "POST" else "app_data"), app_name
+            if method == "GET" and path.startswith(ONE_CLICK_PREFIX):
+                return "one_click", path[len(ONE_CLICK_PREFIX) :]
+            return ROUTES.get((method, path)), None
+
+        def _dispatch(self, method: str) -> None:
+            path = urllib.parse.urlsplit(self.path).path
+            endpoint, arg = self._route(method, path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if endpoint is None:
+                return self._send(404, "Not Found")
+            with fake._lock:
+                fake.calls[endpoint] += 1
+
+            fault, failure = fake._fault_for(endpoint)
+            if fault.latency:
+                time.sleep(fault.latency)
+            if failure == "timeout":
+                time.sleep(fault.timeout_seconds)
+                self.close_connection = True
+                return
+            if failure == "5xx":
+                return self._send(502, "<html><body>502 Bad Gateway</body></html>")
+            if failure == "in_progress":
+                return self._send(
+                    200,
+                    {
+                        "status": STATUS_ERROR_GENERIC,
+                        "description": "Another operation still in progress... "
+                        "please wait...",
+                    },
+                )
+
+            if endpoint == "one_click":
+                text = fake.one_click_definition(arg)
+                return self._send(200, text) if text else self._send(404, "Not Found")
+            if endpoint != "login" and self.headers.get("x-captain-auth") != fake._token:
+                return self._send(
+                    200, {"status": STATUS_AUTH_TOKEN_INVALID, "description": "Auth token corrupted"}
+                )
+            body = json.loads(raw) if raw else {}
+            self._send(*fake.handle(endpoint, body, arg))
+
+        def _send(self, status: int, body) -> None:
+            if isinstance(body, (dict, list)):
+                payload, content_type = json.dumps(body).encode(), "application/json"
+            else:
+                payload, content_type = body.encode(), "text/html; charset=utf-8"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
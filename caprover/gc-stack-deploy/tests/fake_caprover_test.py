@@ -0,0 +1,103 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from caprover_api.caprover_api import CaproverAPI
+from fake_caprover import FakeCaprover, make_ctx
+from gc_stack_deploy.apps_registry import ComapeoCloudApp
+from gc_stack_deploy.base import AppStatus, probe_statuses
+from gc_stack_deploy.caprover_cache import CachingCaprover
+from gc_stack_deploy.deployment import CaproverClient
+
+
+def client(fake):
+    return CaproverClient(dashboard_url=fake.url, password=fake.password)
+
+
+class TestFakeCaprover:
+    def test_app_lifecycle(self, fake):
+        cap = client(fake)
+        assert cap.root_domain == "fake.example"
+
+        cap.create_app("comapeo", has_persistent_data=True, wait_for_app_build=False)
+        cap.update_app("comapeo", environment_variables={"A": "1"}, force_ssl=True)
+        cap.add_domain("comapeo", "comapeo.example.org")
+        cap.enable_ssl("comapeo")
+        cap.enable_ssl("comapeo", "comapeo.example.org")
+        cap.deploy_app("comapeo", image_name="communityfirst/gc-comapeo-cloud:0.4.0")
+
+        app = fake.apps["comapeo"]
+        assert app["envVars"] == [{"key": "A", "value": "1"}]
+        assert app["forceSsl"] and app["hasDefaultSubDomainSsl"]
+        assert app["customDomain"] == [
+            {"publicDomain": "comapeo.example.org", "hasSsl": True}
+        ]
+
+        spec = ComapeoCloudApp({"app_name": "comapeo"}, make_ctx(cap, fake.one_click_repository))
+        info = probe_statuses(CachingCaprover(cap), [spec])["comapeo-cloud"]
+        assert info.status is AppStatus.INSTALLED
+        assert info.image == "communityfirst/gc-comapeo-cloud:0.4.0"
+
+        spec.uninstall()
+        assert fake.apps == {}
+        assert fake.calls["delete"] == 1
+
+    def test_wrong_password(self, fake):
+        with pytest.raises(Exception, match="incorrect"):
+            CaproverAPI(dashboard_url=fake.url, password="nope")
+
+    def test_operation_in_progress(self, fake):
+        cap = client(fake)
+        cap.create_app("redis", wait_for_app_build=False)
+        fake.fail_next("update", "in_progress")
+        with pytest.raises(Exception, match="in progress"):
+            cap.update_app("redis", instance_count=2)
+        cap.update_app("redis", instance_count=2)
+        assert fake.apps["redis"]["instanceCount"] == 2
+
+    def test_bad_gateway_is_not_json(self, fake):
+        cap = client(fake)
+        fake.fail_next("list_apps", "5xx")
+        with pytest.raises(ValueError):
+            cap.list_apps()
+
+    def test_dropped_connection_is_retried_by_the_client(self, fake):
+        fake.inject("list_apps", timeout_seconds=0.01)
+        fake.fail_next("list_apps", "timeout")
+        cap = client(fake)
+        assert cap.list_apps()["data"]["appDefinitions"] == []
+        assert fake.calls["list_apps"] == 2
+
+    def test_latency(self, fake):
+        cap = client(fake)
+        fake.inject("*", latency=0.05)
+        started = time.monotonic()
+        for _ in range(3):
+            cap.list_apps()
+        assert time.monotonic() - started >= 0.15
+
+    def test_random_faults_are_reproducible(self):
+        def failures():
+            with FakeCaprover(seed=7) as fake:
+                fake.inject("*", error_rate=0.5)
+                return [fake._fault_for("list_apps")[1] for _ in range(20)]
+
+        first = failures()
+        assert first == failures()
+        assert "5xx" in first and None in first
+
+    def test_serves_one_click_definitions(self, fake):
+        with urllib.request.urlopen(fake.one_click_repository + "comapeo-cloud") as resp:
+            assert "$$cap_comapeocloud_docker_image" in resp.read().decode()
+        # As a built repository: by app name only.
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(fake.one_click_repository + "comapeo-cloud.yml")
+
+    def test_install_comapeo(self, fake):
+        cap = CachingCaprover(client(fake))
+        spec = ComapeoCloudApp({"app_name": "comapeo"}, make_ctx(cap, fake.one_click_repository))
+        spec.install()
+        app = fake.apps["comapeo"]
+        assert app["forceSsl"] and app["websocketSupport"]
+        assert "MemoryBytes" in app["serviceUpdateOverride"]
@@ -0,0 +1,118 @@
+import logging
+import threading
+
+import pytest
+from fake_caprover import NoAppsCaprover, make_ctx
+from gc_stack_deploy.fleet import (
+    FleetConfigError,
+    FleetInstance,
+    current_instance,
+    deep_merge,
+    format_summary,
+    load_fleet,
+    run_fleet,
+)
+from gc_stack_deploy.orchestrator import TaskOutcome
+
+def dry_run_ctx(config):
+    return make_ctx(NoAppsCaprover(), dry_run=True)
+
+
+class TestLoadFleet:
+    def test_template_config_and_overrides(self, tmp_path):
+        (tmp_path / "base.yaml").write_text(
+            "caproverUrl: https://captain.base\nredis:\n  redis_password: base\n  app_name: redis\n"
+        )
+        (tmp_path / "springfield.yaml").write_text("caproverUrl: https://captain.springfield\n")
+        (tmp_path / "fleet.yaml").write_text(
+            "template: base.yaml\n"
+            "maxParallelInstances: 8\n"
+            "apps: [redis]\n"
+            "instances:\n"
+            "  springfield: springfield.yaml\n"
+            "  shelbyville:\n"
+            "    overrides:\n"
+            "      redis: {redis_password: shelby}\n"
+            "    uninstall: [redis]\n"
+        )
+        (springfield, shelbyville), max_parallel = load_fleet(tmp_path / "fleet.yaml")
+        assert max_parallel == 8
+        assert springfield.config["caproverUrl"] == "https://captain.springfield"
+        assert springfield.config["redis"]["redis_password"] == "base"
+        assert springfield.install == {"redis"} and springfield.uninstall == set()
+        assert shelbyville.config["caproverUrl"] == "https://captain.base"
+        assert dict(shelbyville.config["redis"]) == {"redis_password": "shelby", "app_name": "redis"}
+        assert shelbyville.uninstall == {"redis"}
+
+    def test_command_line_selection_replaces_fleet_default(self, tmp_path):
+        (tmp_path / "fleet.yaml").write_text(
+            "apps: [redis]\ninstances:\n  a:\n    overrides: {caproverUrl: x}\n"
+        )
+        (a,), _ = load_fleet(tmp_path / "fleet.yaml", install={"postgres"})
+        assert a.install == {"postgres"}
+
+    @pytest.mark.parametrize(
+        "fleet",
+        [
+            "instances: []\n",
+            "instances:\n  a:\n    overrides: {redis: {}}\n",
+            "instances:\n  a:\n    overrides: {caproverUrl: x}\n    apps: [nope]\n",
+            "maxParallelInstances: 0\ninstances:\n  a:\n    overrides: {caproverUrl: x}\n",
+            "instances:\n  a:\n    overrides: {caproverUrl: x, maxParallelDeploys: -1}\n",
+            "instances:\n  ../a:\n    overrides: {caproverUrl: x}\n",
+        ],
+    )
+    def test_malformed(self, tmp_path, fleet):
+        (tmp_path / "fleet.yaml").write_text(fleet)
+        with pytest.raises(FleetConfigError):
+            load_fleet(tmp_path / "fleet.yaml")
+
+    def test_deep_merge_leaves_base_alone(self):
+        base = {"a": {"b": 1, "c": 2}}
+        assert deep_merge(base, {"a": {"c": 3}}) == {"a": {"b": 1, "c": 3}}
+        assert base == {"a": {"b": 1, "c": 2}}
+
+
+class TestRunFleet:
+    def test_instances_run_concurrently_with_isolated_logs(self, tmp_path):
+        config = {"caproverUrl": "x", "redis": {"redis_password": "pw"}}
+        instances = [
+            FleetInstance("slow", config, {"redis"}, set()),
+            FleetInstance("fast", config, {"redis"}, set()),
+            FleetInstance("down", config, {"redis"}, set()),
+        ]
+        fast_started = threading.Event()
+
+        def build_context(instance_config):
+            name = current_instance.get()
+            if name == "slow":
+                # Can only get going once "fast" is running alongside it.
+                assert fast_started.wait(5)
+            elif name == "fast":
+                fast_started.set()
+            else:
+                raise ConnectionError("no route to host")
+            return dry_run_ctx(instance_config)
+
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.INFO)
+        try:
+            results = run_fleet(instances, build_context, max_parallel=2, log_dir=tmp_path)
+        finally:
+            root.setLevel(level)
+
+        slow, fast, down = results
+        assert slow.outcomes == {"redis": TaskOutcome.SUCCEEDED} and slow.ok
+        assert fast.ok and "redis" in fast.app_durations
+        assert not down.ok and "no route to host" in down.error
+
+        slow_log = (tmp_path / "slow.log").read_text()
+        assert "Deploying Redis" in slow_log  # logged from the orchestrator's pool
+        assert "no route to host" not in slow_log
+        assert "no route to host" in (tmp_path / "down.log").read_text()
+
+        table = format_summary(results)
+        assert table[0].split() == ["INSTANCE", "APP", "OUTCOME", "SECONDS"]
+        assert table[1].split()[:3] == ["slow", "redis", "succeeded"]
+        assert table[3].split()[:3] == ["down", "-", "error:"]
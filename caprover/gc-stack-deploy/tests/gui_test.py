@@ -1,6 +1,14 @@
+import asyncio
+import logging
+
 import pytest
-from gc_stack_deploy.base import AppStatus
-from gc_stack_deploy.gui import _derive_status_note
+from fake_caprover import fake_ctx
+from gc_stack_deploy.apps_registry import ComapeoCloudApp
+from gc_stack_deploy.base import AppStatus, AppStatusInfo
+from gc_stack_deploy import gui
+from gc_stack_deploy.gui import Deployer, _derive_status_note, _format_status_details
+from gc_stack_deploy.orchestrator import DependencyCycleError
+from textual.widgets import Button, Checkbox, RichLog
 
 
 class TestStatusNoteTransientPrecedence:
@@ -53,3 +61,98 @@ class TestStatusNoteSettledStates:
         text, css_class = _derive_status_note(AppStatus.FAILED, False)
         assert text == "will uninstall"
         assert css_class == "will-uninstall"
+
+    def test_config_changed_checked_will_update(self):
+        text, css_class = _derive_status_note(AppStatus.CONFIG_CHANGED, True)
+        assert text == "config changed: will update"
+        assert css_class == "will-update"
+
+    def test_config_changed_unchecked_will_uninstall(self):
+        text, css_class = _derive_status_note(AppStatus.CONFIG_CHANGED, False)
+        assert text == "will uninstall"
+
+    def test_config_changed_without_update_is_noop(self):
+        text, css_class = _derive_status_note(AppStatus.CONFIG_CHANGED, True, update=False)
+        assert text == "config changed: check update to apply"
+        assert css_class == "currently-installed"
+
+
+class TestStatusDetails:
+    def test_installed_app_shows_all_details(self):
+        info = AppStatusInfo(
+            AppStatus.INSTALLED, image="redis:7", instance_count=1, ssl=False
+        )
+        assert _format_status_details(info) == "redis:7 · 1 instance · no SSL"
+
+    def test_missing_details_are_omitted(self):
+        info = AppStatusInfo(AppStatus.INSTALLED, instance_count=3, ssl=True)
+        assert _format_status_details(info) == "3 instances · SSL"
+
+    def test_config_changed_app_shows_what_changed(self):
+        info = AppStatusInfo(
+            AppStatus.CONFIG_CHANGED, image="redis:7", changed=("variables", "image")
+        )
+        assert _format_status_details(info) == "redis:7 · changed: variables, image"
+
+    @pytest.mark.parametrize("status", [AppStatus.NOT_INSTALLED, AppStatus.FAILED])
+    def test_nothing_shown_unless_installed(self, status):
+        assert _format_status_details(AppStatusInfo(status, image="x")) == ""
+
+    def test_nothing_shown_without_probe(self):
+        assert _format_status_details(None) == ""
+
+
+@pytest.fixture
+def root_handlers():
+    """The Deployer takes over the root logger; give it back afterwards."""
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    yield
+    root.handlers[:] = handlers
+
+
+class TestChecklist:
+    def test_config_changed_apps_update_only_when_asked(self, fake, root_handlers):
+        async def run(fake, deployer):
+            async with deployer.run_test() as pilot:
+                # The status probe, then the update plans behind it.
+                for _ in range(2):
+                    await deployer.workers.wait_for_complete()
+                    await pilot.pause()
+                assert deployer.state.get("comapeo-cloud") is AppStatus.CONFIG_CHANGED
+                update = deployer.query_one("#upd_comapeo-cloud", Checkbox)
+                assert update.display and not update.value
+
+                await pilot.click("#go")
+                await deployer.workers.wait_for_complete()
+                assert fake.apps["comapeo"]["websocketSupport"] is False
+
+                update.value = True
+                await pilot.click("#go")
+                await deployer.workers.wait_for_complete()
+                await pilot.pause()
+                assert fake.apps["comapeo"]["websocketSupport"] is True
+
+        ctx = fake_ctx(fake, use_ssl=False)
+        ComapeoCloudApp({"app_name": "comapeo"}, ctx).install()
+        fake.apps["comapeo"]["websocketSupport"] = False
+        asyncio.run(run(fake, Deployer({"comapeo-cloud": {"app_name": "comapeo"}}, ctx)))
+
+    def test_checklist_unlocks_when_the_deploy_itself_fails(self, fake, root_handlers, monkeypatch):
+        def run_deploy(*args, **kwargs):
+            raise DependencyCycleError("a -> b -> a")
+
+        async def run(deployer):
+            async with deployer.run_test() as pilot:
+                await deployer.workers.wait_for_complete()
+                await pilot.pause()
+                await pilot.click("#go")
+                await deployer.workers.wait_for_complete()
+                await pilot.pause()
+                assert not deployer.query_one("#go", Button).disabled
+                log = deployer.query_one(RichLog)
+                assert any("Deploy failed" in line.text for line in log.lines)
+
+        monkeypatch.setattr(gui, "run_deploy", run_deploy)
+        ctx = fake_ctx(fake, use_ssl=False)
+        asyncio.run(run(Deployer({"comapeo-cloud": {"app_name": "comapeo"}}, ctx)))
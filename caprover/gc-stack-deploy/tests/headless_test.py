@@ -0,0 +1,100 @@
+import io
+import json
+import logging
+import subprocess
+import sys
+
+from fake_caprover import NoAppsCaprover, make_ctx
+from gc_stack_deploy.base import AppSpec, AppStatus, AppStatusInfo
+from gc_stack_deploy.headless import configure_logging, run_headless, select_actions
+from gc_stack_deploy.orchestrator import Action
+
+
+class FakeApp(AppSpec):
+    """AppSpec with a fixed current status, whose install/uninstall only record themselves."""
+
+    def __init__(self, name, status, ctx, fail=False, calls=None):
+        self.one_click_app_name = name
+        self.status = status
+        self.fail = fail
+        self.calls = calls if calls is not None else []
+        super().__init__({}, ctx)
+
+    def status_from_definitions(self, definitions):
+        return AppStatusInfo(self.status)
+
+    def _install(self):
+        self.calls.append(("install", self.one_click_app_name))
+        if self.fail:
+            raise RuntimeError("boom")
+
+    def _uninstall(self):
+        self.calls.append(("uninstall", self.one_click_app_name))
+
+
+class TestSelectActions:
+    def test_names_map_through_resolve_action(self):
+        ctx = make_ctx(NoAppsCaprover(), dry_run=True)
+        specs = [
+            FakeApp("postgres", AppStatus.INSTALLED, ctx),
+            FakeApp("windmill", AppStatus.FAILED, ctx),
+            FakeApp("redis", AppStatus.NOT_INSTALLED, ctx),
+            FakeApp("superset", AppStatus.INSTALLED, ctx),
+            FakeApp("filebrowser", AppStatus.INSTALLED, ctx),
+        ]
+        statuses = {s.one_click_app_name: AppStatusInfo(s.status) for s in specs}
+        actions = select_actions(
+            specs, statuses, install={"postgres", "windmill", "redis"}, uninstall={"superset"}
+        )
+        assert [(s.one_click_app_name, a) for s, a in actions] == [
+            ("windmill", Action.REINSTALL),
+            ("redis", Action.INSTALL),
+            ("superset", Action.UNINSTALL),
+        ]
+
+
+class TestRunHeadless:
+    def test_exit_code_reflects_failures(self):
+        ctx = make_ctx(NoAppsCaprover(), dry_run=True)
+        calls = []
+        specs = [
+            FakeApp("redis", AppStatus.NOT_INSTALLED, ctx, calls=calls),
+            FakeApp("superset", AppStatus.INSTALLED, ctx, calls=calls),
+        ]
+        assert run_headless(ctx, specs, {"redis"}, {"superset"}) == 0
+        assert sorted(calls) == [("install", "redis"), ("uninstall", "superset")]
+
+        specs[0].fail = True
+        assert run_headless(ctx, specs, {"redis"}, set()) == 1
+
+    def test_nothing_to_do(self):
+        ctx = make_ctx(NoAppsCaprover(), dry_run=True)
+        specs = [FakeApp("redis", AppStatus.INSTALLED, ctx)]
+        assert run_headless(ctx, specs, {"redis"}, set()) == 0
+        assert specs[0].calls == []
+
+
+class TestLogging:
+    def test_json_lines_carry_app_and_status(self):
+        stream = io.StringIO()
+        root = logging.getLogger()
+        saved = root.handlers[:], root.level
+        try:
+            configure_logging("json", stream)
+            ctx = make_ctx(NoAppsCaprover(), dry_run=True)
+            run_headless(ctx, [FakeApp("redis", AppStatus.NOT_INSTALLED, ctx)], {"redis"}, set())
+        finally:
+            root.handlers[:], root.level = saved
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert {"ts", "level", "logger", "message"} <= entries[0].keys()
+        assert {"app": "redis", "status": "installed"}.items() <= next(
+            e for e in entries if e.get("status") == "installed"
+        ).items()
+        assert entries[-1]["outcome"] == "succeeded"
+
+    def test_cli_never_imports_textual(self):
+        check = (
+            "import sys; import gc_stack_deploy.stack_deploy; "
+            "sys.exit('textual' in sys.modules)"
+        )
+        assert subprocess.run([sys.executable, "-c", check]).returncode == 0
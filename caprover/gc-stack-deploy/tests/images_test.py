@@ -0,0 +1,97 @@
+import logging
+import subprocess
+import sys
+import threading
+
+from fake_caprover import make_ctx
+from gc_stack_deploy import images
+from gc_stack_deploy.apps_registry import RedisApp, SupersetApp, WindmillApp
+from gc_stack_deploy.images import ImagePuller, caprover_runs_here
+from gc_stack_deploy.one_click import OneClickDefinition
+
+# Stands in for `docker pull`: prints what docker prints without a TTY.
+FAKE_PULL = (
+    sys.executable,
+    "-c",
+    "import sys; print('abc: Pulling fs layer'); print('abc: Pull complete');"
+    "print('def: Already exists'); sys.exit(sys.argv[1] == 'broken:latest')",
+)
+
+
+class FakePuller(ImagePuller):
+    docker_command = FAKE_PULL
+
+
+class TestDockerImage:
+    def test_config_override_wins(self):
+        spec = SupersetApp({"superset_docker_image": "superset:custom"}, make_ctx())
+        assert spec.docker_image() == "superset:custom"
+
+    def test_falls_back_to_one_click_default(self):
+        ctx = make_ctx()
+        ctx.one_click_apps._definitions["windmill-only"] = OneClickDefinition.parse(
+            "windmill-only",
+            "caproverOneClickApp:\n"
+            "  variables:\n"
+            "    - id: $$cap_app_docker_image\n"
+            "      defaultValue: windmill:1\n",
+        )
+        assert WindmillApp({}, ctx).docker_image() == "windmill:1"
+
+    def test_public_apps_are_not_pulled(self):
+        assert RedisApp({}, make_ctx()).docker_image() is None
+
+
+class TestImagePuller:
+    def test_pull_streams_layer_progress(self, caplog):
+        with caplog.at_level(logging.INFO, logger="gc_stack_deploy.images"):
+            assert FakePuller().pull("ok:latest")
+        messages = [r.getMessage() for r in caplog.records]
+        assert "ok:latest: abc: Pull complete" in messages
+        assert "ok:latest: def: Already exists" in messages
+        assert any(m.startswith("Pulled ok:latest: 2 layers") for m in messages)
+
+    def test_failed_pull_is_not_fatal(self):
+        assert FakePuller().pull("broken:latest") is False
+
+    def test_each_app_waits_only_for_its_own_image(self):
+        release = threading.Event()
+
+        class GatedPuller(ImagePuller):
+            def pull(self, image):
+                if image == "slow":
+                    release.wait(5)
+                return True
+
+        ctx = make_ctx()
+        slow = SupersetApp({"superset_docker_image": "slow"}, ctx)
+        fast = WindmillApp({"app_docker_image": "fast"}, ctx)
+        puller = GatedPuller()
+        puller.start([slow, fast, RedisApp({}, ctx)])
+        try:
+            assert puller.wait(fast)
+            assert puller.wait(RedisApp({}, ctx)) is False  # nothing to pull
+            release.set()
+            assert puller.wait(slow)
+        finally:
+            release.set()
+            puller.shutdown()
+
+    def test_only_where_caprover_runs(self, monkeypatch):
+        def no_docker(args, **kwargs):
+            raise FileNotFoundError("docker")
+
+        monkeypatch.setattr(images.subprocess, "run", no_docker)
+        assert not caprover_runs_here()
+        monkeypatch.setattr(
+            images.subprocess,
+            "run",
+            lambda args, **kwargs: subprocess.CompletedProcess(args, 1, "", "no such service"),
+        )
+        assert not caprover_runs_here()
+        monkeypatch.setattr(
+            images.subprocess,
+            "run",
+            lambda args, **kwargs: subprocess.CompletedProcess(args, 0, "kqj1\n", ""),
+        )
+        assert caprover_runs_here()
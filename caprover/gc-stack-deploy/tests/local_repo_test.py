@@ -0,0 +1,80 @@
+import gzip
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from gc_stack_deploy.local_repo import LocalRepoServer
+
+DEFINITION = b'{"captainVersion": 4, "services": {}}' * 20
+
+
+@pytest.fixture(scope="module")
+def repo_url(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("repo")
+    (directory / "windmill-only").write_bytes(DEFINITION)
+    (directory / "logo.png").write_bytes(b"\x89PNG" + b"\0" * 400)
+    with LocalRepoServer(str(directory)) as url:
+        yield url
+
+
+def fetch(url, **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as r:
+            return r.status, dict(r.headers), r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+class TestLocalRepoServer:
+    def test_gzip_when_accepted(self, repo_url):
+        status, headers, body = fetch(
+            repo_url + "windmill-only", **{"Accept-Encoding": "gzip"}
+        )
+        assert status == 200
+        assert headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(body) == DEFINITION
+
+        status, headers, body = fetch(repo_url + "windmill-only")
+        assert "Content-Encoding" not in headers
+        assert body == DEFINITION
+
+    def test_images_are_not_gzipped(self, repo_url):
+        _, headers, _ = fetch(repo_url + "logo.png", **{"Accept-Encoding": "gzip"})
+        assert headers["Content-Type"] == "image/png"
+        assert "Content-Encoding" not in headers
+
+    def test_etag_revalidation(self, repo_url):
+        _, headers, _ = fetch(repo_url + "windmill-only")
+        status, _, body = fetch(
+            repo_url + "windmill-only", **{"If-None-Match": headers["ETag"]}
+        )
+        assert (status, body) == (304, b"")
+
+    def test_stays_inside_the_repository(self, repo_url):
+        assert fetch(repo_url + "missing")[0] == 404
+        assert fetch(repo_url + "..%2f..%2fetc%2fpasswd")[0] == 404
+        assert fetch(repo_url)[0] == 404  # no directory listings
+
+    def test_concurrent_requests(self, repo_url):
+        results = []
+
+        def get():
+            results.append(fetch(repo_url + "windmill-only")[0])
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        assert results == [200] * 8
+
+    def test_added_and_edited_files_are_served(self, tmp_path):
+        with LocalRepoServer(str(tmp_path)) as url:
+            assert fetch(url + "redis")[0] == 404
+            (tmp_path / "redis").write_bytes(b"first")
+            assert fetch(url + "redis")[2] == b"first"
+            (tmp_path / "redis").write_bytes(b"second")
+            os.utime(tmp_path / "redis", ns=(0, 10**9))  # mtime may not tick otherwise
+            assert fetch(url + "redis")[2] == b"second"
@@ -0,0 +1,131 @@
+import http.server
+import threading
+
+import pytest
+from gc_stack_deploy.one_click import OneClickDefinition, OneClickRepository
+
+WINDMILL = """\
+services:
+  $$cap_appname:
+    image: $$cap_app_docker_image
+caproverOneClickApp:
+  variables:
+    - id: $$cap_app_docker_image
+      label: Windmill image
+      defaultValue: ghcr.io/windmill-labs/windmill:1.0
+      validRegex: /.{1,}/
+    - id: $$cap_database_url
+      label: Database URL
+"""
+
+
+class DefinitionHandler(http.server.BaseHTTPRequestHandler):
+    """Serves WINDMILL at /apps/windmill-only with an ETag, counting requests."""
+
+    requests = []  # (path, status)
+    cache_control = "no-cache"
+
+    def do_GET(self):
+        if self.path != "/apps/windmill-only":
+            status, body = 404, b""
+        elif self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        else:
+            status, body = 200, WINDMILL.encode()
+        self.requests.append((self.path, status))
+        self.send_response(status)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Cache-Control", self.cache_control)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def repo_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), DefinitionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/apps/"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_handler():
+    DefinitionHandler.requests = []
+    DefinitionHandler.cache_control = "no-cache"
+
+
+class TestOneClickDefinition:
+    def test_parse(self):
+        definition = OneClickDefinition.parse("windmill-only", WINDMILL)
+        assert list(definition.services) == ["$$cap_appname"]
+        assert definition.default("$$cap_app_docker_image").endswith(":1.0")
+        assert definition.variables["$$cap_app_docker_image"].accepts("x")
+        assert not definition.variables["$$cap_app_docker_image"].accepts("")
+        with pytest.raises(ValueError):
+            definition.default("$$cap_database_url")
+
+    def test_repeated_random_hex_expression_gets_one_value(self):
+        raw = """\
+services:
+  $$cap_appname:
+    environment:
+      SECRET: $$cap_gen_random_hex(16)
+      SAME_SECRET: $$cap_gen_random_hex(16)
+      OTHER_SECRET: $$cap_gen_random_hex(8)
+caproverOneClickApp:
+  variables: []
+"""
+        definition = OneClickDefinition.parse("app", raw)
+        values = iter(["a1", "b2"])
+        rendered = definition.render("app", {}, "example.org", random_hex=lambda n: next(values))
+        env = rendered["app"]["environment"]
+        assert env == {"SECRET": "a1", "SAME_SECRET": "a1", "OTHER_SECRET": "b2"}
+
+
+class TestOneClickRepository:
+    def test_fetched_once_per_run(self, repo_url, tmp_path):
+        repo = OneClickRepository(repo_url, cache_dir=tmp_path)
+        assert repo.get("windmill-only") is repo.get("windmill-only")
+        assert repo.raw("windmill-only") == WINDMILL
+        assert len(DefinitionHandler.requests) == 1
+
+    def test_next_run_revalidates_stored_copy(self, repo_url, tmp_path):
+        OneClickRepository(repo_url, cache_dir=tmp_path).get("windmill-only")
+        repo = OneClickRepository(repo_url, cache_dir=tmp_path)
+        assert repo.raw("windmill-only") == WINDMILL
+        assert DefinitionHandler.requests[-1][1] == 304
+        assert (repo.downloads, repo.revalidations) == (0, 1)
+
+    def test_fresh_stored_copy_skips_the_network(self, repo_url, tmp_path):
+        DefinitionHandler.cache_control = "max-age=600"
+        OneClickRepository(repo_url, cache_dir=tmp_path).get("windmill-only")
+        repo = OneClickRepository(repo_url, cache_dir=tmp_path)
+        repo.get("windmill-only")
+        assert len(DefinitionHandler.requests) == 1
+        assert repo.stored_hits == 1
+
+    def test_unreachable_repository_falls_back_to_stored_copy(self, repo_url, tmp_path):
+        OneClickRepository(repo_url, cache_dir=tmp_path).get("windmill-only")
+        # Same store key, but nothing listens on port 9 (discard).
+        offline = OneClickRepository(repo_url, cache_dir=tmp_path)
+        offline.repository = "http://127.0.0.1:9/apps/"
+        assert offline.raw("windmill-only") == WINDMILL
+
+    def test_serves_client_downloads_for_its_repository_only(self, repo_url, tmp_path):
+        class Client:
+            @staticmethod
+            def _download_one_click_app_defn(repository_path, one_click_app_name):
+                return f"downloaded {repository_path}{one_click_app_name}"
+
+        client = Client()
+        repo = OneClickRepository(repo_url, cache_dir=tmp_path)
+        repo.serve_downloads_for(client)
+        assert client._download_one_click_app_defn(repo_url, "windmill-only") == WINDMILL
+        assert client._download_one_click_app_defn("https://public/", "redis") == (
+            "downloaded https://public/redis"
+        )
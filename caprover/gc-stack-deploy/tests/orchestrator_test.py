@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+
+import pytest
+from fake_caprover import make_ctx
+from gc_stack_deploy.base import AppSpec, AppStatus
+from gc_stack_deploy.orchestrator import (
+    DependencyCycleError,
+    TaskOutcome,
+    parallel_limit,
+    run_deploy,
+    topological_order,
+)
+
+class FakeApp(AppSpec):
+    """AppSpec whose install/uninstall only record themselves."""
+
+    def __init__(self, name, depends_on=(), fail=False, calls=None):
+        self.one_click_app_name = name
+        self.depends_on = tuple(depends_on)
+        self.fail = fail
+        self.calls = calls if calls is not None else []
+        super().__init__({}, ctx=None)
+
+    def _install(self):
+        self.calls.append(("install", self.one_click_app_name))
+        if self.fail:
+            raise RuntimeError("boom")
+
+    def _uninstall(self):
+        self.calls.append(("uninstall", self.one_click_app_name))
+        if self.fail:
+            raise RuntimeError("boom")
+
+
+def names(specs):
+    return [s.one_click_app_name for s in specs]
+
+
+class TestTopologicalOrder:
+    def test_prerequisites_come_first(self):
+        specs = [
+            FakeApp("superset", ["postgres", "redis"]),
+            FakeApp("redis"),
+            FakeApp("postgres"),
+        ]
+        assert names(topological_order(specs)) == ["redis", "postgres", "superset"]
+
+    def test_reverse_puts_dependents_first(self):
+        specs = [FakeApp("postgres"), FakeApp("windmill", ["postgres"])]
+        assert names(topological_order(specs, reverse=True)) == [
+            "windmill",
+            "postgres",
+        ]
+
+    def test_dependencies_outside_batch_are_ignored(self):
+        specs = [FakeApp("windmill", ["postgres"])]
+        assert names(topological_order(specs)) == ["windmill"]
+
+    def test_cycle_is_rejected(self):
+        specs = [FakeApp("a", ["b"]), FakeApp("b", ["a"])]
+        with pytest.raises(DependencyCycleError):
+            topological_order(specs)
+
+
+class TestParallelLimit:
+    @pytest.mark.parametrize("value", [0, -1, "two", 1.5, None])
+    def test_rejects_anything_but_a_positive_whole_number(self, value):
+        with pytest.raises(ValueError, match="maxParallelDeploys must be a whole number"):
+            parallel_limit(value, "maxParallelDeploys")
+        assert parallel_limit("4", "maxParallelDeploys") == 4
+
+
+class TestRunDeploy:
+    def test_independent_apps_run_concurrently(self):
+        # Each install blocks until all three are in flight at once.
+        barrier = threading.Barrier(3, timeout=5)
+
+        class BarrierApp(FakeApp):
+            def _install(self):
+                barrier.wait()
+
+        specs = [BarrierApp("redis"), BarrierApp("comapeo"), BarrierApp("files")]
+        outcomes = run_deploy([], specs, on_status=lambda *_: None, max_workers=3)
+        assert set(outcomes.values()) == {TaskOutcome.SUCCEEDED}
+
+    def test_installs_wait_for_prerequisites(self):
+        calls = []
+        specs = [
+            FakeApp("windmill", ["postgres"], calls=calls),
+            FakeApp("postgres", calls=calls),
+        ]
+        run_deploy([], specs, on_status=lambda *_: None, max_workers=4)
+        assert calls == [("install", "postgres"), ("install", "windmill")]
+
+    def test_failed_prerequisite_skips_dependents_only(self):
+        calls = []
+        statuses = []
+        specs = [
+            FakeApp("postgres", fail=True, calls=calls),
+            FakeApp("windmill", ["postgres"], calls=calls),
+            FakeApp("redis", calls=calls),
+        ]
+        outcomes = run_deploy(
+            [],
+            specs,
+            on_status=lambda spec, status: statuses.append(
+                (spec.one_click_app_name, status)
+            ),
+            max_workers=1,
+        )
+        assert outcomes == {
+            "postgres": TaskOutcome.FAILED,
+            "windmill": TaskOutcome.SKIPPED,
+            "redis": TaskOutcome.SUCCEEDED,
+        }
+        assert ("install", "windmill") not in calls
+        assert ("postgres", AppStatus.FAILED) in statuses
+        # A skipped app is never reported, so its checklist row keeps its old state.
+        assert not [s for s in statuses if s[0] == "windmill"]
+
+    def test_uninstalls_run_in_reverse_dependency_order_before_installs(self):
+        calls = []
+        postgres = FakeApp("postgres", calls=calls)
+        windmill = FakeApp("windmill", ["postgres"], calls=calls)
+        run_deploy(
+            [postgres, windmill],
+            [windmill],
+            on_status=lambda *_: None,
+            max_workers=4,
+        )
+        assert calls == [
+            ("uninstall", "windmill"),
+            ("uninstall", "postgres"),
+            ("install", "windmill"),
+        ]
+
+    def test_run_with_context_writes_trace_and_logs_summary(self, tmp_path, caplog):
+        ctx = make_ctx(dry_run=True, trace_dir=str(tmp_path))
+        specs = [FakeApp("postgres"), FakeApp("windmill", ["postgres"], fail=True)]
+        for spec in specs:
+            spec.ctx = ctx
+        with caplog.at_level(logging.INFO, logger="gc_stack_deploy.orchestrator"):
+            run_deploy([], specs, on_status=lambda *_: None, max_workers=2, ctx=ctx)
+
+        (trace_file,) = tmp_path.glob("deploy-*.json")
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        assert {(e["name"], e["args"]["app"]) for e in events if e["ph"] == "X"} == {
+            ("install", "postgres"),
+            ("install", "windmill"),
+        }
+        assert any(r.getMessage().startswith("  postgres install: ") for r in caplog.records)
+        assert any("windmill install FAILED" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,104 @@
+import pytest
+from fake_caprover import fake_ctx
+from gc_stack_deploy.apps_registry import ComapeoCloudApp, FilebrowserApp
+from gc_stack_deploy.base import AppStatus, probe_statuses
+from gc_stack_deploy.orchestrator import run_deploy
+from gc_stack_deploy.plan import Change, diff_definition
+
+
+def comapeo(fake, use_ssl=True, **app_cfg):
+    return ComapeoCloudApp({"app_name": "comapeo", **app_cfg}, fake_ctx(fake, use_ssl))
+
+
+class TestDiffDefinition:
+    def test_only_settings_that_differ_are_changes(self):
+        live = {
+            "envVars": [{"key": "A", "value": "1"}, {"key": "KEEP", "value": "x"}],
+            "instanceCount": 1,
+            "forceSsl": None,
+            "ports": [{"hostPort": 5432, "containerPort": 5432}],
+            "serviceUpdateOverride": "TaskTemplate: {Resources: {}}\n",
+        }
+        desired = {
+            "envVars": [{"key": "A", "value": "2"}],
+            "instanceCount": 1,
+            "forceSsl": False,
+            "ports": [{"hostPort": "5432", "containerPort": "5432"}],
+            "serviceUpdateOverride": "TaskTemplate:\n  Resources: {}\n",
+        }
+        assert diff_definition("pg", live, desired) == [
+            Change("pg", "envVars.A", "1", "2")
+        ]
+
+    def test_secrets_are_never_described(self):
+        change = Change("fb", "envVars.FB_PASSWORD", "old-hash", "new-hash")
+        assert "hash" not in change.describe()
+        assert change.describe() == "fb: envVars.FB_PASSWORD changed"
+
+
+class TestPlanApp:
+    def test_installed_app_has_an_empty_plan(self, fake):
+        spec = comapeo(fake)
+        spec.install()
+        assert spec.plan().empty
+
+    def test_changed_config_plans_only_the_deltas(self, fake):
+        comapeo(fake).install()
+        writes = fake.calls["update"]
+
+        spec = comapeo(
+            fake,
+            use_ssl=False,
+            server_name="Springfield",
+            comapeocloud_docker_image="communityfirst/gc-comapeo-cloud:0.5.0",
+        )
+        plan = spec.plan()
+        assert plan.fields() == ("envVars", "forceSsl", "image")
+        assert plan.lines() == [
+            "comapeo: envVars.SERVER_NAME changed",
+            "comapeo: forceSsl: True -> False",
+            "comapeo: image: 'communityfirst/gc-comapeo-cloud:0.4.0' -> "
+            "'communityfirst/gc-comapeo-cloud:0.5.0'",
+        ]
+
+        spec.update()
+        assert fake.calls["update"] == writes + 1  # one batched write
+        app = fake.apps["comapeo"]
+        assert {"key": "SERVER_NAME", "value": "Springfield"} in app["envVars"]
+        assert app["forceSsl"] is False
+        assert app["hasDefaultSubDomainSsl"]  # SSL can't be turned off again
+        assert app["versions"][-1]["deployedImageName"].endswith(":0.5.0")
+        assert spec.plan().empty
+
+    def test_hand_edits_show_up_in_the_probe(self, fake):
+        spec = comapeo(fake)
+        spec.install()
+        fake.apps["comapeo"]["websocketSupport"] = False
+        fake.apps["comapeo"]["serviceUpdateOverride"] = ""
+
+        info = probe_statuses(spec.ctx.caprover, [spec], plan=True)["comapeo-cloud"]
+        assert info.status is AppStatus.CONFIG_CHANGED
+        assert info.changed == ("websocketSupport", "serviceUpdateOverride")
+
+        run_deploy([], [], lambda *_: None, max_workers=1, ctx=spec.ctx, to_update=[spec])
+        assert fake.apps["comapeo"]["websocketSupport"] is True
+        assert "MemoryBytes" in fake.apps["comapeo"]["serviceUpdateOverride"]
+
+    def test_hand_scaled_services_are_reported_not_reverted(self, fake):
+        spec = comapeo(fake)
+        spec.install()
+        fake.apps["comapeo"]["instanceCount"] = 3
+
+        plan = spec.plan()
+        assert plan.empty
+        assert plan.lines() == ["comapeo: instanceCount: 3 -> 1 (left as is)"]
+
+        spec.update()
+        assert fake.apps["comapeo"]["instanceCount"] == 3
+
+    def test_missing_service_needs_a_reinstall(self, fake):
+        spec = FilebrowserApp({}, comapeo(fake).ctx)
+        plan = spec.plan()
+        assert plan.missing == ["filebrowser"]
+        with pytest.raises(RuntimeError, match="reinstall"):
+            plan.apply(spec.ctx.caprover)
@@ -0,0 +1,112 @@
+import threading
+from contextlib import contextmanager
+
+from fake_caprover import PG, make_ctx
+from gc_stack_deploy import postgres
+from gc_stack_deploy.apps_registry import GCExplorerApp, SupersetApp, WindmillApp
+from gc_stack_deploy.postgres import DatabaseProvisioner
+
+
+class FakeCursor:
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        self.session.append(statement)
+
+    def fetchall(self):
+        return [("postgres",), ("warehouse",)]
+
+
+class FakePool:
+    """Records the statements executed in each borrowed session."""
+
+    def __init__(self):
+        self.sessions = []
+
+    @contextmanager
+    def connection(self, cfg, dbname=None, autocommit=True):
+        session = []
+        self.sessions.append(session)
+
+        class Conn:
+            def cursor(self):
+                return FakeCursor(session)
+
+        yield Conn()
+
+
+def rendered(session):
+    return [s if isinstance(s, str) else s.as_string() for s in session]
+
+
+class TestDatabaseProvisioner:
+    def test_whole_batch_is_provisioned_in_one_session(self):
+        ctx = make_ctx()
+        pool = FakePool()
+        provisioner = DatabaseProvisioner(pool, PG)
+        specs = [
+            WindmillApp({"app_name": "windmill"}, ctx),
+            SupersetApp({"app_name": "superset"}, ctx),
+            GCExplorerApp({"app_name": "explorer"}, ctx),
+        ]
+        provisioner.plan(specs)
+        provisioner.ensure(specs[0].databases)
+        for spec in specs[1:]:
+            provisioner.ensure(spec.databases)
+
+        assert len(pool.sessions) == 1
+        assert rendered(pool.sessions[0]) == [
+            "SELECT datname FROM pg_database",
+            'CREATE DATABASE "windmill"',
+            'CREATE DATABASE "superset_metastore"',
+            'CREATE DATABASE "guardianconnector"',
+        ]
+
+    def test_unplanned_needs_get_their_own_session(self):
+        pool = FakePool()
+        provisioner = DatabaseProvisioner(pool, PG)
+        provisioner.ensure(("warehouse",))
+        provisioner.ensure(("warehouse",))
+        provisioner.ensure(("other",))
+        assert len(pool.sessions) == 2
+
+    def test_azure_windmill_roles_are_batched(self):
+        ctx = make_ctx()
+        pool = FakePool()
+        provisioner = DatabaseProvisioner(pool, PG)
+        spec = WindmillApp(
+            {"azure_db_user": "windmill_login", "azure_db_pass": "s3cret"}, ctx
+        )
+        provisioner.plan([spec])
+        provisioner.ensure(spec.databases, spec.provisioning_sql())
+        statements = rendered(pool.sessions[0])
+        assert "GRANT azure_pg_admin TO \"windmill_login\";" in statements
+        # Config is no longer consumed by reading it.
+        assert spec.is_using_azure_db
+
+
+class TestPostgresPool:
+    def test_connecting_honours_the_contexts_timeout_and_cancel(self, monkeypatch):
+        calls = []
+
+        class Conn:
+            closed = broken = False
+
+        def connect(*args, **kwargs):
+            calls.append(kwargs)
+            return Conn()
+
+        monkeypatch.setattr(postgres, "connect_with_retries", connect)
+        cancel = threading.Event()
+        ctx = make_ctx(readiness_timeout=5, cancel=cancel)
+        with ctx.postgres_pool.connection(PG):
+            pass
+        assert calls == [{"timeout": 5, "cancel": cancel, "autocommit": True}]
+        assert ctx.provisioner.pool is ctx.postgres_pool
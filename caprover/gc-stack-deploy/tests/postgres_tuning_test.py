@@ -0,0 +1,168 @@
+import logging
+from contextlib import contextmanager
+
+from fake_caprover import PG, make_ctx
+from gc_stack_deploy.apps_registry import (
+    GCExplorerApp,
+    PostgresApp,
+    SupersetApp,
+    WindmillApp,
+    force_restart,
+)
+from gc_stack_deploy.postgres_tuning import PostgresTuner, tuned_settings
+from gc_stack_deploy.resources import GiB, ResourceBudget
+from ruamel.yaml import YAML
+
+RESTART_ONLY = {"max_connections", "shared_buffers"}
+
+
+class FakeServer:
+    """Just enough Postgres for ALTER SYSTEM: postgresql.auto.conf, and what runs."""
+
+    def __init__(self):
+        self.auto_conf = {}
+        self.running = {
+            "max_connections": "100",
+            "shared_buffers": "128MB",
+            "work_mem": "4MB",
+        }
+        self.started = 1
+        self.restarts = 0
+
+    def restart(self):
+        self.running.update(self.auto_conf)
+        self.started += 1
+        self.restarts += 1
+
+    def execute(self, statement, params=None):
+        if not isinstance(statement, str):
+            statement = statement.as_string()
+        rows = []
+        if statement.startswith("ALTER SYSTEM SET"):
+            name, value = statement.removeprefix("ALTER SYSTEM SET ").split(" = ")
+            self.auto_conf[name.strip('"')] = value.strip("'")
+        elif "pg_reload_conf" in statement:
+            for name, value in self.auto_conf.items():
+                if name not in RESTART_ONLY:
+                    self.running[name] = value
+        elif "pg_postmaster_start_time" in statement:
+            rows = [(self.started,)]
+        elif "pg_file_settings" in statement:
+            rows = [
+                (
+                    name,
+                    "postmaster" if name in RESTART_ONLY else "user",
+                    self.auto_conf.get(name, self.running[name]) != self.running[name],
+                    self.auto_conf.get(name),
+                )
+                for name in params[0]
+            ]
+        elif "current_setting" in statement:
+            rows = [(name, self.running[name]) for name in params[0]]
+
+        class Result:
+            def fetchall(self):
+                return rows
+
+            def fetchone(self):
+                return rows[0]
+
+        return Result()
+
+
+class FakePool:
+    def __init__(self, server):
+        self.server = server
+        self.dedicated_connections = 0
+        self.closes = 0
+
+    @contextmanager
+    def connection(self, cfg, dbname=None, autocommit=True):
+        yield self.server
+
+    @contextmanager
+    def dedicated(self, cfg, dbname=None):
+        self.dedicated_connections += 1
+        yield self.server
+
+    def close(self):
+        self.closes += 1
+
+
+def tune(server, settings):
+    return PostgresTuner(FakePool(server), PG, server.restart, timeout=5).apply(settings)
+
+
+class TestTunedSettings:
+    def test_scales_with_memory_and_connections(self):
+        small = tuned_settings(1 * GiB, 1, connections=60)
+        assert small["shared_buffers"] == "256MB"
+        assert small["effective_cache_size"] == "768MB"
+        assert small["max_connections"] == "100"
+        assert small["max_parallel_workers_per_gather"] == "1"
+
+        big = tuned_settings(8 * GiB, 4.5, connections=140)
+        assert big["shared_buffers"] == "2048MB"
+        assert big["maintenance_work_mem"] == "512MB"
+        assert big["max_connections"] == "150"
+        assert big["max_parallel_workers"] == "5"
+        assert int(big["work_mem"].removesuffix("MB")) > 4
+
+
+class TestPostgresTuner:
+    def test_restarts_only_when_needed(self, caplog):
+        server = FakeServer()
+        with caplog.at_level(logging.INFO, logger="gc_stack_deploy.postgres_tuning"):
+            effective = tune(server, {"shared_buffers": "1024MB", "work_mem": "16MB"})
+        assert effective == {"shared_buffers": "1024MB", "work_mem": "16MB"}
+        assert server.restarts == 1
+        assert "Restarting Postgres to change shared_buffers" in caplog.text
+
+        # Re-running is safe: nothing to restart for.
+        tune(server, {"shared_buffers": "1024MB", "work_mem": "16MB"})
+        assert server.restarts == 1
+        # A reloadable setting never needs a restart.
+        effective = tune(server, {"shared_buffers": "1024MB", "work_mem": "32MB"})
+        assert effective["work_mem"] == "32MB"
+        assert server.restarts == 1
+
+    def test_restart_is_probed_outside_the_pool(self):
+        server = FakeServer()
+        pool = FakePool(server)
+        PostgresTuner(pool, PG, server.restart, timeout=5).apply({"shared_buffers": "1024MB"})
+        assert pool.dedicated_connections >= 1
+        assert pool.closes == 1  # once the restart is seen, not per poll
+
+    def test_setting_still_waiting_for_a_restart_gets_one(self):
+        server = FakeServer()
+        server.auto_conf["max_connections"] = "150"  # written, but never restarted for
+        tune(server, {"max_connections": "150"})
+        assert server.restarts == 1
+        assert server.running["max_connections"] == "150"
+
+
+class TestPostgresApp:
+    def test_tuning_follows_the_plan(self):
+        ctx = make_ctx()
+        ctx.resource_budget = ResourceBudget(memory=6 * GiB, cpus=2)
+        specs = [
+            PostgresApp({"user": "postgres", "pass": "pw"}, ctx),
+            WindmillApp(
+                {"server_database_connections": 40, "worker_database_connections": 20}, ctx
+            ),
+            SupersetApp({}, ctx),
+            GCExplorerApp({}, ctx),
+        ]
+        ctx.resources = ctx.resource_budget.allocate(specs)
+        settings = specs[0].tuning()
+        assert settings["max_connections"] == "140"  # 80 + 35 + 10, and 10 for admin
+        memory = ctx.resources.allocation("postgres").memory_limit
+        assert settings["shared_buffers"] == f"{memory // 4 // 2**20}MB"
+
+    def test_untuned_without_a_plan(self):
+        ctx = make_ctx()
+        assert PostgresApp({"user": "postgres", "pass": "pw"}, ctx).tuning() is None
+
+    def test_force_restart_bumps_the_counter(self):
+        suo = force_restart(force_restart("TaskTemplate: {Resources: {}}\n"))
+        assert YAML().load(suo)["TaskTemplate"]["ForceUpdate"] == 2
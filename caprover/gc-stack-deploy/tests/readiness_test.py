@@ -0,0 +1,83 @@
+import http.server
+import socket
+import threading
+
+import pytest
+from gc_stack_deploy.readiness import (
+    Backoff,
+    ReadinessCancelled,
+    ReadinessTimeout,
+    http_responds,
+    tcp_port_open,
+    wait_until,
+)
+
+FAST = Backoff(initial=0.001, maximum=0.01)
+
+
+class TestBackoff:
+    def test_delays_grow_but_stay_capped(self):
+        delays = Backoff(initial=1, factor=2, maximum=4).delays()
+        ceilings = [1, 2, 4, 4, 4]
+        for ceiling in ceilings:
+            assert 0 <= next(delays) <= ceiling
+
+    def test_equal_jitter_keeps_half_the_ceiling(self):
+        delays = Backoff(initial=30, maximum=300, equal_jitter=True).delays()
+        for ceiling in [30, 60, 120, 240, 300, 300]:
+            assert ceiling / 2 <= next(delays) <= ceiling
+
+
+class TestWaitUntil:
+    def test_returns_first_truthy_result(self):
+        results = iter([None, False, "ready"])
+        value = wait_until(
+            lambda: next(results), description="thing", timeout=5, backoff=FAST
+        )
+        assert value == "ready"
+
+    def test_timeout_chains_last_error(self):
+        def check():
+            raise ConnectionRefusedError("nope")
+
+        with pytest.raises(ReadinessTimeout) as excinfo:
+            wait_until(check, description="thing", timeout=0.05, backoff=FAST)
+        assert isinstance(excinfo.value.__cause__, ConnectionRefusedError)
+
+    def test_cancel_stops_waiting(self):
+        cancel = threading.Event()
+        cancel.set()
+        with pytest.raises(ReadinessCancelled):
+            wait_until(lambda: False, description="thing", timeout=60, cancel=cancel)
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(int(self.path.strip("/")))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def http_server():
+    server = http.server.HTTPServer(("127.0.0.1", 0), StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestChecks:
+    def test_tcp_port_open(self):
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            port = listener.getsockname()[1]
+            assert tcp_port_open("127.0.0.1", port)
+        assert not tcp_port_open("127.0.0.1", port)
+
+    @pytest.mark.parametrize("status,ready", [(200, True), (404, True), (502, False)])
+    def test_http_responds(self, http_server, status, ready):
+        assert http_responds(f"{http_server}/{status}") is ready
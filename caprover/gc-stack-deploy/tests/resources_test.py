@@ -0,0 +1,105 @@
+import logging
+
+import pytest
+from fake_caprover import fake_ctx, make_ctx
+from gc_stack_deploy.apps_registry import configured_apps
+from gc_stack_deploy.resources import GiB, MiB, Allocation, ResourceBudget, parse_bytes
+from ruamel.yaml import YAML
+
+STACK = {
+    "postgres": {"user": "postgres", "pass": "pw"},
+    "windmill-only": {"app_name": "windmill"},
+    "redis": {},
+    "comapeo-cloud": {"app_name": "comapeo"},
+}
+
+
+def budget(**resources):
+    return ResourceBudget.from_config(
+        {"resources": {"memory": "8GiB", "cpus": 4, **resources}}, detect_host=False
+    )
+
+
+class TestResourceBudget:
+    def test_parse_bytes(self):
+        assert parse_bytes("512MiB") == 512 * MiB
+        assert parse_bytes("8G") == 8 * 1000**3
+        assert parse_bytes(1024) == 1024
+        with pytest.raises(ValueError, match="Not a size"):
+            parse_bytes("lots")
+
+    def test_config_leaves_room_for_the_system(self):
+        b = budget(reservedMemory="2GiB", weights={"windmill-only": 2})
+        assert (b.memory, b.cpus) == (6 * GiB, 3.5)
+        assert b.weights == {"windmill-only": 2.0}
+
+    def test_nothing_to_go_on(self):
+        assert ResourceBudget.from_config({}, detect_host=False) is None
+        with pytest.raises(ValueError, match="leaves nothing"):
+            budget(reservedMemory="8GiB")
+
+    def test_shares_follow_the_profiles(self):
+        ctx = make_ctx()
+        ctx.resource_budget = budget()
+        configured_apps(STACK, ctx)
+        allocations = ctx.resources.allocations
+        assert list(allocations) == [
+            "postgres",
+            "windmill",
+            "windmill-worker",
+            "windmill-worker-native",
+            "redis",
+            "comapeo",
+        ]
+        reserved = sum(a.memory_reservation for a in allocations.values())
+        assert 7 * GiB - len(allocations) * MiB <= reserved <= 7 * GiB
+        cpus = sum(a.cpu_reservation for a in allocations.values())
+        assert cpus == pytest.approx(3.5, abs=0.01)
+        assert allocations["windmill-worker"].memory_reservation == pytest.approx(
+            2 * allocations["windmill"].memory_reservation, abs=MiB
+        )
+        for a in allocations.values():
+            assert a.memory_reservation < a.memory_limit <= 7 * GiB
+            assert a.cpu_reservation < a.cpu_limit <= 3.5
+
+    def test_tiny_budget_warns(self, caplog):
+        ctx = make_ctx()
+        ctx.resource_budget = budget(memory="1.5GiB", reservedMemory="1GiB")
+        with caplog.at_level(logging.WARNING):
+            configured_apps(STACK, ctx)
+        assert "too small" in caplog.text
+
+
+class TestResourceLimits:
+    def test_allocation_is_written_as_limits_and_reservations(self):
+        suo = Allocation(512 * MiB, 768 * MiB, 0.5, 1.5).transform()("")
+        assert YAML().load(suo) == {
+            "TaskTemplate": {
+                "Resources": {
+                    "Limits": {"MemoryBytes": 768 * MiB, "NanoCPUs": 1_500_000_000},
+                    "Reservations": {"MemoryBytes": 512 * MiB, "NanoCPUs": 500_000_000},
+                }
+            }
+        }
+
+    def test_install_applies_the_plan(self, fake):
+        ctx = fake_ctx(fake)
+        ctx.resource_budget = budget()
+        (spec,) = configured_apps({"comapeo-cloud": {"app_name": "comapeo"}}, ctx)
+        spec.install()
+        suo = YAML().load(fake.apps["comapeo"]["serviceUpdateOverride"])
+        assert suo["TaskTemplate"]["Resources"]["Reservations"] == {
+            "MemoryBytes": 7 * GiB,
+            "NanoCPUs": 3_500_000_000,
+        }
+        assert spec.plan().empty
+
+    def test_table(self):
+        ctx = make_ctx()
+        ctx.resource_budget = budget()
+        configured_apps({"redis": {}}, ctx)
+        assert ctx.resources.lines() == [
+            "Resources: 7.0 GiB and 3.5 CPUs for 1 services (1.0 GiB and 0.5 CPUs kept back)",
+            "  service  memory reserved / limit  CPUs reserved / limit",
+            "  redis    7.0 GiB / 7.0 GiB        3.50 / 3.50",
+        ]
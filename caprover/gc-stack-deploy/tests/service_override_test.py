@@ -0,0 +1,57 @@
+from gc_stack_deploy.apps_registry import apply_memory_limit, disable_healthcheck
+from gc_stack_deploy.service_override import OverrideDocument, apply_overrides
+from ruamel.yaml import YAML
+
+
+def load_yaml(s):
+    return YAML().load(s)
+
+
+class TestOverrideDocument:
+    EXISTING = (
+        "TaskTemplate:\n"
+        "  ContainerSpec:\n"
+        "    Image: 'myimage'  # pinned\n"
+        "    Env:\n"
+        "    - A=1\n"
+    )
+
+    def test_round_trip_preserves_quotes_and_comments(self):
+        assert OverrideDocument.parse(self.EXISTING).dump() == self.EXISTING
+
+    def test_edits(self):
+        doc = OverrideDocument.parse(self.EXISTING)
+        doc.set("TaskTemplate.Resources.Limits.MemoryBytes", 1024)
+        doc.append("TaskTemplate.ContainerSpec.Env", "B=2")
+        doc.append(["TaskTemplate", "ContainerSpec", "Mounts"], {"Type": "tmpfs"})
+        doc.merge("TaskTemplate.Resources", {"Limits": {"NanoCPUs": 10**9}})
+        doc.delete("TaskTemplate.ContainerSpec.Image").delete("Missing.Key")
+        assert load_yaml(doc.dump()) == {
+            "TaskTemplate": {
+                "ContainerSpec": {
+                    "Env": ["A=1", "B=2"],
+                    "Mounts": [{"Type": "tmpfs"}],
+                },
+                "Resources": {"Limits": {"MemoryBytes": 1024, "NanoCPUs": 10**9}},
+            }
+        }
+
+    def test_get(self):
+        doc = OverrideDocument.parse(self.EXISTING)
+        assert doc.get("TaskTemplate.ContainerSpec.Image") == "myimage"
+        assert doc.get("TaskTemplate.Nope.Image", "default") == "default"
+
+
+class TestApplyOverrides:
+    def test_matches_applying_transforms_one_by_one(self):
+        existing = "TaskTemplate:\n  ContainerSpec:\n    Image: myimage\n"
+        assert apply_overrides(
+            existing, disable_healthcheck, apply_memory_limit
+        ) == apply_memory_limit(disable_healthcheck(existing))
+
+    def test_plain_string_transforms_still_work(self):
+        result = apply_overrides(
+            None, apply_memory_limit, lambda suo: suo + "Labels:\n  a: b\n"
+        )
+        assert load_yaml(result)["Labels"] == {"a": "b"}
+        assert load_yaml(result)["TaskTemplate"]["Resources"]["Limits"]
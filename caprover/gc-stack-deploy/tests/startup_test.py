@@ -0,0 +1,80 @@
+"""Startup cost of each entry path, measured with `python -X importtime`.
+
+Every path runs in a fresh interpreter. Its cost is the import time of the
+modules it loads beyond what a bare interpreter loads anyway. Budgets are
+generous (several times what a laptop measures) so that only real
+regressions fail: a heavy module imported at the top of stack_deploy.py
+again, for instance.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ("textual", "caprover_api", "requests", "psycopg", "bcrypt", "ruamel")
+
+
+def imported(code: str, *argv: str, cwd=None) -> dict[str, int]:
+    """Module -> cumulative import time (µs) of modules imported at top level."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *argv],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):  # nested imports are in their parent's total
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def startup_cost(code: str, *argv: str, cwd=None) -> tuple[float, set[str]]:
+    """(milliseconds spent importing beyond a bare interpreter, every module loaded)."""
+    baseline = imported("pass")
+    modules = imported(code, *argv, cwd=cwd)
+    extra = sum(us for name, us in modules.items() if name not in baseline)
+    check = "import sys\n" + code + "\nprint('\\n'.join(sys.modules), file=sys.stderr)"
+    proc = subprocess.run(
+        [sys.executable, "-c", check, *argv], capture_output=True, text=True, cwd=cwd
+    )
+    return extra / 1000, set(proc.stderr.split())
+
+
+def run_cli(*argv: str) -> str:
+    return (
+        "import sys\n"
+        "from gc_stack_deploy import stack_deploy\n"
+        f"sys.argv = ['gc-stack-deploy', *{list(argv)!r}]\n"
+        "try:\n"
+        "    stack_deploy.main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    )
+
+
+def heavy(loaded: set[str]) -> list[str]:
+    return sorted(m for m in loaded if m.split(".")[0] in HEAVY)
+
+
+class TestStartup:
+    @pytest.mark.parametrize(
+        "argv", [("--help",), ("init", "-c", "stack.yaml")], ids=["help", "init"]
+    )
+    def test_cli_paths_skip_heavy_imports(self, argv, tmp_path):
+        cost, loaded = startup_cost(run_cli(*argv), cwd=tmp_path)
+        assert heavy(loaded) == []
+        assert cost < 150, f"{' '.join(argv)} spent {cost:.0f} ms importing"
+
+    def test_headless_path_never_loads_textual(self):
+        # Everything a headless run imports before it talks to CapRover.
+        code = (
+            "from gc_stack_deploy import stack_deploy, deployment, headless, apps_registry"
+        )
+        cost, loaded = startup_cost(code)
+        assert not [m for m in loaded if m.split(".")[0] == "textual"]
+        assert cost < 1500, f"the headless path spent {cost:.0f} ms importing"
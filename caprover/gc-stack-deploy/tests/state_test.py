@@ -0,0 +1,102 @@
+import json
+
+from fake_caprover import make_ctx
+from gc_stack_deploy.base import AppSpec, AppStatus, probe_statuses
+from gc_stack_deploy.orchestrator import run_deploy
+from gc_stack_deploy.state import DeployState, state_path_for
+
+class FakeCaprover:
+    def __init__(self, *names, override=""):
+        self.definitions = {
+            name: {"appName": name, "serviceUpdateOverride": override} for name in names
+        }
+
+    def list_apps(self):
+        return {"status": 100, "data": {"appDefinitions": list(self.definitions.values())}}
+
+
+class RedisLike(AppSpec):
+    one_click_app_name = "redis"
+    image_variable = "$$cap_image"
+    service_suffixes = ("", "-worker")
+
+    def app_variables(self):
+        return {f"$$cap_{k}": v for k, v in self.app_cfg.items()}
+
+    def docker_image(self):
+        return self.app_variables().get(self.image_variable, "redis:7")
+
+    def _install(self):
+        pass
+
+
+def status(cap, spec, state):
+    return probe_statuses(cap, [spec], state)["redis"]
+
+
+class TestStatePath:
+    def test_beside_the_config(self):
+        assert str(state_path_for("ops/stack.yaml")) == "ops/stack.state.json"
+        assert str(state_path_for("ops/fleet.yaml", "springfield")) == (
+            "ops/fleet.springfield.state.json"
+        )
+        assert str(state_path_for("ops/fleet.yaml", "v1.2")) == "ops/fleet.v1.2.state.json"
+
+
+class TestDeployState:
+    def test_install_is_recorded_and_unchanged_config_is_left_alone(self, tmp_path):
+        path = tmp_path / "stack.state.json"
+        cap = FakeCaprover("redis", "redis-worker")
+        spec = RedisLike({"password": "s3cret"}, make_ctx(cap, state=DeployState(path)))
+        run_deploy([], [spec], lambda *_: None, max_workers=1, ctx=spec.ctx)
+
+        stored = json.loads(path.read_text())["apps"]["redis"]
+        assert stored["image"] == "redis:7"
+        assert stored["installed_at"]
+        assert "s3cret" not in path.read_text()
+
+        # A fresh launch reads the file back.
+        assert status(cap, spec, DeployState(path)).status is AppStatus.INSTALLED
+
+    def test_changed_variables_image_or_override_are_reported(self, tmp_path):
+        path = tmp_path / "stack.state.json"
+        cap = FakeCaprover("redis", "redis-worker")
+        ctx = make_ctx(cap, state=DeployState(path))
+        DeployState(path).record_install(
+            RedisLike({"password": "a"}, ctx), cap.definitions
+        )
+
+        changed = RedisLike({"password": "b", "image": "redis:8"}, ctx)
+        info = status(cap, changed, DeployState(path))
+        assert info.status is AppStatus.CONFIG_CHANGED
+        assert info.changed == ("variables", "image")
+
+        cap.definitions["redis-worker"]["serviceUpdateOverride"] = "TaskTemplate: {}"
+        info = status(cap, RedisLike({"password": "a"}, ctx), DeployState(path))
+        assert info.changed == ("serviceUpdateOverride",)
+
+    def test_unrecorded_app_is_adopted(self, tmp_path):
+        path = tmp_path / "stack.state.json"
+        cap = FakeCaprover("redis", "redis-worker")
+        spec = RedisLike({"password": "a"}, make_ctx(cap))
+        assert status(cap, spec, DeployState(path)).status is AppStatus.INSTALLED
+        assert DeployState(path).get("redis").installed_at is None
+
+    def test_uninstall_forgets_and_dry_run_never_writes(self, tmp_path):
+        path = tmp_path / "stack.state.json"
+        cap = FakeCaprover()
+        cap.delete_app_matching_pattern = lambda *a, **kw: None
+        spec = RedisLike({}, make_ctx(cap, state=DeployState(path)))
+        spec.ctx.state.record_install(spec, {})
+        run_deploy([spec], [], lambda *_: None, max_workers=1, ctx=spec.ctx)
+        assert DeployState(path).get("redis") is None
+
+        dry_state = DeployState(tmp_path / "dry.json", persist=False)
+        dry = RedisLike({}, make_ctx(cap, state=dry_state))
+        dry.ctx.state.record_install(dry, {})
+        assert not (tmp_path / "dry.json").exists()
+
+    def test_unreadable_file_is_ignored(self, tmp_path):
+        path = tmp_path / "stack.state.json"
+        path.write_text("{not json")
+        assert DeployState(path).get("redis") is None
@@ -0,0 +1,133 @@
+import contextvars
+import functools
+import json
+import threading
+
+import pytest
+
+from gc_stack_deploy import tracing
+from gc_stack_deploy.tracing import TracedCaprover, Tracer
+
+
+class TestSpans:
+    def test_noop_without_active_tracer(self):
+        with tracing.span("anything", app="x"):
+            pass  # nothing to record into, and nothing raised
+
+    def test_nested_spans_inherit_app(self):
+        tracer = Tracer()
+        with tracing.activate(tracer):
+            with tracing.span("install", "app", app="windmill"):
+                with tracing.span("caprover.update_app", "caprover", service="windmill"):
+                    pass
+        inner, outer = tracer.spans
+        assert inner.app == "windmill"
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id is None
+        assert outer.duration >= inner.duration
+
+    def test_threads_record_only_with_the_callers_context(self):
+        tracer = Tracer()
+
+        def pull():
+            with tracing.span("docker.pull", "docker"):
+                pass
+
+        with tracing.activate(tracer), tracing.span("install", "app", app="superset"):
+            for target in (pull, functools.partial(contextvars.copy_context().run, pull)):
+                thread = threading.Thread(target=target)
+                thread.start()
+                thread.join()
+        (pulled,) = [s for s in tracer.spans if s.name == "docker.pull"]
+        assert pulled.app == "superset"
+
+    def test_concurrent_tracers_stay_separate(self):
+        tracers = {"a": Tracer(), "b": Tracer()}
+        barrier = threading.Barrier(2)
+
+        def run(name):
+            with tracing.activate(tracers[name]):
+                barrier.wait()
+                with tracing.span("install", "app", app=name):
+                    barrier.wait()
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in tracers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [[s.app for s in t.spans] for t in tracers.values()] == [["a"], ["b"]]
+
+    def test_error_is_recorded_and_reraised(self):
+        tracer = Tracer()
+        with tracing.activate(tracer), pytest.raises(RuntimeError):
+            with tracing.span("install", "app", app="redis"):
+                raise RuntimeError("boom")
+        assert tracer.spans[0].args["error"] == "RuntimeError: boom"
+
+
+class TestExport:
+    def make_tracer(self):
+        tracer = Tracer()
+        with tracing.activate(tracer):
+            with tracing.span("install", "app", app="windmill"):
+                for _ in range(2):
+                    with tracing.span("caprover.update_app", "caprover"):
+                        pass
+                with tracing.span("wait", "wait"):
+                    with tracing.span("docker.service", "docker"):
+                        pass
+            with pytest.raises(KeyError), tracing.span("install", "app", app="redis"):
+                with tracing.span("caprover.deploy_app", "caprover"):
+                    raise KeyError("x")
+        return tracer
+
+    def test_chrome_trace(self, tmp_path):
+        path = self.make_tracer().write(tmp_path / "traces" / "run.json")
+        trace = json.loads(path.read_text())
+        complete = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+        assert len(complete) == 7
+        assert all({"name", "cat", "ts", "dur", "pid", "tid"} <= e.keys() for e in complete)
+        assert [e["ts"] for e in complete] == sorted(e["ts"] for e in complete)
+        names = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+        assert names == [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": complete[0]["pid"],
+                "tid": 1,
+                "args": {"name": threading.current_thread().name},
+            }
+        ]
+
+    def test_summary_counts_direct_children_only(self):
+        windmill, redis = self.make_tracer().summary()
+        assert windmill.startswith("windmill install: ")
+        assert "caprover.update_app" in windmill and "(x2)" in windmill
+        assert "wait" in windmill and "docker.service" not in windmill
+        assert redis.startswith("redis install FAILED: ")
+
+
+class TestTracedCaprover:
+    class Client:
+        root_domain = "example.org"
+
+        def update_app(self, app_name, **kwargs):
+            return {"updated": app_name}
+
+        def deploy_one_click_app(self, one_click_app_name, app_name, **kwargs):
+            return one_click_app_name
+
+    def test_calls_become_spans_tagged_with_service(self):
+        tracer = Tracer()
+        client = TracedCaprover(self.Client())
+        with tracing.activate(tracer):
+            assert client.update_app("windmill", instanceCount=1) == {"updated": "windmill"}
+            client.deploy_one_click_app("postgres", "postgres")
+            client.deploy_one_click_app("redis", app_name="cache")
+        assert client.root_domain == "example.org"
+        assert [(s.name, s.category, s.args["service"]) for s in tracer.spans] == [
+            ("caprover.update_app", "caprover", "windmill"),
+            ("caprover.deploy_one_click_app", "caprover", "postgres"),
+            ("caprover.deploy_one_click_app", "caprover", "cache"),
+        ]
@@ -0,0 +1,120 @@
+import copy
+
+import pytest
+from fake_caprover import fake_ctx, make_ctx
+from gc_stack_deploy.apps_registry import WindmillApp, configured_apps
+from gc_stack_deploy.resources import GiB, ResourceBudget
+from gc_stack_deploy.state import DeployState
+from ruamel.yaml import YAML
+
+WORKERS = {
+    "default": {"replicas": 2},
+    "reports": {"memory": "2GiB", "database_connections": 3},
+}
+
+
+def windmill(fake, workers, state=None):
+    ctx = fake_ctx(fake, use_ssl=False, state=state)
+    return WindmillApp({"app_name": "windmill", "workers": workers}, ctx)
+
+
+def installed(fake, workers, state):
+    spec = windmill(fake, workers, state)
+    spec._install()
+    state.record_install(spec, fake.apps)
+    return spec
+
+
+def env(app):
+    return {e["key"]: str(e["value"]) for e in app["envVars"]}
+
+
+class TestWorkerGroups:
+    def test_config(self):
+        ctx = make_ctx()
+        spec = WindmillApp({"worker_database_connections": 4, "workers": WORKERS}, ctx)
+        groups = {g.name: g for g in spec.worker_groups}
+        assert list(groups) == ["default", "native", "reports"]
+        assert groups["default"].replicas == 2
+        assert groups["native"].database_connections == 4
+        assert groups["reports"].suffix == "-worker-reports"
+        assert groups["reports"].memory == 2 * GiB
+        assert spec.postgres_connections() == 5 + 2 * 4 + 4 + 3
+        assert "$$cap_workers" not in spec.app_variables()
+
+    def test_invalid_config(self):
+        with pytest.raises(ValueError, match="not a valid worker group name"):
+            WindmillApp({"workers": {"Big Jobs": {}}}, None).worker_groups
+        with pytest.raises(ValueError, match="replicas must be a whole number"):
+            WindmillApp({"workers": {"default": {"replicas": "lots"}}}, None).worker_groups
+
+    def test_groups_split_the_workers_share(self):
+        ctx = make_ctx()
+        ctx.resource_budget = ResourceBudget(memory=8 * GiB, cpus=4)
+        configured_apps({"windmill-only": {"app_name": "windmill"}}, ctx)
+        before = ctx.resources.allocations
+
+        configured_apps({"windmill-only": {"app_name": "windmill", "workers": WORKERS}}, ctx)
+        after = ctx.resources.allocations
+        assert after["windmill"] == before["windmill"]
+        worker = after["windmill-worker"]
+        assert worker.instances == 2
+        assert worker.memory_reservation == pytest.approx(
+            after["windmill-worker-reports"].memory_reservation / 2, abs=2**20
+        )
+        reserved = sum(a.memory_reservation * a.instances for a in after.values())
+        assert reserved == pytest.approx(8 * GiB, abs=4 * 2**20)
+        assert "  windmill-worker x2" in "\n".join(ctx.resources.lines())
+
+
+class TestScaling:
+    def test_install_deploys_every_group(self, fake):
+        spec = windmill(fake, WORKERS)
+        spec._install()
+        assert fake.apps["windmill-worker"]["instanceCount"] == 2
+        reports = fake.apps["windmill-worker-reports"]
+        assert env(reports)["WORKER_GROUP"] == "reports"
+        assert env(reports)["DATABASE_CONNECTIONS"] == "3"
+        suo = YAML().load(reports["serviceUpdateOverride"])
+        assert suo["TaskTemplate"]["Resources"]["Limits"]["MemoryBytes"] == 2 * GiB
+        assert spec.plan().empty
+
+    def test_update_scales_without_touching_the_server(self, fake, tmp_path):
+        state = DeployState(tmp_path / "stack.state.json")
+        installed(fake, WORKERS, state)
+        server = copy.deepcopy(fake.apps["windmill"])
+
+        spec = windmill(fake, {"default": {"replicas": 3}, "ai": {"replicas": 2}}, state)
+        plan = spec.plan()
+        assert plan.lines() == [
+            "windmill-worker-ai: added",
+            "windmill-worker-reports: removed",
+            "windmill-worker: instanceCount: 2 -> 3",
+            "windmill-worker-ai: instanceCount: 1 -> 2",
+            "windmill-worker-ai: serviceUpdateOverride changed",  # its memory limit
+        ]
+
+        plan.apply(spec.ctx.caprover, timeout=30)
+        assert fake.apps["windmill"] == server
+        assert "windmill-worker-reports" not in fake.apps
+        assert fake.apps["windmill-worker"]["instanceCount"] == 3
+        assert fake.apps["windmill-worker-ai"]["instanceCount"] == 2
+        assert env(fake.apps["windmill-worker-ai"])["WORKER_GROUP"] == "ai"
+        assert spec.plan().empty
+
+    def test_only_recorded_groups_are_removed(self, fake, tmp_path):
+        state = DeployState(tmp_path / "stack.state.json")
+        spec = installed(fake, WORKERS, state)
+        assert "windmill-worker-reports" in state.get("windmill-only").services
+        # Not ours, for all that it looks like a worker group.
+        spec.ctx.caprover.create_app("windmill-worker-legacy")
+
+        spec = windmill(fake, {}, state)
+        plan = spec.plan()
+        assert plan.removed == ["windmill-worker-reports"]
+        plan.apply(spec.ctx.caprover, timeout=30)
+        assert "windmill-worker-legacy" in fake.apps
+
+    def test_nothing_is_removed_without_a_deploy_state(self, fake):
+        windmill(fake, WORKERS)._install()
+        assert windmill(fake, {}).plan().removed == []
@@ -25,9 +25,12 @@ echo "Cloning official CapRover one-click-apps repository..."
 git clone --depth 1 https://github.com/caprover/one-click-apps.git "$TEMP_DIR"
 
 echo "Injecting custom apps..."
+# PgBouncer has no logo of its own but PostgreSQL's, which the official repo ships.
+cp "$TEMP_DIR/public/v4/logos/postgres.png" "$TEMP_DIR/pgbouncer.png"
 rm -rf "$TEMP_DIR/public"
 mkdir -p "$TEMP_DIR/public"
 cp -R "$CUSTOM_APPS_DIR" "$TEMP_DIR/public/"
+cp "$TEMP_DIR/pgbouncer.png" "$TEMP_DIR/public/v4/logos/pgbouncer.png"
 # The CNAME is for GitHub pages
 echo "conservationmetrics.github.io/gc-deploy/one-click-apps" > "$TEMP_DIR/public/CNAME"
 